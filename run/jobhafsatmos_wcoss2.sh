@@ -33,6 +33,7 @@ fhhhAll=$(seq -f "f%03g" 0 3 126)
 
 export HOMEgraph=${HOMEgraph:-/mnt/lfs5/HFIP/hwrfv3/${USER}/hafs_graphics}
 export USHgraph=${USHgraph:-${HOMEgraph}/ush}
+export PYTHONPATH=${USHgraph}/python${PYTHONPATH:+:${PYTHONPATH}}
 export DRIVERSH=${USHgraph}/driverAtmos.sh
 
 export COMhafs=${COMhafs:-/hafs/com/${YMDH}/${STORMID}}
@@ -40,7 +41,7 @@ export WORKgraph=${WORKgraph:-${COMhafs}/../../../${YMDH}/${STORMID}/emc_graphic
 export COMgraph=${COMgraph:-${COMhafs}/emc_graphics}
 
 source ${USHgraph}/graph_pre_job.sh.inc
-export machine=${WHERE_AM_I:-wcoss2} # platforms: wcoss2, hera, orion, jet
+export machine=${WHERE_AM_I:-wcoss2} # platforms: wcoss2, hera, orion, jet, local (workstation)
 if [ ${machine} = jet ]; then
   export cartopyDataDir=${cartopyDataDir:-/mnt/lfs5/HFIP/hwrfv3/local/share/cartopy}
 elif [ ${machine} = hera ]; then
@@ -58,149 +59,15 @@ source ${USHgraph}/graph_runcmd.sh.inc
 mkdir -p ${WORKgraph}
 cd ${WORKgraph}
 
-#Generate the cmdfile
+# Generate the cmdfile from the product registry (parm/graph_products.yml)
 cmdfile="cmdfile.$STORM$STORMID.$YMDH"
-rm -f $cmdfile
-touch $cmdfile
-
-for fhhh in ${fhhhAll}; do
-
-for stormDomain in parent storm; do
-
-if [ ${stormDomain} = "parent" ]; then
-  figScriptAll=( \
-    plot_mslp_wind10m.py \
-    plot_tsfc_mslp_wind10m.py \
-    plot_t2m_mslp_wind10m.py \
-    plot_heatflux_wind10m.py \
-    plot_shtflux_wind10m.py \
-    plot_lhtflux_wind10m.py \
-    plot_precip_mslp_thk.py \
-    plot_reflectivity.py \
-    plot_goes_ir13.py \
-    plot_goes_wv9.py \
-    plot_ssmisf17_mw37ghz.py \
-    plot_ssmisf17_mw91ghz.py \
-    plot_850mb_200mb_vws.py \
-    plot_rhmidlev_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_streamline_wind.py \
-    )
-  levAll=( \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    )
-elif [ ${stormDomain} = "storm" ]; then
-  figScriptAll=( \
-    plot_mslp_wind10m.py \
-    plot_tsfc_mslp_wind10m.py \
-    plot_t2m_mslp_wind10m.py \
-    plot_heatflux_wind10m.py \
-    plot_shtflux_wind10m.py \
-    plot_lhtflux_wind10m.py \
-    plot_precip_mslp_thk.py \
-    plot_reflectivity.py \
-    plot_goes_ir13.py \
-    plot_goes_wv9.py \
-    plot_ssmisf17_mw37ghz.py \
-    plot_ssmisf17_mw91ghz.py \
-    plot_rhmidlev_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_streamline_wind.py \
-    plot_tempanomaly_hgt_wind.py \
-    )
-  levAll=( \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    200 \
-    )
-fi
-nscripts=${#figScriptAll[*]}
-
-for((i=0;i<${nscripts};i++)); do
-  echo ${figScriptAll[$i]} ${levAll[$i]}
-# echo "${APRUNS} ${DRIVERSH} $stormModel $STORM $STORMID $YMDH $stormDomain ${figScriptAll[$i]} ${levAll[$i]} $fhhh > ${WORKgraph}/$STORM$STORMID.$YMDH.${stormDomain}.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1 ${BACKGROUND}" >> $cmdfile
-  echo "time ${DRIVERSH} $stormModel $STORM $STORMID $YMDH $stormDomain ${figScriptAll[$i]} ${levAll[$i]} $fhhh > ${WORKgraph}/$STORM$STORMID.$YMDH.${stormDomain}.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1" >> $cmdfile
-done
-
-done
-
-done
+python3 -m hafsgraph.products cmdfile --stage atmos --model ${stormModel} --storm ${STORM} --stormid ${STORMID} --ymdh ${YMDH} --fhhh ${fhhhAll} > $cmdfile
 #==============================================================================
 
 chmod u+x ./$cmdfile
-if [ ${machine} = "wcoss2" ]; then
+if [[ ${APRUNF} = *hafsgraph.runcmd* ]]; then
+  ${APRUNF} ./$cmdfile
+elif [ ${machine} = "wcoss2" ]; then
   ncmd=$(cat ./$cmdfile | wc -l)
   ncmd_max=$((ncmd < TOTAL_TASKS ? ncmd : TOTAL_TASKS))
   $APRUNCFP -n $ncmd_max cfp ./$cmdfile
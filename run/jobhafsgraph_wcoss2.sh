@@ -11,9 +11,13 @@
 set -xe
 
 date
+# Start of the job, for the delivery times per priority tier (hafsgraph.manifest delivery)
+GRAPHstart=$(date +%s)
 
 cd $PBS_O_WORKDIR
 
+# Size select= and these for a cycle with, e.g. (nothing is rendered)
+# python3 -m hafsgraph.products plan --stage atcf atmos wave ocean --inventory --worker --per-node 60 --node-gb 720 --deadline 40
 export TOTAL_TASKS=${TOTAL_TASKS:-${SLURM_NTASKS:-240}}
 export NCTSK=${NCTSK:-60}
 export NCNODE=${NCNODE:-4}
@@ -24,10 +28,53 @@ export MPLBACKEND=agg
 plotATCF=${plotATCF:-yes}
 plotAtmos=${plotAtmos:-yes}
 plotOcean=${plotOcean:-yes}
+# Render all atmos products of one fhhh/domain in one python process (yes) or one process per figure (no)
+atmosWorker=${atmosWorker:-yes}
+# Record task wall times and bin-pack each cmdfile longest-first into TOTAL_TASKS lines, keeping the readers
+# of an input file on one line where that costs no time (yes), or keep registry order (no)
+scheduleLPT=${scheduleLPT:-yes}
+# With scheduleLPT, memory of the tasks running at the same time on one node, in GB: the tasks are placed on the
+# NCTSK ranks of each node so that the sum of their measured peak memory stays within it (mem=800G, less headroom)
+NODEmemGB=${NODEmemGB:-720}
+# Plot each forecast hour as soon as its output lands in COMhafs (yes), e.g. while the forecast runs
+watchGraph=${watchGraph:-no}
+# Reuse archived figures whose inputs, script and config are unchanged (yes) or replot everything (no)
+export skipCache=${skipCache:-yes}
+# Scan COMhafs and the track once and drop the tasks that cannot run (yes) or schedule every task (no)
+inventoryGraph=${inventoryGraph:-yes}
+# Leave out the tasks whose figures a previous run of this cycle delivered, from the same input files (yes),
+# e.g. after hitting the walltime, or run all tasks (no)
+resumeGraph=${resumeGraph:-yes}
+# Deliver a quick low-resolution preview of every figure first, then the full-quality figures (yes),
+# or only the full-quality figures (no)
+quickLookGraph=${quickLookGraph:-no}
+# Stage the input files once per node into node-local STAGEgraph, e.g. /dev/shm, for all the tasks of
+# the node to read (yes), or read them all from COMhafs (no)
+stageInputs=${stageInputs:-no}
+# Decode each GRIB2 field once per node in a field server sharing it with the tasks of the node (yes),
+# or decode the fields in each task (no)
+fieldServer=${fieldServer:-no}
+# Keep the decoded GRIB2 fields as .npy files in FIELDcache, mapped by later tasks and jobs instead of
+# decoded again, up to FIELDcacheGB (yes), or decode them in each task (no)
+fieldCache=${fieldCache:-no}
+# Log the output of all the tasks as records in one file per worker, tasklog.*.jsonl (yes, see
+# python3 -m hafsgraph.tasklog show|summary), or in one log file per task (no)
+export taskLog=${taskLog:-yes}
+# Deliver the figures in batches from a per-cycle outbox, moved atomically into the archive (yes),
+# or copy them to the archive in each task (no)
+export batchDelivery=${batchDelivery:-no}
+# With batchDelivery=yes, also bundle the figures of each cycle in one tar file with an index (yes)
+bundleGraph=${bundleGraph:-no}
+# Decode the next GRIB2 fields in a background thread while each figure is drawn, up to PREFETCHmb (yes),
+# or only when they are plotted (no)
+export prefetchFields=${prefetchFields:-yes}
 
 YMDH=${YMDH:-2022092000}
 STORM=${STORM:-FIONA}
 STORMID=${STORMID:-07L}
+# Several storms and cycles in one job, e.g. STORMS="FIONA:07L:2022092000 IAN:09L:2022092600":
+# their ATCF, atmos, wave and ocean tasks share one cmdfile and one allocation
+STORMS=${STORMS:-}
 stormModel=${stormModel:-HFSA}
 fhhhAll=$(seq -f "f%03g" 0 3 126)
 
@@ -71,6 +118,7 @@ fi
 
 export HOMEgraph=${HOMEgraph:-$(pwd)/../}
 export USHgraph=${USHgraph:-${HOMEgraph}/ush}
+export PYTHONPATH=${USHgraph}/python${PYTHONPATH:+:${PYTHONPATH}}
 export DRIVERATMOS=${USHgraph}/driverAtmos.sh
 export DRIVEROCEAN=${USHgraph}/driverOcean.sh
 
@@ -81,7 +129,7 @@ export COMgraph=${COMgraph:-/lfs/h2/emc/ptmp/${USER}/comgraph_${RUN,,}}
 atcfFile=${COMhafs}/${stormid}.${ymdh}.${stormModel,,}.trak.atcfunix
 
 source ${USHgraph}/graph_pre_job.sh.inc
-export machine=${WHERE_AM_I:-wcoss2} # platforms: wcoss2, hera, orion, jet
+export machine=${WHERE_AM_I:-wcoss2} # platforms: wcoss2, hera, orion, jet, local (workstation)
 if [ ${machine} = jet ]; then
   export ADECKgraph=${ADECKgraph:-/mnt/lfs5/HFIP/hwrf-data/hwrf-input/abdeck/aid}
   export BDECKgraph=${BDECKgraph:-/mnt/lfs5/HFIP/hwrf-data/hwrf-input/abdeck/btk}
@@ -146,6 +194,106 @@ archdir="${archbase}/RT${yyyy}_${BASIN}/${STORMNM}${STID}/${STORMNM}${STID}.${ym
 mkdir -p ${work_dir}
 cd ${work_dir}
 
+if [ ${stageInputs} = yes ]; then
+  export STAGEgraph=${STAGEgraph:-/dev/shm/hafsgraph.${PBS_JOBID:-$$}}
+fi
+# Grid coordinates, decoded once per grid definition for all the cycles (hafsgraph.grid)
+export GRIDcache=${GRIDcache:-${WORKgraph}/gridcache}
+# Decoded fields kept in each atmos worker process, in MB (hafsgraph.grib)
+export GRIBcacheMB=${GRIBcacheMB:-2048}
+if [ ${fieldCache} = yes ]; then
+  export FIELDcache=${FIELDcache:-${WORKgraph}/fieldcache}
+  export FIELDcacheGB=${FIELDcacheGB:-20}
+fi
+if [ ${fieldServer} = yes ]; then
+  export FIELDserver=${FIELDserver:-/dev/shm/hafsgraph.${PBS_JOBID:-$$}.fields}
+fi
+
+cmdfileOpt=""
+if [ ${scheduleLPT} = yes ]; then
+  cmdfileOpt="--record --slots ${TOTAL_TASKS} --affinity --per-node ${NCTSK} --node-gb ${NODEmemGB}"
+fi
+if [ ${inventoryGraph} = yes ]; then
+  cmdfileOpt="--inventory ${cmdfileOpt}"
+fi
+if [ ${resumeGraph} = yes ]; then
+  cmdfileOpt="--resume ${cmdfileOpt}"
+fi
+if [ ${quickLookGraph} = yes ]; then
+  cmdfileOpt="--quicklook ${cmdfileOpt}"
+fi
+
+# Move the finished figures to the archive every minute while the tasks run
+if [ ${batchDelivery} = yes ]; then
+  python3 -m hafsgraph.deliver run --every 60 &
+  deliverPid=$!
+fi
+
+#==============================================================================
+# For several storms and cycles at once
+
+if [ -n "${STORMS}" ]; then
+
+# plotATCF.sh gets these from the cmdfile lines
+export ADECKgraph BDECKgraph modelLabels modelColors modelMarkers modelMarkerSizes
+COMhafsTemplate=${COMhafsTemplate:-$(compath.py ${envir}/${NET}/${hafs_ver})/${RUN}.{ymd}/{hh}}
+workerOpt=""
+if [ ${atmosWorker} = yes ]; then
+  workerOpt="--worker"
+fi
+cmdfile="cmdfile_storms.$YMDH"
+python3 -m hafsgraph.products cmdfile --stage atcf atmos wave ocean --suite full --model ${stormModel} --storms ${STORMS} --com "${COMhafsTemplate}" --fhhh ${fhhhAll} --trackon yes --inventory ${workerOpt} ${cmdfileOpt} > $cmdfile
+
+chmod u+x ./$cmdfile
+if [ ! -s ./$cmdfile ]; then
+  echo "No runnable tasks in $cmdfile"
+elif [[ ${APRUNF} = *hafsgraph.runcmd* ]]; then
+  ${APRUNF} ./$cmdfile
+elif [ ${machine} = "wcoss2" ]; then
+  ncmd=$(cat ./$cmdfile | wc -l)
+  ncmd_max=$((ncmd < TOTAL_TASKS ? ncmd : TOTAL_TASKS))
+  $APRUNCFP -n $ncmd_max cfp ./$cmdfile
+else
+  ${APRUNC} ${MPISERIAL} -m ./$cmdfile
+fi
+plotATCF=no
+plotAtmos=no
+plotWave=no
+plotOcean=no
+watchGraph=no
+
+date
+
+fi # if [ -n "${STORMS}" ]; then
+
+#==============================================================================
+# Plot the atmos, wave and ocean figures while the forecast output lands.
+# The ATCF figures follow once the watcher has seen the final track.
+
+if [ ${watchGraph} = yes ]; then
+
+watchStages=""
+if [ ${plotAtmos} = yes ]; then watchStages="${watchStages} atmos"; fi
+if [ ${plotWave} = yes ]; then watchStages="${watchStages} wave"; fi
+if [ ${plotOcean} = yes ]; then watchStages="${watchStages} ocean"; fi
+workerOpt=""
+if [ ${atmosWorker} = yes ]; then
+  workerOpt="--worker"
+fi
+if [ ${quickLookGraph} = yes ]; then
+  workerOpt="${workerOpt} --quicklook"
+fi
+if [ -n "${watchStages}" ]; then
+  python3 -m hafsgraph.watch --stage ${watchStages} --suite full --model ${stormModel} --storm ${STORM} --stormid ${STORMID} --ymdh ${YMDH} --fhhh ${fhhhAll} --trackon yes ${workerOpt} --record --nproc ${NCTSK}
+fi
+plotAtmos=no
+plotWave=no
+plotOcean=no
+
+date
+
+fi # if [ ${watchGraph} = yes ]; then
+
 #==============================================================================
 # For the ATCF figures
 
@@ -172,189 +320,20 @@ fi
 
 if [ ${plotAtmos} = yes ]; then
 
-#Generate the cmdfile
+# Generate the cmdfile from the product registry (parm/graph_products.yml)
 cmdfile="cmdfile.$STORM$STORMID.$YMDH"
-rm -f $cmdfile
-touch $cmdfile
-
-for fhhh in ${fhhhAll}; do
-
-for stormDomain in parent storm; do
-
-if [ ${stormDomain} = "parent" ]; then
-  figScriptAll=( \
-    plot_mslp_wind10m.py \
-    plot_tsfc_mslp_wind10m.py \
-    plot_t2m_mslp_wind10m.py \
-    plot_heatflux_wind10m.py \
-    plot_shtflux_wind10m.py \
-    plot_lhtflux_wind10m.py \
-    plot_precip_mslp_thk.py \
-    plot_reflectivity.py \
-    plot_goes_ir13.py \
-    plot_goes_wv9.py \
-    plot_ssmisf17_mw37ghz.py \
-    plot_ssmisf17_mw91ghz.py \
-    plot_850mb_200mb_vws.py \
-    plot_rhmidlev_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_streamline_wind.py \
-    )
-  levAll=( \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    1003 \
-    1003 \
-    1003 \
-    )
-elif [ ${stormDomain} = "storm" ]; then
-  figScriptAll=( \
-    plot_mslp_wind10m.py \
-    plot_tsfc_mslp_wind10m.py \
-    plot_t2m_mslp_wind10m.py \
-    plot_heatflux_wind10m.py \
-    plot_shtflux_wind10m.py \
-    plot_lhtflux_wind10m.py \
-    plot_precip_mslp_thk.py \
-    plot_reflectivity.py \
-    plot_goes_ir13.py \
-    plot_goes_wv9.py \
-    plot_ssmisf17_mw37ghz.py \
-    plot_ssmisf17_mw91ghz.py \
-    plot_rhmidlev_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_temp_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_rh_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_vort_hgt_wind.py \
-    plot_streamline_wind.py \
-    plot_tempanomaly_hgt_wind.py \
-	plot_crs_sn_wind.py \
-    plot_crs_sn_rh_tempanomaly.py \
-    plot_crs_sn_reflectivity.py \
-	plot_crs_we_wind.py \
-    plot_crs_we_rh_tempanomaly.py \
-    plot_crs_we_reflectivity.py \
-    plot_azimuth_wind.py \
-    plot_azimuth_tempanomaly.py \
-    plot_azimuth_rh_q.py \
-    plot_azimuth_reflectivity.py \
-    )
-  levAll=( \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    700 \
-    500 \
-    200 \
-    850 \
-    200 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    1003 \
-    )
+workerOpt=""
+if [ ${atmosWorker} = yes ]; then
+  workerOpt="--worker"
 fi
-nscripts=${#figScriptAll[*]}
-
-for((i=0;i<${nscripts};i++)); do
-  echo ${figScriptAll[$i]} ${levAll[$i]}
-# echo "${APRUNS} ${DRIVERATMOS} $stormModel $STORM $STORMID $YMDH $stormDomain ${figScriptAll[$i]} ${levAll[$i]} $fhhh > ${WORKgraph}/$STORM$STORMID.$YMDH.${stormDomain}.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1 ${BACKGROUND}" >> $cmdfile
-  echo "time ${DRIVERATMOS} $stormModel $STORM $STORMID $YMDH $stormDomain ${figScriptAll[$i]} ${levAll[$i]} $fhhh > ${WORKgraph}/$STORM$STORMID.$YMDH.${stormDomain}.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1" >> $cmdfile
-done
-
-done
-
-done
-
-# For the atm swath figures
-fhhh=f126
-stormDomain=parent
-figScriptAll=( \
-  plot_precip_swath.py \
-  plot_wind_swath.py \
-  )
-levAll=( \
-  1003 \
-  1003 \
-  )
-nscripts=${#figScriptAll[*]}
-
-for((i=0;i<${nscripts};i++)); do
-  echo ${figScriptAll[$i]} ${levAll[$i]}
-  echo "time ${DRIVERATMOS} $stormModel $STORM $STORMID $YMDH $stormDomain ${figScriptAll[$i]} ${levAll[$i]} $fhhh > ${WORKgraph}/$STORM$STORMID.$YMDH.${stormDomain}.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1" >> $cmdfile
-done
+python3 -m hafsgraph.products cmdfile --stage atmos --suite full --model ${stormModel} --storm ${STORM} --stormid ${STORMID} --ymdh ${YMDH} --fhhh ${fhhhAll} ${workerOpt} ${cmdfileOpt} > $cmdfile
 
 chmod u+x ./$cmdfile
-if [ ${machine} = "wcoss2" ]; then
+if [ ! -s ./$cmdfile ]; then
+  echo "No runnable tasks in $cmdfile"
+elif [[ ${APRUNF} = *hafsgraph.runcmd* ]]; then
+  ${APRUNF} ./$cmdfile
+elif [ ${machine} = "wcoss2" ]; then
   ncmd=$(cat ./$cmdfile | wc -l)
   ncmd_max=$((ncmd < TOTAL_TASKS ? ncmd : TOTAL_TASKS))
   $APRUNCFP -n $ncmd_max cfp ./$cmdfile
@@ -371,51 +350,16 @@ fi # if [ ${plotAtmos} = yes ]; then
 
 if [ ${plotWave} = yes ]; then
 
-#Generate the cmdfile
+# Generate the cmdfile from the product registry (parm/graph_products.yml)
 cmdfile="cmdfile_wave.$STORM$STORMID.$YMDH"
-rm -f $cmdfile
-touch $cmdfile
-
-for fhhh in ${fhhhAll}; do
-
-for stormDomain in parent storm; do
-
-if [ ${stormDomain} = "parent" ]; then
-  figScriptAll=( \
-    plot_wave_hs.py \
-    plot_wave_tm.py \
-    plot_wave_tp.py \
-    )
-  levAll=( \
-    1003 \
-    1003 \
-    1003 \
-    )
-elif [ ${stormDomain} = "storm" ]; then
-  figScriptAll=( \
-    plot_wave_hs.py \
-    plot_wave_tm.py \
-    plot_wave_tp.py \
-    )
-  levAll=( \
-    1003 \
-    1003 \
-    1003 \
-    )
-fi
-nscripts=${#figScriptAll[*]}
-
-for((i=0;i<${nscripts};i++)); do
-  echo ${figScriptAll[$i]} ${levAll[$i]}
-  echo "time ${DRIVERATMOS} $stormModel $STORM $STORMID $YMDH $stormDomain ${figScriptAll[$i]} ${levAll[$i]} $fhhh > ${WORKgraph}/$STORM$STORMID.$YMDH.${stormDomain}.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1" >> $cmdfile
-done
-
-done
-
-done
+python3 -m hafsgraph.products cmdfile --stage wave --model ${stormModel} --storm ${STORM} --stormid ${STORMID} --ymdh ${YMDH} --fhhh ${fhhhAll} ${cmdfileOpt} > $cmdfile
 
 chmod u+x ./$cmdfile
-if [ ${machine} = "wcoss2" ]; then
+if [ ! -s ./$cmdfile ]; then
+  echo "No runnable tasks in $cmdfile"
+elif [[ ${APRUNF} = *hafsgraph.runcmd* ]]; then
+  ${APRUNF} ./$cmdfile
+elif [ ${machine} = "wcoss2" ]; then
   ncmd=$(cat ./$cmdfile | wc -l)
   ncmd_max=$((ncmd < TOTAL_TASKS ? ncmd : TOTAL_TASKS))
   $APRUNCFP -n $ncmd_max cfp ./$cmdfile
@@ -432,55 +376,17 @@ fi # if [ ${plotWave} = yes ]; then
 
 if [ ${plotOcean} = 'yes' ]; then
 
-#Generate the cmdfile
+# Generate the cmdfile from the product registry (parm/graph_products.yml)
 cmdfile="cmdfile_ocean.$STORM$STORMID.$YMDH"
-rm -f $cmdfile
-touch $cmdfile
-
-fhhhAll=$(seq -f "f%03g" 0 3 126)
-
-for fhhh in ${fhhhAll}; do
-
-figScriptAll=( \
-  plot_sst.py \
-  plot_sss.py \
-  plot_mld.py \
-  plot_ohc.py \
-  plot_z20.py \
-  plot_z26.py \
-  plot_storm_sst.py \
-  plot_storm_sss.py \
-  plot_storm_mld.py \
-  plot_storm_ohc.py \
-  plot_storm_z20.py \
-  plot_storm_z26.py \
-  plot_storm_tempz40m.py \
-  plot_storm_tempz70m.py \
-  plot_storm_tempz100m.py \
-  plot_storm_wvelz40m.py \
-  plot_storm_wvelz70m.py \
-  plot_storm_wvelz100m.py \
-  plot_storm_crs_sn_temp.py \
-  plot_storm_crs_trk_temp.py \
-  plot_storm_crs_we_temp.py \
-  )
-
-nscripts=${#figScriptAll[*]}
-
 trackOn=yes
-
-for((i=0;i<${nscripts};i++));
-do
-
-  echo ${figScriptAll[$i]}
-  echo "time ${DRIVEROCEAN} $stormModel $STORM $STORMID $YMDH $trackOn ${figScriptAll[$i]} ${fhhh} > ${WORKgraph}/$STORM$STORMID.$YMDH.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1" >> $cmdfile
-
-done
-
-done
+python3 -m hafsgraph.products cmdfile --stage ocean --model ${stormModel} --storm ${STORM} --stormid ${STORMID} --ymdh ${YMDH} --fhhh ${fhhhAll} --trackon ${trackOn} ${cmdfileOpt} > $cmdfile
 
 chmod u+x ./$cmdfile
-if [ ${machine} = "wcoss2" ]; then
+if [ ! -s ./$cmdfile ]; then
+  echo "No runnable tasks in $cmdfile"
+elif [[ ${APRUNF} = *hafsgraph.runcmd* ]]; then
+  ${APRUNF} ./$cmdfile
+elif [ ${machine} = "wcoss2" ]; then
   ncmd=$(cat ./$cmdfile | wc -l)
   ncmd_max=$((ncmd < TOTAL_TASKS ? ncmd : TOTAL_TASKS))
   $APRUNCFP -n $ncmd_max cfp ./$cmdfile
@@ -494,4 +400,46 @@ fi # if [ ${plotOcean} = yes ]; then
 
 #==============================================================================
 
+if [ ${scheduleLPT} = yes ]; then
+  python3 -m hafsgraph.history compact
+fi
+
+# Last delivery pass, after the figures of the last tasks
+if [ ${batchDelivery} = yes ]; then
+  kill -TERM ${deliverPid} 2>/dev/null
+  wait ${deliverPid}
+  if [ ${bundleGraph} = yes ]; then
+    python3 -m hafsgraph.deliver run --bundle
+  fi
+fi
+
+# Stop the field servers and remove the staged input files, on each node
+nodeCleanup=""
+if [ -n "${FIELDserver:-}" ]; then
+  nodeCleanup="python3 -m hafsgraph.fieldserver stop"
+fi
+if [ -n "${STAGEgraph:-}" ]; then
+  nodeCleanup="${nodeCleanup:+${nodeCleanup}; }python3 -m hafsgraph.stagein clean"
+fi
+if [ -n "${nodeCleanup}" ]; then
+  if [ ${machine} = "wcoss2" ]; then
+    $APRUNCFP -n ${NCNODE} --ppn 1 sh -c "${nodeCleanup}"
+  else
+    sh -c "${nodeCleanup}"
+  fi
+fi
+
+# Wall time and status of each task, failures first
+if [ ${taskLog} = yes ]; then
+  python3 -m hafsgraph.tasklog summary --top 20
+fi
+
+# Time to the first critical figure and the others, each storm cycle with
+# its COMhafs as in its cmdfile
+if [ -n "${STORMS}" ]; then
+  python3 -m hafsgraph.manifest delivery --since ${GRAPHstart} --model ${stormModel} --storms ${STORMS} --com "${COMhafsTemplate}"
+else
+  python3 -m hafsgraph.manifest delivery --since ${GRAPHstart} --model ${stormModel} --storm ${STORM} --stormid ${STORMID} --ymdh ${YMDH} --com ${COMhafs}
+fi
+
 echo 'job done'
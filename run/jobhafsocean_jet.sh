@@ -34,6 +34,7 @@ fhhhAll=$(seq -f "f%03g" 0 3 126)
 
 export HOMEgraph=${HOMEgraph:-/mnt/lfs5/HFIP/hwrfv3/${USER}/hafs_graphics}
 export USHgraph=${USHgraph:-${HOMEgraph}/ush}
+export PYTHONPATH=${USHgraph}/python${PYTHONPATH:+:${PYTHONPATH}}
 export DRIVERDOMAIN=${USHgraph}/driverDomain.sh
 export DRIVEROCEAN=${USHgraph}/driverOcean.sh
 
@@ -42,7 +43,7 @@ export WORKgraph=${WORKgraph:-${COMhafs}/../../../${YMDH}/${STORMID}/emc_graphic
 export COMgraph=${COMgraph:-${COMhafs}/emc_graphics}
 
 source ${USHgraph}/graph_pre_job.sh.inc
-export machine=${WHERE_AM_I:-jet} # platforms: wcoss2, hera, orion, jet
+export machine=${WHERE_AM_I:-jet} # platforms: wcoss2, hera, orion, jet, local (workstation)
 if [ ${machine} = jet ]; then
   export cartopyDataDir=${cartopyDataDir:-/mnt/lfs5/HFIP/hwrfv3/local/share/cartopy}
 elif [ ${machine} = hera ]; then
@@ -65,58 +66,17 @@ source ${USHgraph}/graph_runcmd.sh.inc
 mkdir -p ${WORKgraph}
 cd ${WORKgraph}
 
-#Generate the cmdfile
+# Generate the cmdfile from the product registry (parm/graph_products.yml)
 cmdfile="cmdfile_ocean.$STORM$STORMID.$YMDH"
-rm -f $cmdfile
-touch $cmdfile
-
-#==============================================================================
-# For the ocean figures
-#==============================================================================
-
-for fhhh in ${fhhhAll}; do
-
-figScriptAll=( \
-  plot_sst.py \
-  plot_sss.py \
-  plot_mld.py \
-  plot_ohc.py \
-  plot_z20.py \
-  plot_z26.py \
-  plot_storm_sst.py \
-  plot_storm_sss.py \
-  plot_storm_mld.py \
-  plot_storm_ohc.py \
-  plot_storm_z20.py \
-  plot_storm_z26.py \
-  plot_storm_tempz40m.py \
-  plot_storm_tempz70m.py \
-  plot_storm_tempz100m.py \
-  plot_storm_wvelz40m.py \
-  plot_storm_wvelz70m.py \
-  plot_storm_wvelz100m.py \
-  plot_storm_crs_sn_temp.py \
-  plot_storm_crs_trk_temp.py \
-  plot_storm_crs_we_temp.py \
-  )
-
-nscripts=${#figScriptAll[*]}
-
-for((i=0;i<${nscripts};i++));
-do
-
-  echo ${figScriptAll[$i]}
-# echo "${APRUNS} ${DRIVEROCEAN} $stormModel $STORM $STORMID $YMDH $trackOn ${figScriptAll[$i]} > ${WORKgraph}/$STORM$STORMID.$YMDH.${figScriptAll[$i]%.*}.log 2>&1 ${BACKGROUND}" >> $cmdfile
-   echo "time ${DRIVEROCEAN} $stormModel $STORM $STORMID $YMDH $TRACKON ${figScriptAll[$i]} $fhhh > ${WORKgraph}/$STORM$STORMID.$YMDH.${figScriptAll[$i]%.*}.${fhhh}.log 2>&1" >> $cmdfile
-
-done
-
-done
-
+python3 -m hafsgraph.products cmdfile --stage ocean --model ${stormModel} --storm ${STORM} --stormid ${STORMID} --ymdh ${YMDH} --fhhh ${fhhhAll} --trackon ${TRACKON} > $cmdfile
 #==============================================================================
 
 chmod u+x ./$cmdfile
-${APRUNC} ${MPISERIAL} -m ./$cmdfile
+if [[ ${APRUNF} = *hafsgraph.runcmd* ]]; then
+  ${APRUNF} ./$cmdfile
+else
+  ${APRUNC} ${MPISERIAL} -m ./$cmdfile
+fi
 
 date
 
@@ -7,9 +7,6 @@ if [ $# -lt 8 ]; then
   echo "./driverDomain.sh HAFS IDA 09L 2019082800 grid01 plot_reflectivity.py 1003 f036"
 fi
 
-# eparse function
-eparse() { set -eux; eval "set -eux; cat<<_EOF"$'\n'"$(< "$1")"$'\n'"_EOF"; }
-
 date
 
 stormModel=${1:-HAFS}
@@ -66,38 +63,32 @@ else
 fi
 BASIN2C=`echo ${basin2c} | tr '[a-z]' '[A-Z]'`
 
-work_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.${stormDomain}.${figName}_${standardLayer}_${fhhh}"
-
-rm -rf ${work_dir}
-mkdir -p ${work_dir}
-cd ${work_dir}
-
-cp -up ${HOMEgraph}/ush/python/atmos/plot_atmos.yml.tmp ${work_dir}/
-cp -up ${HOMEgraph}/ush/python/atmos/${figScript} ${work_dir}
-
-# Generate the yaml config file
-stormModel=${stormModel}; stormName=${STORMNAME}; stormID=${STORMID}
-stormBasin=${BASIN2C}; stormDomain=${stormDomain}
-ymdh=${startDate}; fhhh=${fhhh}
-standardLayer=${standardLayer}; cartopyDataDir=${cartopyDataDir}
-
-eparse plot_atmos.yml.tmp > plot_atmos.yml
-
-./${figScript}
-
-set +e
-
-# Use convert to reduce colors and thus file size
-#for file in $(/bin/ls -1 *.png); do convert ${file} PNG8:${file} done
-for file in $(/bin/ls -1 *.png); do
-  convert -dither FloydSteinberg -colors 256 ${file} ${file}
-done
-
-# Deliver figure to archive_dir
-mkdir -p ${archive_dir}
-cp -up ${work_dir}/${STORMNAME}${STORMID}.${startDate}.${STORMMODEL}.*${figName}*.png ${archive_dir}
-
-set -e
+# All tasks write their figures to one staging directory, the plotting script
+# runs in place and gets its config on the command line (hafsgraph.config)
+staging_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.staging"
+# Quick-look previews (hafsgraph.quicklook) are staged apart from the full-quality figures
+if [ "${quickLook:-no}" = yes ]; then
+  staging_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.quicklook"
+fi
+mkdir -p ${staging_dir}
+cd ${staging_dir}
+
+figConf="stormModel=${stormModel} stormName=${STORMNAME} stormID=${STORMID}"
+figConf="${figConf} stormBasin=${BASIN2C} stormDomain=${stormDomain}"
+figConf="${figConf} ymdh=${startDate} fhhh=${fhhh}"
+figConf="${figConf} standardLayer=${standardLayer} COMhafs=${COMhafs} cartopyDataDir=${cartopyDataDir}"
+
+# Skip the task when its archived figures are up to date, else run the
+# plotting script, writing 256-color PNGs with the hafsgraph.agg256 backend,
+# deliver the figures, a preview never replacing a figure of the archive, and
+# record them, all in one python process (hafsgraph.task)
+export PYTHONPATH=${HOMEgraph}/ush/python${PYTHONPATH:+:${PYTHONPATH}}
+taskArgs="--archive ${archive_dir} --script ${HOMEgraph}/ush/python/atmos/${figScript} --domain ${stormDomain} --level ${standardLayer} --fhhh ${fhhh}"
+taskArgs="${taskArgs} --model ${stormModel} --storm ${STORMNAME} --stormid ${STORMID} --ymdh ${startDate} --com ${COMhafs}"
+if [ "${quickLook:-no}" = yes ]; then
+  taskArgs="${taskArgs} --preview"
+fi
+python3 -m hafsgraph.task ${taskArgs} --set ${figConf}
 
 date
 
@@ -0,0 +1,92 @@
+#!/bin/sh
+
+set -xe
+
+if [ $# -lt 7 ]; then
+  echo "sample usage: ./driverAtmosWorker.sh stormModel stormName stormID startDate stormDomain fhhh figScript:standardLayer [figScript:standardLayer ...]"
+  echo "./driverAtmosWorker.sh HAFS IDA 09L 2019082800 parent f036 plot_mslp_wind10m.py:1003 plot_temp_hgt_wind.py:850"
+fi
+
+date
+
+stormModel=${1:-HAFS}
+stormname=${2:-NATL}
+stormid=${3:-00L}
+
+STORMID=`echo ${stormid} | tr '[a-z]' '[A-Z]' `
+stormid=`echo ${stormid} | tr '[A-Z]' '[a-z]' `
+STORMNAME=`echo ${stormname} | tr '[a-z]' '[A-Z]' `
+stormname=`echo ${stormname} | tr '[A-Z]' '[a-z]' `
+STORMMODEL=`echo ${stormModel} | tr '[a-z]' '[A-Z]' `
+
+startDate=${4:-2019082900}
+stormDomain=${5:-grid01}
+fhhh=${6:-f036}
+shift 6
+figProducts="${@:-plot_reflectivity.py:1003}"
+
+COMhafs=${COMhafs:-/hafs/com/${startDate}/${STORMID}}
+HOMEgraph=${HOMEgraph:-/mnt/lfs5/HFIP/hwrfv3/${USER}/hafs_graphics}
+WORKgraph=${WORKgraph:-${COMhafs}/../../../${startDate}/${STORMID}/emc_graphics}
+COMgraph=${COMgraph:-${COMhafs}/emc_graphics}
+cartopyDataDir=${cartopyDataDir:-/work/noaa/hwrf/local/share/cartopy}
+
+basin1c=$(echo "$stormid" | cut -c3)
+YYYY=$(echo "$startDate" | cut -c1-4)
+echo 'basin1c=' ${basin1c}
+
+if [ ${basin1c} = 'l' ]; then
+   basin2c='al'
+   archive_dir="${COMgraph}/figures/RT${YYYY}_NATL/${STORMNAME}${STORMID}/${STORMNAME}${STORMID}.${startDate}"
+elif [ ${basin1c} = 'e' ]; then
+   basin2c='ep'
+   archive_dir="${COMgraph}/figures/RT${YYYY}_EPAC/${STORMNAME}${STORMID}/${STORMNAME}${STORMID}.${startDate}"
+elif [ ${basin1c} = 'c' ]; then
+   basin2c='cp'
+   archive_dir="${COMgraph}/figures/RT${YYYY}_CPAC/${STORMNAME}${STORMID}/${STORMNAME}${STORMID}.${startDate}"
+elif [ ${basin1c} = 'w' ]; then
+   basin2c='wp'
+   archive_dir="${COMgraph}/figures/RT${YYYY}_WPAC/${STORMNAME}${STORMID}/${STORMNAME}${STORMID}.${startDate}"
+elif [ ${basin1c} = 'a' ] || [ ${basin1c} = 'b' ]; then
+   basin2c='io'
+   archive_dir="${COMgraph}/figures/RT${YYYY}_NIO/${STORMNAME}${STORMID}/${STORMNAME}${STORMID}.${startDate}"
+elif [ ${basin1c} = 'p' ] || [ ${basin1c} = 's' ]; then
+   basin2c='sh'
+   archive_dir="${COMgraph}/figures/RT${YYYY}_SH/${STORMNAME}${STORMID}/${STORMNAME}${STORMID}.${startDate}"
+else
+  echo "Unknown basin1c = ${basin1c}, not lower case l, e, or c a b s p"
+  echo 'Script will exit'
+  exit 1
+fi
+BASIN2C=`echo ${basin2c} | tr '[a-z]' '[A-Z]'`
+
+# All tasks write their figures to one staging directory
+staging_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.staging"
+# Quick-look previews (hafsgraph.quicklook) are staged apart from the full-quality figures
+if [ "${quickLook:-no}" = yes ]; then
+  staging_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.quicklook"
+fi
+mkdir -p ${staging_dir}
+cd ${staging_dir}
+
+# plot_atmos.yml settings (hafsgraph.config), the worker sets standardLayer for each product
+figConf="stormModel=${stormModel} stormName=${STORMNAME} stormID=${STORMID}"
+figConf="${figConf} stormBasin=${BASIN2C} stormDomain=${stormDomain}"
+figConf="${figConf} ymdh=${startDate} fhhh=${fhhh}"
+figConf="${figConf} standardLayer=1003 COMhafs=${COMhafs} cartopyDataDir=${cartopyDataDir}"
+
+# Render all the requested products in one python process, skipping those
+# whose archived figures are up to date (hafsgraph.skipcache), and deliver
+# their figures to archive_dir, a preview never replacing a figure there;
+# with batchDelivery=yes the worker queues them for hafsgraph.deliver
+export PYTHONPATH=${HOMEgraph}/ush/python${PYTHONPATH:+:${PYTHONPATH}}
+set +e
+python3 -m hafsgraph.worker -d ${HOMEgraph}/ush/python/atmos -a ${archive_dir} -s ${figConf} -- ${figProducts}
+status=$?
+
+set -e
+
+date
+
+echo 'driverAtmosWorker done'
+exit ${status}
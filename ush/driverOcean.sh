@@ -8,9 +8,6 @@ startDate=${4:-2023090706}
   echo "./driverOcean.sh HFSA LEE 13L 2023090706 yes plot_sst.py f036"
 fi
 
-# eparse function
-eparse() { set -eux; eval "set -eux; cat<<_EOF"$'\n'"$(< "$1")"$'\n'"_EOF"; }
-
 date
 
 stormModel=${1:-HAFS}
@@ -66,55 +63,33 @@ else
 fi
 BASIN2C=`echo ${basin2c} | tr '[a-z]' '[A-Z]'`
 
-work_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.${figName}_${fhhh}"
-
-rm -rf ${work_dir}
-mkdir -p ${work_dir}
-cd ${work_dir}
-
-cp -up ${HOMEgraph}/ush/python/ocean/plot_ocean.yml.tmp ${work_dir}/
-cp -up ${HOMEgraph}/ush/python/ocean/${figScript} ${work_dir}
-
-if [ ${figScript:5:5} = 'storm' ]; then 
-   cp -up ${HOMEgraph}/ush/python/ocean/geo4HYCOM.py ${work_dir}/
+# All tasks write their figures to one staging directory, the plotting script
+# runs in place, next to the geo4HYCOM/eos80/library/constants modules it
+# imports, and gets its config on the command line (hafsgraph.config)
+staging_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.staging"
+# Quick-look previews (hafsgraph.quicklook) are staged apart from the full-quality figures
+if [ "${quickLook:-no}" = yes ]; then
+  staging_dir="${WORKgraph}/${STORMNAME}${STORMID}/${startDate}.quicklook"
 fi
-
-if [ ${figScript} = 'plot_ohc.py' ] || [ ${figScript} = 'plot_storm_ohc.py' ]; then 
-   cp -up ${HOMEgraph}/ush/python/ocean/constants.py ${work_dir}/
-   cp -up ${HOMEgraph}/ush/python/ocean/eos80.py ${work_dir}/
-   cp -up ${HOMEgraph}/ush/python/ocean/library.py ${work_dir}/
+mkdir -p ${staging_dir}
+cd ${staging_dir}
+
+figConf="stormModel=${stormModel} stormName=${STORMNAME} stormID=${STORMID}"
+figConf="${figConf} stormBasin=${BASIN2C} trackon=${trackon}"
+figConf="${figConf} ymdh=${startDate} fhhh=${fhhh}"
+figConf="${figConf} COMhafs=${COMhafs} cartopyDataDir=${cartopyDataDir}"
+
+# Skip the task when its archived figures are up to date, else run the
+# plotting script, writing 256-color PNGs with the hafsgraph.agg256 backend,
+# deliver the figures, a preview never replacing a figure of the archive, and
+# record them, all in one python process (hafsgraph.task)
+export PYTHONPATH=${HOMEgraph}/ush/python${PYTHONPATH:+:${PYTHONPATH}}
+taskArgs="--archive ${archive_dir} --script ${HOMEgraph}/ush/python/ocean/${figScript} --fhhh ${fhhh}"
+taskArgs="${taskArgs} --model ${stormModel} --storm ${STORMNAME} --stormid ${STORMID} --ymdh ${startDate} --com ${COMhafs}"
+if [ "${quickLook:-no}" = yes ]; then
+  taskArgs="${taskArgs} --preview"
 fi
-
-# Generate the yaml config file
-stormModel=${stormModel}; stormName=${STORMNAME}; stormID=${STORMID}
-stormBasin=${BASIN2C}; trackon=${trackon}
-ymdh=${startDate}; fhhh=${fhhh}
-cartopyDataDir=${cartopyDataDir}
-
-eparse plot_ocean.yml.tmp > plot_ocean.yml
-
-./${figScript}
-
-set +e
-
-# Use convert to reduce colors and thus file size
-#for file in $(/bin/ls -1 *.png); do convert ${file} PNG8:${file} done
-for file in $(/bin/ls -1 *.png); do
-  convert -dither FloydSteinberg -colors 256 ${file} ${file}
-done
-
-for file in $(/bin/ls -1 *.change.f*.png); do
-  forig=${file/.change./.}
-  fcomb=${file/.change./.combine.}
-  convert +append ${forig} ${file} ${fcomb}
-done
-
-# Deliver figure to archive_dir
-mkdir -p ${archive_dir}
-cp -up ${work_dir}/${STORMNAME}${STORMID}.${startDate}.${STORMMODEL}.*.png ${archive_dir}
-#cp -fp ${work_dir}/${STORMNAME}${STORMID}.${startDate}.${STORMMODEL}.*.png ${archive_dir}
-
-set -e
+python3 -m hafsgraph.task ${taskArgs} --set ${figConf}
 
 date
 
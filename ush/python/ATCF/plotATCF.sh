@@ -175,11 +175,9 @@ convert -geometry x390 -bordercolor White -border 5x5 ${figpre}.Pmin.png ${figpr
 convert -gravity east -append ${figpre}.Vmax_x400.png ${figpre}.Pmin_x400.png ${figpre}.intensity_x800.png
 convert +append ${figpre}.track_x800.png ${figpre}.intensity_x800.png ${figpre}.fcst.png
 
-# Use convert to reduce colors and thus file size
-#for file in $(/bin/ls -1 *.png); do convert ${file} PNG8:${file} done
-for file in $(/bin/ls -1 *.png);
-  do convert -dither FloydSteinberg -colors 256 ${file} ${file}
-done
+# Reduce colors and thus file size, in one process for the figures delivered
+PYTHONPATH=${sorcdir}${PYTHONPATH:+:${PYTHONPATH}} python3 -m hafsgraph.agg256 \
+  ${figpre}.Pmin.png ${figpre}.Vmax.png ${figpre}.track.png ${figpre}.fcst.png
 
 # Deliver figures to archive dir
 mkdir -p ${archdir}
@@ -4,7 +4,6 @@
 import os
 import sys
 
-import yaml
 import numpy as np
 import pandas as pd
 from scipy import interpolate
@@ -15,6 +14,10 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 
+from hafsgraph import config
+from hafsgraph import levels
+from hafsgraph import window
+
 def axes_radpres(ax, xmax, xmin, ymax=1000, ymin=100):
     """Set up common axes attributes for wavenumber graphics.
     @param ax:    the axes object
@@ -46,9 +49,7 @@ def main():
     levs=[1000, 975, 950, 925, 900, 875, 850, 825, 800, 775, 750, 725, 700, 675, 650, 625, 600, 575, 550, 525, 500, 475,
              450, 425, 400, 375, 350, 325, 300, 275, 250, 225, 200, 175, 150, 125, 100, 70, 50, 30, 20, 10, 7, 5, 2]
     
-    print('Parse the config file: plot_atmos.yml:')
-    with open('plot_atmos.yml', 'rt') as f:
-        conf = yaml.safe_load(f)
+    conf = config.load('plot_atmos.yml')
     conf['stormNumber'] = conf['stormID'][0:2]
     conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
     conf['fhour'] = int(conf['fhhh'][1:])
@@ -90,20 +91,6 @@ def main():
     else:
         print('TC center at F',fhour,' is',cen_lat,cen_lon)
     
-    # Initialization of arrays by setting them as 0
-    uwind = [[[0.0 for col in range(zsize)] for row in range(xsize)] for depth in range(ysize)]
-    vwind = [[[0.0 for col in range(zsize)] for row in range(xsize)] for depth in range(ysize)]
-    latp = []
-    for i in range(ysize):
-        latp.append(0.0)
-    lonp = []
-    for i in range(xsize):
-        lonp.append(0.0)
-    uwind= np.asarray(uwind)
-    vwind= np.asarray(vwind)
-    latp= np.asarray(latp)
-    lonp= np.asarray(lonp)
-    
     # Read variables from GRIB2 file
     fname = conf['stormID'].lower()+'.'+conf['ymdh']+'.'+conf['stormModel'].lower()+'.'+conf['stormDomain']+'.atm.'+conf['fhhh']+'.grb2'
     grib2file = os.path.join(conf['COMhafs'], fname)
@@ -111,34 +98,25 @@ def main():
     grb = grib2io.open(grib2file,mode='r')
     
     print('Extracting NLAT')
-    lat = grb.select(shortName='NLAT')[0].data
-    lat=np.asarray(lat[::-1,:])
-    for i in range(ysize):
-        for j in range(xsize):
-            latp[(ysize-1)-i]=lat[i,j]
+    lat = np.asarray(grb.select(shortName='NLAT')[0].data)
+    latp = lat[-ysize:, xsize-1].astype(float)
     
     print('Extracting ELON')
-    lon = grb.select(shortName='ELON')[0].data
-    lon=np.asarray(lon[::-1,:])
-    for i in range(ysize):
-        for j in range(xsize):
-            if lonc[-1] == "W":
-                lonp[j]=lon[i,j]-360.0
-            if lonc[-1] == "E":
-                lonp[j]=lon[i,j]
+    lon = np.asarray(grb.select(shortName='ELON')[0].data)
+    lonp = lon[-ysize, :xsize]
+    if lonc[-1] == "W":
+        lonp = lonp-360.0
+    lonp = lonp.astype(float)
+    
+    # Only the box of rmax around the TC center is interpolated, with 2 points around it
+    box = window.around(lat, lon, cen_lat, cen_lon, rmax, margin=2)
+    latp = latp[box.rows]
+    lonp = lonp[box.cols]
     
     # Put variables into 3-d array, index i is for y-dim, index j is for x-dim
-    for k in range(zsize):
-        levstr=str(levs[k])+' mb'
-        ugrd = grb.select(shortName='UGRD', level=levstr)[0].data
-        for i in range(ysize):
-            for j in range(xsize):
-                uwind[i,j,k]=ugrd[i,j]
-        vgrd = grb.select(shortName='VGRD', level=levstr)[0].data
-        for i in range(ysize):
-            for j in range(xsize):
-                vwind[i,j,k]=vgrd[i,j]
-        print('Reading U & V for level',k,levs[k])
+    cube = levels.read(grb, ['UGRD', 'VGRD'], levs, window=box)
+    uwind = np.moveaxis(cube['UGRD'], 0, -1)
+    vwind = np.moveaxis(cube['VGRD'], 0, -1)
     
     # Get pressure levels
     zlevs = levs[:]
@@ -3,8 +3,8 @@
 """This script is to plot out HAFS atmospheric South-North cross section from 1000-100mb at model's storm center (ATCF)."""
 
 import os
+import tempfile
 
-import yaml
 import numpy as np
 import pandas as pd
 
@@ -20,10 +20,11 @@ import cartopy
 import metpy
 import metpy.calc as mpcalc
 
-# Parse the yaml config file
-print('Parse the config file: plot_atmos.yml:')
-with open('plot_atmos.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+from hafsgraph import config
+from hafsgraph import levels
+
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_atmos.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 conf['fhour'] = int(conf['fhhh'][1:])
@@ -85,40 +86,18 @@ grblevs=np.arange(100,1001,25)
 fcor=metpy.calc.coriolis_parameter(np.deg2rad(lat))
 
 print('extract levs='+str(grblevs))
-for ind, lv in enumerate(grblevs):
-  levstr= str(lv)+' mb'
-  print('Extracting data at '+levstr)
-  rh = grb.select(shortName='RH', level=levstr)[0].data
-  if ind == 0:
-    rhtmp=np.zeros((len(grblevs),rh.shape[0],rh.shape[1]))
-    rhtmp[ind,:,:]=rh
-  rhtmp[ind,:,:]=rh
-
-  ugrd = grb.select(shortName='UGRD', level=levstr)[0].data
-  ugrd = ugrd*1.94384
-  if ind == 0:
-    ugrdtmp=np.zeros((len(grblevs),ugrd.shape[0],ugrd.shape[1]))
-    ugrdtmp[ind,:,:]=ugrd
-  ugrdtmp[ind,:,:]=ugrd
-  
-  vgrd = grb.select(shortName='VGRD', level=levstr)[0].data
-  vgrd = vgrd*1.94384
-  if ind == 0:
-    vgrdtmp=np.zeros((len(grblevs),vgrd.shape[0],vgrd.shape[1]))
-    vgrdtmp[ind,:,:]=vgrd
-  vgrdtmp[ind,:,:]=vgrd
-
-  absvor = grb.select(shortName='ABSV', level=levstr)[0].data
-  if ind == 0:
-    vorttmp=np.zeros((len(grblevs),absvor.shape[0],absvor.shape[1]))
-    vorttmp[ind,:,:]=absvor-np.asarray(fcor)
-  vorttmp[ind,:,:]=absvor-np.asarray(fcor)
-
-  tmp = grb.select(shortName='TMP', level=levstr)[0].data
-  if ind == 0:
-    tmp_anomaly=np.zeros((len(grblevs),tmp.shape[0],tmp.shape[1]))
-  tmp_mean = np.nanmean(tmp)
-  tmp_anomaly[ind,:,:] = tmp - tmp_mean
+cube = levels.read(grb, ['RH', 'UGRD', 'VGRD', 'ABSV', 'TMP'], grblevs)
+rhtmp = cube['RH']
+ugrdtmp = cube['UGRD']
+ugrdtmp *= 1.94384
+vgrdtmp = cube['VGRD']
+vgrdtmp *= 1.94384
+
+###Get relative vorticity from absolute vorticity
+vorttmp = cube['ABSV']-np.asarray(fcor)
+
+tmp = cube['TMP']
+tmp_anomaly = tmp-np.nanmean(tmp, axis=(1, 2), keepdims=True)
 
 ########    PLOTTING SETTING
 idx = find_nearest(clon, clat, lon, lat)
@@ -154,7 +133,6 @@ cfcolors = ['white','white','#e0ffff','#80ffff','#00e0e0','#00c0c0','#00a0a0',
 
 cm = matplotlib.colors.ListedColormap(cfcolors)
 
-vmax=np.zeros((len(grblevs),vgrd.shape[0],vgrd.shape[1]))
 vmax=(ugrdtmp**2+vgrdtmp**2)**0.5
 
 idx = find_nearest(clon, clat, lon, lat)
@@ -169,7 +147,10 @@ cs2 = ax2.contourf(newlats, levs, ( rhtmp[:, 100:700 , idx[1]] ), colors=cfcolor
 cb2 = plt.colorbar(cs2, ax=ax2, orientation='vertical', pad=0.02, aspect=50, extendfrac='auto', shrink=cbshrink, extendrect=True, ticks=cflevels)
 
 ##############Modify axis tick label
-plt.savefig('for_axis_tmp', bbox_inches='tight')
+# A name of its own, the tasks running at the same time share the directory
+fd, axis_tmp = tempfile.mkstemp(prefix='for_axis_tmp.', suffix='.png', dir='.')
+os.close(fd)
+plt.savefig(axis_tmp, bbox_inches='tight')
 locs=ax2.get_xticks()
 labels = ax2.get_xticklabels()
 latlab=[]
@@ -239,5 +220,5 @@ ax2.text(1.0,-0.13, footer, fontsize=12, va="top", ha="right", transform=ax2.tra
 
 plt.savefig(fig_name, bbox_inches='tight')
 plt.close(fig)
-os.remove('for_axis_tmp.png')
+os.remove(axis_tmp)
 
@@ -4,8 +4,8 @@
 
 import os
 import sys
+import tempfile
 
-import yaml
 import numpy as np
 import pandas as pd
 
@@ -17,10 +17,11 @@ import matplotlib.ticker as mticker
 
 import cartopy
 
-# Parse the yaml config file
-print('Parse the config file: plot_atmos.yml:')
-with open('plot_atmos.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+from hafsgraph import config
+from hafsgraph import levels
+
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_atmos.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 conf['fhour'] = int(conf['fhhh'][1:])
@@ -91,22 +92,11 @@ lon = grb.select(shortName='ELON')[0].data
 grblevs=np.arange(100,1001,25)
 
 print('extract levs='+str(grblevs))
-for ind, lv in enumerate(grblevs):
-  levstr= str(lv)+' mb'
-  print('Extracting data at '+levstr)
-  ugrd = grb.select(shortName='UGRD', level=levstr)[0].data
-  ugrd = ugrd*1.94384
-  if ind == 0:
-    ugrdtmp=np.zeros((len(grblevs),ugrd.shape[0],ugrd.shape[1]))
-    ugrdtmp[ind,:,:]=ugrd
-  ugrdtmp[ind,:,:]=ugrd
-  
-  vgrd = grb.select(shortName='VGRD', level=levstr)[0].data
-  vgrd = vgrd*1.94384
-  if ind == 0:
-    vgrdtmp=np.zeros((len(grblevs),vgrd.shape[0],vgrd.shape[1]))
-    vgrdtmp[ind,:,:]=vgrd
-  vgrdtmp[ind,:,:]=vgrd
+cube = levels.read(grb, ['UGRD', 'VGRD'], grblevs)
+ugrdtmp = cube['UGRD']
+ugrdtmp *= 1.94384
+vgrdtmp = cube['VGRD']
+vgrdtmp *= 1.94384
 
 ########    PLOTTING SETTING
 idx = find_nearest(clon, clat, lon, lat)
@@ -145,7 +135,10 @@ newlats, levs = np.meshgrid(lat[200:600, idx[1]], grblevs)
 cs0 = ax1.contourf(newlats, levs, ( np.abs(ugrdtmp[:, 200:600 , idx[1]] ) ), cflevels, cmap=cm )
 
 ##############Modify axis tick
-plt.savefig('for_axis_tmp', bbox_inches='tight')
+# A name of its own, the tasks running at the same time share the directory
+fd, axis_tmp = tempfile.mkstemp(prefix='for_axis_tmp.', suffix='.png', dir='.')
+os.close(fd)
+plt.savefig(axis_tmp, bbox_inches='tight')
 locs=ax1.get_xticks()
 labels = ax1.get_xticklabels()
 latlab=[]
@@ -200,5 +193,5 @@ ax1.text(1.0,-0.13, footer, fontsize=12, va="top", ha="right", transform=ax1.tra
 
 plt.savefig(fig_name, bbox_inches='tight')
 plt.close(fig)
-os.remove('for_axis_tmp.png')
+os.remove(axis_tmp)
 
@@ -4,8 +4,8 @@
 
 import os
 import sys
+import tempfile
 
-import yaml
 import numpy as np
 import pandas as pd
 
@@ -17,10 +17,11 @@ import matplotlib.ticker as mticker
 
 import cartopy
 
-# Parse the yaml config file
-print('Parse the config file: plot_atmos.yml:')
-with open('plot_atmos.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+from hafsgraph import config
+from hafsgraph import levels
+
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_atmos.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 conf['fhour'] = int(conf['fhhh'][1:])
@@ -89,15 +90,8 @@ lon = grb.select(shortName='ELON')[0].data
 grblevs=np.arange(100,1001,25)
 
 print('extract levs='+str(grblevs))
-for ind, lv in enumerate(grblevs):
-  levstr= str(lv)+' mb'
-  print('Extracting data at '+levstr)
-  refd = grb.select(shortName='REFD', level=levstr)[0].data
-  refd = np.asarray(refd)
-  if ind == 0:
-    refdtmp=np.zeros((len(grblevs),refd.shape[0],refd.shape[1]))
-    refdtmp[ind,:,:]=refd
-  refdtmp[ind,:,:]=refd
+cube = levels.read(grb, ['REFD'], grblevs)
+refdtmp = cube['REFD']
 
 ########    PLOTTING SETTING
 idx = find_nearest(clon, clat, lon, lat)
@@ -122,7 +116,10 @@ newlons, levs = np.meshgrid(lon[idx[0], 300:700], grblevs)
 cs2 = ax1.contourf(newlons, levs, ( refdtmp[:, idx[0], 300:700] ), colors=cfcolors, levels=cflevels, extend='max')
 
 ##############Modify axis tick label
-plt.savefig('for_axis_tmp', bbox_inches='tight')
+# A name of its own, the tasks running at the same time share the directory
+fd, axis_tmp = tempfile.mkstemp(prefix='for_axis_tmp.', suffix='.png', dir='.')
+os.close(fd)
+plt.savefig(axis_tmp, bbox_inches='tight')
 locs=ax1.get_xticks()
 labels = ax1.get_xticklabels()
 lonlab=[]
@@ -175,5 +172,5 @@ ax1.text(1.0,-0.13, footer, fontsize=12, va="top", ha="right", transform=ax1.tra
 
 plt.savefig(fig_name, bbox_inches='tight')
 plt.close(fig)
-os.remove('for_axis_tmp.png')
+os.remove(axis_tmp)
 
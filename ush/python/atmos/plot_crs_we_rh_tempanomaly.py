@@ -4,8 +4,8 @@
 
 import os
 import sys
+import tempfile
 
-import yaml
 import numpy as np
 import pandas as pd
 from scipy.ndimage import gaussian_filter
@@ -18,10 +18,12 @@ import matplotlib.ticker as mticker
 
 import cartopy
 
-# Parse the yaml config file
-print('Parse the config file: plot_atmos.yml:')
-with open('plot_atmos.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+from hafsgraph import config
+from hafsgraph import levels
+from hafsgraph import window
+
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_atmos.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 conf['fhour'] = int(conf['fhhh'][1:])
@@ -90,28 +92,20 @@ lon = grb.select(shortName='ELON')[0].data
 grblevs=np.arange(100,1001,25)
 
 print('extract levs='+str(grblevs))
-for ind, lv in enumerate(grblevs):
-  levstr= str(lv)+' mb'
-  print('Extracting data at '+levstr)
-  rh = grb.select(shortName='RH', level=levstr)[0].data
-  if ind == 0:
-    rhtmp=np.zeros((len(grblevs),rh.shape[0],rh.shape[1]))
-    rhtmp[ind,:,:]=rh
-  rhtmp[ind,:,:]=rh
-
-  tmp = grb.select(shortName='TMP', level=levstr)[0].data
-  if ind == 0:
-    tmp_anomaly=np.zeros((len(grblevs),tmp.shape[0],tmp.shape[1]))                            
-    ptmp=np.zeros((len(grblevs),tmp.shape[0],tmp.shape[1]))
-  ptmp[ind,:,:] = tmp*np.power((1000/lv),0.286)
-  tmp_mean = np.nanmean(tmp)
-  tmp_anomaly[ind,:,:] = tmp - tmp_mean
-
-tmp_anomaly = gaussian_filter(tmp_anomaly,1)
+cube = levels.read(grb, ['RH', 'TMP'], grblevs)
+rhtmp = cube['RH']
+
+tmp = cube['TMP']
+tmp_anomaly = tmp-np.nanmean(tmp, axis=(1, 2), keepdims=True)
+ptmp = tmp*np.power(1000./cube.levels, 0.286)[:, None, None]
 
 ########    PLOTTING SETTING
 idx = find_nearest(clon, clat, lon, lat)
 
+# Smooth the anomaly on the cross section only, with the 4 points around it the filter reaches
+box = window.index_box(lat.shape, (idx[0], idx[0]+1), (300, 700), margin=4)
+box.apply(lambda field: gaussian_filter(field,1), tmp_anomaly)
+
 print(idx[0],idx[1])
 fig, (ax1) = plt.subplots(nrows=1, ncols=1,figsize=(10,5))
 
@@ -130,7 +124,10 @@ cfcolors = ['#996515','#a3742c','#ad8444','#b8935b','#c2a373','#ccb28a','#d6c1a1
 newlons, levs = np.meshgrid(lon[idx[0], 300:700], grblevs)
 cs1 = ax1.contourf(newlons, levs, ( rhtmp[:, idx[0], 300:700] ), colors=cfcolors, levels=cflevels, extend='max')
 ##############Modify axis tick label
-plt.savefig('for_axis_tmp', bbox_inches='tight')
+# A name of its own, the tasks running at the same time share the directory
+fd, axis_tmp = tempfile.mkstemp(prefix='for_axis_tmp.', suffix='.png', dir='.')
+os.close(fd)
+plt.savefig(axis_tmp, bbox_inches='tight')
 locs=ax1.get_xticks()
 labels = ax1.get_xticklabels()
 lonlab=[]
@@ -197,5 +194,5 @@ ax1.text(1.0,-0.13, footer, fontsize=12, va="top", ha="right", transform=ax1.tra
 
 plt.savefig(fig_name, bbox_inches='tight')
 plt.close(fig)
-os.remove('for_axis_tmp.png')
+os.remove(axis_tmp)
 
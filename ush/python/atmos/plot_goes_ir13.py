@@ -4,7 +4,6 @@
 
 import os
 
-import yaml
 import numpy as np
 import pandas as pd
 from scipy.ndimage import gaussian_filter
@@ -20,10 +19,11 @@ import cartopy
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
-# Parse the yaml config file
-print('Parse the config file: plot_atmos.yml:')
-with open('plot_atmos.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+from hafsgraph import config
+from hafsgraph import grid
+
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_atmos.yml')
 
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
@@ -45,31 +45,9 @@ grb_grid = grb.select(shortName='SBTAGR13')[0].gridDefinitionTemplate
 
 nlon = grb_grid[7]
 nlat = grb_grid[8]
-blat = grb_grid[11]/1.e6
-blon = grb_grid[12]/1.e6
-elat = grb_grid[14]/1.e6
-elon = grb_grid[15]/1.e6
-dlat = grb_grid[16]/1.e6
-dlon = grb_grid[17]/1.e6
-lat1d = np.linspace(blat, elat, nlat)
-if elon > blon:
-    lon1d = np.linspace(blon, elon, nlon)
-else:
-    lon1d = np.linspace(blon, 360.+elon, nlon)
-    lon1d = np.mod(lon1d, 360.)
-
-[lon, lat] = np.meshgrid(lon1d, lat1d)
-
-# The lon range in grib2 is typically between 0 and 360
-# Cartopy's PlateCarree projection typically uses the lon range of -180 to 180
-print('raw lonlat limit: ', np.min(lon), np.max(lon), np.min(lat), np.max(lat))
-if abs(np.max(lon) - 360.) < 10.:
-    lon[lon>180] = lon[lon>180] - 360.
-    lon_offset = 0.
-else:
-    lon_offset = 180.
-
-lon = lon - lon_offset
+# Built once per grid definition, with the lon range moved from the 0-360 of
+# grib2 to the -180-180 of Cartopy's PlateCarree projection (hafsgraph.grid)
+lat, lon, lon_offset = grid.from_template(grb_grid).plate_carree()
 print('new lonlat limit: ', np.min(lon), np.max(lon), np.min(lat), np.max(lat))
 #[nlat, nlon] = np.shape(lon)
 
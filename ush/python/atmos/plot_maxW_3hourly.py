@@ -5,7 +5,6 @@
 import os
 import sys
 
-import yaml
 import numpy as np
 import pandas as pd
 
@@ -21,6 +20,10 @@ import cartopy
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
+from hafsgraph import config
+from hafsgraph import prefetch
+from hafsgraph import window
+
 #===================================================================================================
 def latlon_str2num(string):
     """Convert lat/lon string into numbers."""
@@ -55,65 +58,8 @@ def get_adeck_track(adeck_file):
     return fhour,lat_adeck,lon_adeck,init_time,valid_time
 
 #===================================================================================================
-def get_R_and_tan_theta_around_N_degrees_from_eye(N,lon, lat, lon_track, lat_track):
-
-    xlim = [lon_track-N,lon_track+N]
-    ylim = [lat_track-N,lat_track+N]
-
-    oklon = np.logical_and(lon>xlim[0],lon<xlim[1])
-    oklat = np.logical_and(lat>ylim[0],lat<ylim[1])
-
-    lat_lon_matrix = np.stack((np.ravel(lon),np.ravel(lat)),axis=1).T
-
-    R = np.empty(lat_lon_matrix.shape[1])
-    R[:] = np.nan
-    tan_theta = np.empty(lat_lon_matrix.shape[1])
-    tan_theta[:] = np.nan
-    cos_theta = np.empty(lat_lon_matrix.shape[1])
-    cos_theta[:] = np.nan
-    sin_theta = np.empty(lat_lon_matrix.shape[1])
-    sin_theta[:] = np.nan
-    for i in np.arange(lat_lon_matrix.shape[1]):
-        R[i],tan_theta[i],cos_theta[i], sin_theta[i] = Haversine(lat_track,lon_track,lat_lon_matrix[1,i],lat_lon_matrix[0,i])
-
-    return oklat, oklon, R, tan_theta, cos_theta, sin_theta
-                                                            
-#===================================================================================================
-def Haversine(lat1,lon1,lat2,lon2):
-    """
-    This uses the haversine formula to calculate the great-circle distance
-    between two points that is, the shortest distance over the earth surface
-    giving an the-crow-flies~@~Y distance between the points
-    (ignoring any hills they fly over, of course!).
-    Haversine formula:
-    a = sin²(~T~F/2) + cos ~F1 ~K~E cos ~F2 ~K~E sin²(~T?/2)
-    c = 2 ~K~E atan2( ~H~Za, ~H~Z(1~H~Ra) )
-    d = R ~K~E c
-    where   ~F is latitude, ? is longitude, R is earth's radius
-    (mean radius = 6,371km). Note that angles need to be in radians to pass to
-    trig functions!
-    """
-
-    R = 6371.0088
-    lat1,lon1,lat2,lon2 = map(np.radians, [lat1,lon1,lat2,lon2])
-
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2) **2
-    c = 2 * np.arctan2(a**0.5, (1-a)**0.5)
-    d = R * c
-
-    tan_theta = dlat/dlon
-    cos_theta = (dlon*180/np.pi)*111.111/d
-    sin_theta = (dlat*180/np.pi)*111.111/d
-
-    return d, tan_theta, cos_theta, sin_theta
-
-#===================================================================================================
-# Parse the yaml config file
-print('Parse the config file: plot_atmos.yml:')
-with open('plot_atmos.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_atmos.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 #conf['validTime'] = conf['initTime'] + conf['fcstTime']
@@ -166,22 +112,26 @@ print('varshape',varshape.shape)
 
 #wind_maskedtmp = np.zeros((varshape.shape[0],varshape.shape[1]))
 
-for ind, frame in enumerate(range(0,len(varlen)+1,2)):
-  print(ind,frame)
-  conf['fhhh'] = "{:03d}".format((ind+1)*3)
-  conf['fcstTime'] = pd.to_timedelta(int(conf['fhhh']), unit='h')
-  conf['validTime'] = conf['initTime'] + conf['fcstTime']
-
+def read_frame(frame):
   if frame > 0:
     wind = grbswath.select(shortName='DZDT',statisticalProcess = 'Maximum')[frame].data
     wind0= grbswath.select(shortName='DZDT',statisticalProcess = 'Maximum')[frame-2].data
     wind=wind-wind0
   elif frame == 0:
     wind = grbswath.select(shortName='DZDT',statisticalProcess = 'Maximum')[frame].data
+  return wind
+
+discs = {}
+# The next frame is decoded while this one is drawn
+frames = prefetch.ahead(range(0,len(varlen)+1,2), read_frame, label='maxW')
+for ind, (frame, wind) in enumerate(frames):
+  print(ind,frame)
+  conf['fhhh'] = "{:03d}".format((ind+1)*3)
+  conf['fcstTime'] = pd.to_timedelta(int(conf['fhhh']), unit='h')
+  conf['validTime'] = conf['initTime'] + conf['fcstTime']
 
   #===================================================================================================
   print('Obtaining the mask along the forecast track, around 500 km from the storm center')
-  N = 8 # 8 degrees around track
   freq = np.arange(ind,ind+1)
   print(freq)
   wind_masked0 = np.empty((len(freq),wind.shape[0],wind.shape[1]))
@@ -192,12 +142,14 @@ for ind, frame in enumerate(range(0,len(varlen)+1,2)):
       lon_track = lon_adeck[r]
       lat_track = lat_adeck[r]
       print(lon_track,lat_track)
-      oklat, oklon, R, _, _, _ = get_R_and_tan_theta_around_N_degrees_from_eye(N,lon,lat,lon_track,lat_track)
-      okR = R <= 500
-      okR_matrix = np.reshape(okR,(lat.shape[0],lat.shape[1]))
-      wind_mask = wind*okR_matrix
+      if r not in discs:
+          # Distances only in the box of 500 km around the track point, once per point
+          disc = window.around(lat, lon, lat_track, lon_track, 500.)
+          discs[r] = disc, disc.distance(lat_track, lon_track) <= 500
+      disc, okR = discs[r]
+      wind_mask = disc.cut(wind)*okR
       wind_mask[wind_mask == 0] = np.nan
-      wind_masked0[i,:,:] = wind_mask
+      wind_masked0[(i,)+disc.slices] = wind_mask
   
   wind_masked = np.nanmean(wind_masked0,axis=0)
 
@@ -4,7 +4,6 @@
 
 import os
 
-import yaml
 import numpy as np
 import pandas as pd
 from scipy.ndimage import gaussian_filter
@@ -20,10 +19,11 @@ import cartopy
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
-# Parse the yaml config file
-print('Parse the config file: plot_atmos.yml:')
-with open('plot_atmos.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+from hafsgraph import config
+from hafsgraph import grid
+
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_atmos.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 conf['fhour'] = int(conf['fhhh'][1:])
@@ -54,17 +54,9 @@ if conf['stormDomain'] == 'storm':
     #[nlat, nlon] = np.shape(lon)
 
 print('Extracting lat, lon')
-lat = grb.select(shortName='NLAT')[0].data
-lon = grb.select(shortName='ELON')[0].data
-# The lon range in grib2 is typically between 0 and 360
-# Cartopy's PlateCarree projection typically uses the lon range of -180 to 180
-print('raw lonlat limit: ', np.min(lon), np.max(lon), np.min(lat), np.max(lat))
-if abs(np.max(lon) - 360.) < 10.:
-    lon[lon>180] = lon[lon>180] - 360.
-    lon_offset = 0.
-else:
-    lon_offset = 180.
-lon = lon - lon_offset
+# Decoded once per grid definition, with the lon range moved from the 0-360 of
+# grib2 to the -180-180 of Cartopy's PlateCarree projection (hafsgraph.grid)
+lat, lon, lon_offset = grid.coordinates(grb).plate_carree()
 print('new lonlat limit: ', np.min(lon), np.max(lon), np.min(lat), np.max(lat))
 [nlat, nlon] = np.shape(lon)
 
@@ -0,0 +1 @@
+"""Shared helpers for running the HAFS graphics plotting scripts."""
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+"""Agg backend that writes 256-color palette PNGs straight from the render buffer.
+
+Use it with MPLBACKEND=module://hafsgraph.agg256.  plt.savefig() then renders
+with Agg as usual, and the RGBA buffer is quantized to a 256-color palette with
+Pillow, Floyd-Steinberg dithered, and written once.  This gives the same kind
+of file as the `convert -dither FloydSteinberg -colors 256` pass of the
+drivers, without a second decode/encode and process launch per figure.
+
+PNGdither=no turns the dithering off, for flat-color products whose colors
+fit in the palette anyway.  PNGcolors sets the palette size (default 256).
+The written files are kept in the written list, and appended to the file
+$PNGmanifest when set, so that the drivers know which figures a task made in
+the staging directory shared by all tasks.
+
+Usage: python3 -m hafsgraph.agg256 file.png [file.png ...]
+quantizes existing PNGs in place, e.g. the ATCF figures trimmed and
+composited by convert; only call it on files the backend did not write.
+Files that already are palette PNGs are left alone.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg, _BackendAgg
+
+_Dither = getattr(Image, 'Dither', Image)
+_Quantize = getattr(Image, 'Quantize', Image)
+
+written = []
+
+
+def quantize(rgba, dither=None, colors=None):
+    """Return a palette Image of an RGBA (or RGB) uint8 array or Image.
+
+    A transparent figure (savefig(transparent=True)) is composited on white;
+    its fully transparent pixels get the last palette entry, marked
+    transparent.
+    """
+    if dither is None:
+        dither = os.environ.get('PNGdither', 'yes') != 'no'
+    colors = colors or int(os.environ.get('PNGcolors', 256))
+    img = rgba if isinstance(rgba, Image.Image) else Image.fromarray(np.asarray(rgba))
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA')
+    clear = None
+    if img.mode == 'RGBA':
+        alpha = img.getchannel('A')
+        if alpha.getextrema()[0] == 0:
+            clear = np.asarray(alpha) == 0
+        rgb = Image.new('RGB', img.size, 'white')
+        rgb.paste(img, mask=alpha)
+        img = rgb
+    ncolors = colors-1 if clear is not None else colors
+    # Pillow only dithers when mapping onto a given palette: build the palette first
+    out = palette = img.quantize(colors=ncolors, method=_Quantize.FASTOCTREE)
+    if dither:
+        out = img.quantize(palette=palette, dither=_Dither.FLOYDSTEINBERG)
+    if clear is None:
+        return out
+    index = np.array(out)
+    index[clear] = ncolors
+    entries = out.getpalette()[:3*ncolors]
+    entries += [255, 255, 255]*(ncolors+1-len(entries)//3)
+    out = Image.fromarray(index, 'P')
+    out.putpalette(entries)
+    out.info['transparency'] = ncolors
+    return out
+
+
+def save_png(rgba, filename_or_obj, dpi=None, metadata=None, dither=None):
+    """Write an RGBA buffer as a palette PNG."""
+    img = quantize(rgba, dither)
+    kwargs = {}
+    if dpi:
+        kwargs['dpi'] = (dpi, dpi)
+    if metadata:
+        from PIL.PngImagePlugin import PngInfo
+        info = PngInfo()
+        for k, v in metadata.items():
+            if v is not None:
+                info.add_text(k, str(v))
+        kwargs['pnginfo'] = info
+    img.save(filename_or_obj, format='png', **kwargs)
+
+
+class FigureCanvasAgg256(FigureCanvasAgg):
+
+    def print_png(self, filename_or_obj, *args, metadata=None, pil_kwargs=None, **kwargs):
+        FigureCanvasAgg.draw(self)
+        save_png(self.buffer_rgba(), filename_or_obj, dpi=self.figure.dpi, metadata=metadata)
+        if isinstance(filename_or_obj, (str, os.PathLike)):
+            written.append(os.fspath(filename_or_obj))
+            if os.environ.get('PNGmanifest'):
+                with open(os.environ['PNGmanifest'], 'a') as f:
+                    f.write(written[-1]+'\n')
+
+
+@_BackendAgg.export
+class _BackendAgg256(_BackendAgg):
+    FigureCanvas = FigureCanvasAgg256
+
+
+def main():
+    tstart = time.time()
+    count = 0
+    for path in sys.argv[1:]:
+        try:
+            with Image.open(path) as img:
+                if img.mode == 'P':
+                    continue
+                img.load()
+            save_png(img, path, dpi=img.info.get('dpi', (None,))[0])
+        except (OSError, ValueError) as e:
+            print('WARNING: cannot quantize {0}: {1}'.format(path, e))
+            continue
+        count += 1
+    print('Quantized {0} of {1} PNG files in {2:.2f} s'.format(count, len(sys.argv[1:]), time.time()-tstart))
+
+
+if __name__ == '__main__':
+    main()
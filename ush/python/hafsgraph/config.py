@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""Configuration of the plotting scripts without a rendered yaml file per task.
+
+The scripts call config.load('plot_atmos.yml') (or plot_ocean.yml).  The
+template plot_atmos.yml.tmp next to the scripts is rendered in-process, the
+way the drivers' eparse did: each ${name:-default} takes, in order
+
+  1. name=value from the command line, e.g. plot_sst.py fhhh=f036 trackon=yes
+  2. the environment variable name, only for the settings the drivers
+     export (ENV_SETTINGS), so that unrelated job variables of the same name
+     cannot change the figures
+  3. the shared run-config file $GRAPHconfig (yaml, name: value)
+  4. the template default
+
+hafsgraph.worker sets the whole config in-process with set_override().  A
+script started without name=value arguments in a directory holding a
+rendered plot_atmos.yml still reads that file, as before.
+
+load() also reads the input files from node-local copies when $STAGEgraph
+is set (hafsgraph.stagein), maps the decoded GRIB2 fields from the disk
+cache when $FIELDcache is set (hafsgraph.fieldcache), gets them from the
+node's field server when $FIELDserver is set (hafsgraph.fieldserver), and with
+quickLook: 'yes' switches the process to quick-look preview figures
+(hafsgraph.quicklook).
+"""
+
+import os
+import re
+import sys
+
+import yaml
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+TEMPLATE_DIRS = [os.path.join(PYTHON_DIR, name) for name in ('atmos', 'ocean', 'ATCF')]
+# Settings the cmdfile lines and drivers pass in the environment
+ENV_SETTINGS = ('quickLook', 'quickLookStep', 'quickLookDPI')
+VAR_RE = re.compile(r'\$\{(\w+)(?::-([^}]*))?\}')
+
+_override = None
+_run_config = None
+
+
+def template_path(name):
+    """Return the path of the template of a config file, e.g. plot_atmos.yml.tmp."""
+    for template_dir in TEMPLATE_DIRS:
+        path = os.path.join(template_dir, name+'.tmp')
+        if os.path.exists(path):
+            return path
+    raise IOError('No template {0}.tmp in {1}'.format(name, ' '.join(TEMPLATE_DIRS)))
+
+
+def parse_settings(args):
+    """Return {name: value} of name=value arguments."""
+    values = {}
+    for arg in args:
+        name, sep, value = arg.partition('=')
+        if not sep:
+            raise ValueError('Expected name=value, got '+arg)
+        values[name] = value
+    return values
+
+
+def run_config():
+    """Return the shared run-config of $GRAPHconfig, {} when unset."""
+    global _run_config
+    if _run_config is None:
+        _run_config = {}
+        if os.environ.get('GRAPHconfig'):
+            with open(os.environ['GRAPHconfig'], 'rt') as f:
+                _run_config = yaml.safe_load(f) or {}
+    return _run_config
+
+
+def lookup(name, values, default=''):
+    """Return the value of a template variable."""
+    if name in values:
+        return str(values[name])
+    if name in ENV_SETTINGS and name in os.environ:
+        return os.environ[name]
+    if name in run_config():
+        return str(run_config()[name])
+    return default or ''
+
+
+def render(name, values=None):
+    """Return the text of a config file rendered from its template."""
+    values = values or {}
+    with open(template_path(name), 'rt') as f:
+        text = f.read()
+    return VAR_RE.sub(lambda m: lookup(m.group(1), values, m.group(2)), text)
+
+
+def set_override(conf):
+    """Make load() return conf, for scripts run in-process (None to reset)."""
+    global _override
+    _override = None if conf is None else dict(conf)
+
+
+def setup(conf, values=None):
+    """Stage the input files when $STAGEgraph is set (hafsgraph.stagein), keep the
+    decoded GRIB2 fields on disk when $FIELDcache is set (hafsgraph.fieldcache),
+    decode them in the field server when $FIELDserver is set (hafsgraph.fieldserver),
+    and switch to quick-look preview figures when conf has quickLook: 'yes'
+    (hafsgraph.quicklook).
+    """
+    if os.environ.get('STAGEgraph'):
+        from hafsgraph import stagein
+        stagein.install()
+    if os.environ.get('FIELDcache'):
+        from hafsgraph import fieldcache
+        fieldcache.install()
+    if os.environ.get('FIELDserver'):
+        from hafsgraph import fieldserver
+        fieldserver.install()
+    if conf and conf.get('quickLook') == 'yes':
+        from hafsgraph import quicklook
+        values = values or {}
+        quicklook.install(lookup('quickLookStep', values, '4'), lookup('quickLookDPI', values, '60'))
+    return conf
+
+
+def load(name, values=None):
+    """Return the config of the running script."""
+    if _override is not None:
+        return setup(dict(_override))
+    if values is None:
+        values = parse_settings(sys.argv[1:])
+        if not values and os.path.exists(name):
+            print('Parse the config file: '+name)
+            with open(name, 'rt') as f:
+                return setup(yaml.safe_load(f))
+    return setup(yaml.safe_load(render(name, values)), values)
+
+
+def main():
+    """Print a rendered config file: python3 -m hafsgraph.config plot_atmos.yml name=value ..."""
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+    sys.stdout.write(render(sys.argv[1], parse_settings(sys.argv[2:])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+"""Deliver the figures to the archive in batches, from a per-cycle outbox of the finished tasks.
+
+Usage: python3 -m hafsgraph.deliver queue --archive DIR --script plot_sst.py --fhhh f036 ... --files *.png [--preview]
+       python3 -m hafsgraph.deliver run [--every 60] [--bundle] [outbox ...]
+       python3 -m hafsgraph.deliver bundle --storm FIONA --stormid 07L --ymdh 2022092000
+
+With batchDelivery=yes, the drivers (and hafsgraph.worker) do not copy the
+figures of a task to the archive themselves: they append one line to the
+outbox of the storm cycle, <WORKgraph>/<STORM><ID>/<ymdh>.outbox.jsonl,
+with the figures in the staging directory and the skipcache key of the
+task.  run reads the lines added to each outbox since its last pass (the
+offset is kept in <outbox>.offset) and moves their figures into the
+archive: a rename when the staging directory is on the file system of the
+archive, else a copy to a hidden temporary file in the archive renamed over
+the figure, so that readers never see a partial figure.  Only then are the
+figures recorded in the skipcache and the delivery manifest
+(hafsgraph.manifest).  Previews (hafsgraph.quicklook) never replace a
+figure of the archive, even one delivered at the same time, and are not
+recorded.  Without batchDelivery, copy() delivers the figures the same way.  With --every, run makes a pass
+every so many seconds until it gets SIGTERM, then makes a last pass.
+
+bundle (run --bundle after the last pass) writes the figures of the
+manifest of a cycle to <archive_dir>.tar, with their names, sizes, sha256
+checksums and tasks in <archive_dir>.index.json, for the web and HPSS
+consumers; both are rewritten, atomically, only when a figure has changed.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import fcntl
+import shutil
+import signal
+import tarfile
+import argparse
+
+from hafsgraph import config
+from hafsgraph import products
+from hafsgraph import manifest
+from hafsgraph import skipcache
+
+
+def enabled():
+    """Return True when the figures are delivered in batches."""
+    return os.environ.get('batchDelivery', 'no') == 'yes'
+
+
+def outbox(storm):
+    """Return the outbox of a storm cycle, next to its staging directory."""
+    work_dir = os.environ.get('WORKgraph', os.getcwd())
+    return os.path.join(work_dir, storm.name+storm.id, storm.ymdh+'.outbox.jsonl')
+
+
+def queue(archive, task, key, files, preview=False, inputs=None):
+    """Append the figures of a finished task to the outbox of its storm cycle, inputs its manifest.inputs_digest()."""
+    storm = task.storm
+    entry = {'archive': archive, 'preview': preview, 'key': key, 'inputs': inputs, 'storm': list(storm),
+             'task': [task.script, task.domain, task.level, task.fhhh],
+             'files': [os.path.abspath(path) for path in files]}
+    path = outbox(storm)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry, separators=(',', ':'))+'\n').encode())
+    finally:
+        os.close(fd)
+
+
+def place(src, dst, replace=True, move=False):
+    """Put a figure at dst atomically, without replace never over a figure there, return False when it was not."""
+    # A hard link fails on an existing figure, even one delivered meanwhile
+    if move:
+        try:
+            if replace:
+                os.rename(src, dst)
+            else:
+                os.link(src, dst)
+                os.remove(src)
+            return True
+        except FileExistsError:
+            os.remove(src)
+            return False
+        except OSError:
+            # Another file system, or no hard links
+            pass
+    tmp = os.path.join(os.path.dirname(dst), '.{0}.tmp.{1}'.format(os.path.basename(src), os.getpid()))
+    shutil.copyfile(src, tmp)
+    shutil.copystat(src, tmp)
+    placed = True
+    if replace:
+        os.replace(tmp, dst)
+    else:
+        try:
+            os.link(tmp, dst)
+        except FileExistsError:
+            placed = False
+        finally:
+            os.remove(tmp)
+    if move:
+        os.remove(src)
+    return placed
+
+
+def move(src, archive, preview=False):
+    """Move a staged figure into archive atomically, return False when it was not delivered."""
+    return place(src, os.path.join(archive, os.path.basename(src)), replace=not preview, move=True)
+
+
+def copy(files, archive, preview=False):
+    """Copy figures into archive atomically, a preview never over a figure there, return the number delivered."""
+    os.makedirs(archive, exist_ok=True)
+    return sum(place(src, os.path.join(archive, os.path.basename(src)), replace=not preview) for src in files)
+
+
+def read_new(path):
+    """Return the complete lines added to an outbox since the last pass, and the offset after them."""
+    try:
+        with open(path+'.offset', 'rt') as f:
+            offset = int(f.read() or 0)
+    except (OSError, ValueError):
+        offset = 0
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    # A task may be writing its line right now
+    data = data[:data.rfind(b'\n')+1]
+    entries = []
+    for line in data.decode('utf-8', 'replace').splitlines():
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries, offset+len(data)
+
+
+def deliver(reg, path, report=sys.stdout):
+    """Deliver the figures queued in an outbox since the last pass, return the number of figures."""
+    tstart = time.time()
+    fd = os.open(path+'.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        entries, offset = read_new(path)
+        moved = 0
+        for entry in entries:
+            archive = entry['archive']
+            os.makedirs(archive, exist_ok=True)
+            files = []
+            for src in entry['files']:
+                dst = os.path.join(archive, os.path.basename(src))
+                if os.path.isfile(src):
+                    moved += move(src, archive, entry['preview'])
+                elif not os.path.isfile(dst):
+                    print('WARNING: {0} is neither staged nor delivered'.format(src), file=report)
+                    continue
+                files.append(dst)
+            if entry['preview'] or not files:
+                continue
+            storm = products.Storm(*entry['storm'])
+            task = skipcache.find_task(reg, storm, *entry['task'])
+            if entry.get('key'):
+                skipcache.store(archive, task, entry['key'], files)
+            manifest.record(archive, reg, task, files, entry.get('inputs'))
+        tmp = path+'.offset.tmp'
+        with open(tmp, 'wt') as f:
+            f.write(str(offset))
+        os.replace(tmp, path+'.offset')
+    finally:
+        os.close(fd)
+    if entries:
+        print('{0} Delivered {1} figures of {2} tasks from {3} in {4:.1f} s'.format(
+              time.strftime('%H:%M:%S'), moved, len(entries), path, time.time()-tstart), file=report, flush=True)
+    return moved
+
+
+def bundle(archive, report=sys.stdout):
+    """Write the manifest figures of archive to <archive>.tar with an index, when they have changed."""
+    index = {'archive': os.path.basename(archive.rstrip('/')), 'files': []}
+    for name, entry in sorted(manifest.load(archive).items()):
+        for fig in entry['files']:
+            if os.path.isfile(os.path.join(archive, fig['name'])):
+                index['files'].append(dict(fig, task=name))
+    index_path = archive.rstrip('/')+'.index.json'
+    tar_path = archive.rstrip('/')+'.tar'
+    try:
+        with open(index_path, 'rt') as f:
+            old = json.load(f)
+        if old.get('files') == index['files'] and os.path.isfile(tar_path):
+            print('Bundle {0} is up to date'.format(tar_path), file=report)
+            return
+    except (OSError, ValueError):
+        pass
+    tmp = '{0}.tmp.{1}'.format(tar_path, os.getpid())
+    with tarfile.open(tmp, 'w') as tar:
+        for fig in index['files']:
+            tar.add(os.path.join(archive, fig['name']), arcname=os.path.join(index['archive'], fig['name']))
+    os.replace(tmp, tar_path)
+    index['time'] = round(time.time(), 1)
+    tmp = '{0}.tmp.{1}'.format(index_path, os.getpid())
+    with open(tmp, 'wt') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, index_path)
+    print('Bundled {0} figures in {1}'.format(len(index['files']), tar_path), file=report)
+
+
+def default_outboxes():
+    """Return the outboxes in $WORKgraph."""
+    return sorted(glob.glob(os.path.join(os.environ.get('WORKgraph', os.getcwd()), '*', '*.outbox.jsonl')))
+
+
+def archives(paths):
+    """Return the archive directories the outboxes have delivered to."""
+    result = set()
+    for path in paths:
+        with open(path, 'rt') as f:
+            for line in f:
+                try:
+                    result.add(json.loads(line)['archive'])
+                except (ValueError, KeyError):
+                    continue
+    return sorted(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    que = sub.add_parser('queue', help='queue the figures of a finished task for delivery')
+    que.add_argument('--archive', required=True, help='directory the figures are delivered to')
+    que.add_argument('--script', required=True, help='path of the plotting script')
+    que.add_argument('--domain', help='stormDomain, atmos and wave only')
+    que.add_argument('--level', type=int, help='standardLayer, atmos and wave only')
+    que.add_argument('--fhhh', help='forecast hour, e.g. f036')
+    products.add_storm_arguments(que)
+    que.add_argument('--set', nargs='*', default=[], help='config settings of the task, as for hafsgraph.skipcache')
+    que.add_argument('--files', nargs='*', default=[], help='figures of the task')
+    que.add_argument('--preview', action='store_true', help='quick-look previews, never replacing an archived figure')
+    prun = sub.add_parser('run', help='deliver the figures queued since the last pass')
+    prun.add_argument('--every', type=float, help='make a pass every so many seconds, until SIGTERM')
+    prun.add_argument('--bundle', action='store_true', help='then bundle the figures of each archive with an index')
+    prun.add_argument('outboxes', nargs='*', help='outboxes (default: all in $WORKgraph)')
+    bnd = sub.add_parser('bundle', help='bundle the delivered figures of a storm cycle with an index')
+    products.add_storm_arguments(bnd)
+    args = parser.parse_args()
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+
+    reg = products.load()
+    if args.action == 'queue':
+        storm = products.storm_from_args(args)
+        task = skipcache.find_task(reg, storm, os.path.basename(args.script), args.domain, args.level, args.fhhh)
+        files = [path for path in args.files if os.path.isfile(path)]
+        key = inputs = None
+        if not args.preview:
+            config_name = 'plot_ocean.yml' if task.stage == 'ocean' else 'plot_atmos.yml'
+            identities = skipcache.input_identities(reg, task)
+            key = skipcache.task_key(reg, task, args.script, config.render(config_name, config.parse_settings(args.set)),
+                                     identities)
+            inputs = manifest.inputs_digest(reg, task, identities=identities)
+        if files:
+            queue(args.archive, task, key, files, args.preview, inputs)
+        return
+    if args.action == 'bundle':
+        bundle(products.archive_dir(products.storm_from_args(args)))
+        return
+
+    stop = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.append(signum))
+    while True:
+        paths = args.outboxes or default_outboxes()
+        for path in paths:
+            deliver(reg, path)
+        if not args.every or stop:
+            break
+        tnext = time.time()+args.every
+        while time.time() < tnext and not stop:
+            time.sleep(1)
+    if args.bundle:
+        for archive in archives(paths):
+            bundle(archive)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+"""Persistent cache of decoded GRIB2 fields as .npy files, memory-mapped by the plotting processes.
+
+Usage: python3 -m hafsgraph.fieldcache show [--dir DIR]
+       python3 -m hafsgraph.fieldcache clean [--dir DIR] [--max-gb 20]
+
+When $FIELDcache is set, config.load() calls install(), which routes
+grib2io.open through this cache: the .data of a selected message is decoded
+once and saved to $FIELDcache/<hash>.<shortName>.npy, and every later
+request, from any process or job, maps that file with
+np.load(mmap_mode='c') instead of unpacking the message again.  The pages
+come from the page cache, and a script that changes its array in place (e.g.
+the longitude wrap of ELON) gets private copies of the pages it writes.
+
+A message is keyed by the version of its file (real path, size and mtime),
+its shortName, level and statistical process, and its number in the file,
+so a rewritten file never hits the entries of the old one; those age out.
+The fields are stored in the dtype grib2io decodes them to; masked arrays
+are not cached.  A hit refreshes the mtime of its entry, and a process that
+has added entries removes, at exit, the least recently used ones over
+$FIELDcacheGB gigabytes (default 20).
+"""
+
+import os
+import sys
+import time
+import fcntl
+import atexit
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+DEFAULT_GB = 20
+TOUCH_SECONDS = 60
+
+_installed = False
+_stored = False
+
+
+def cache_dir():
+    """Return the cache directory, None when the cache is off."""
+    return os.environ.get('FIELDcache') or None
+
+
+def budget():
+    """Return the bytes of fields kept in the cache."""
+    return int(float(os.environ.get('FIELDcacheGB') or DEFAULT_GB)*1e9)
+
+
+def file_version(path):
+    """Return the identity of the current version of a file."""
+    st = os.stat(path)
+    return '{0} {1} {2}'.format(os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+
+def attribute(msg, name, default=None):
+    """Return an attribute of a message, default when it does not have it."""
+    try:
+        value = getattr(msg, name)
+    except Exception:
+        return default
+    return default if value is None else value
+
+
+def entry_path(root, version, select, index, msg):
+    """Return the cache file of a message."""
+    short_name = str(attribute(msg, 'shortName', select.get('shortName', 'field')))
+    number = attribute(msg, '_msgnum')
+    where = number if number is not None else (sorted((str(k), str(v)) for k, v in select.items()), index)
+    key = repr((version, short_name, str(attribute(msg, 'level', select.get('level'))),
+                str(attribute(msg, 'typeOfStatisticalProcessing', '')), where))
+    return os.path.join(root, '{0}.{1}.npy'.format(hashlib.sha1(key.encode()).hexdigest()[:20], short_name.replace('/', '_')))
+
+
+def load(path):
+    """Return the cached field of path mapped copy-on-write, None when it is not cached."""
+    try:
+        data = np.load(path, mmap_mode='c')
+    except (OSError, ValueError):
+        return None
+    try:
+        if time.time()-os.stat(path).st_mtime > TOUCH_SECONDS:
+            os.utime(path)
+    except OSError:
+        pass
+    return data.view(np.ndarray)
+
+
+def store(path, data):
+    """Save a decoded field to path, atomically."""
+    global _stored
+    if np.ma.isMaskedArray(data) or not isinstance(data, np.ndarray) or data.dtype.hasobject:
+        return
+    # The prefetch threads (hafsgraph.prefetch) may store the same field
+    tmp = '{0}.tmp.{1}.{2}'.format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(data))
+        os.replace(tmp, path)
+    except OSError as e:
+        print('WARNING: cannot cache {0}: {1}'.format(path, e))
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    if not _stored:
+        _stored = True
+        atexit.register(release)
+
+
+class DiskMessage(object):
+    """Proxy for a grib2io message whose decoded data comes from the cache."""
+
+    def __init__(self, cfile, select, index, msg):
+        self._cfile = cfile
+        self._select = select
+        self._index = index
+        self._msg = msg
+
+    @property
+    def data(self):
+        path = entry_path(self._cfile.root, self._cfile.version, self._select, self._index, self._msg)
+        data = load(path)
+        if data is None:
+            data = self._msg.data
+            store(path, data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._msg, name)
+
+
+class DiskFile(object):
+    """Proxy for an open grib2io file whose messages are decoded through the cache."""
+
+    def __init__(self, root, version, grb):
+        self.root = root
+        self.version = version
+        self._grb = grb
+
+    def select(self, **kwargs):
+        return [DiskMessage(self, kwargs, n, msg) for n, msg in enumerate(self._grb.select(**kwargs))]
+
+    def __getattr__(self, name):
+        return getattr(self._grb, name)
+
+
+def entries(root):
+    """Return [(last use, bytes, path)] of the cached fields in root."""
+    result = []
+    for entry in os.scandir(root):
+        if entry.name.endswith('.npy'):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, entry.path))
+    return result
+
+
+def evict(root, max_bytes, report=None):
+    """Remove the least recently used fields of root until they hold at most max_bytes."""
+    fd = os.open(os.path.join(root, '.lock'), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another process is evicting
+            return 0
+        cached = sorted(entries(root))
+        total = sum(size for used, size, path in cached)
+        removed = 0
+        for used, size, path in cached:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+    finally:
+        os.close(fd)
+    if report:
+        print('Removed {0} cached fields from {1}, {2:.1f} GB left'.format(removed, root, total/1e9), file=report)
+    return removed
+
+
+def release():
+    """Evict the fields over the budget, after this process has added some."""
+    root = cache_dir()
+    if root and os.path.isdir(root):
+        evict(root, budget())
+
+
+def install():
+    """Route grib2io.open through the field cache of $FIELDcache, once."""
+    global _installed
+    root = cache_dir()
+    if _installed or not root:
+        return
+    try:
+        import grib2io
+    except ImportError:
+        return
+    _installed = True
+    os.makedirs(root, exist_ok=True)
+    grib2io_open = grib2io.open
+
+    def open_cached(filename, mode='r', **kwargs):
+        grb = grib2io_open(filename, mode=mode, **kwargs)
+        if mode != 'r':
+            return grb
+        return DiskFile(root, file_version(filename), grb)
+
+    grib2io.open = open_cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    show = sub.add_parser('show', help='print the size of the cache')
+    show.add_argument('--dir', default=cache_dir(), help='cache directory (default: $FIELDcache)')
+    clean = sub.add_parser('clean', help='remove the least recently used fields')
+    clean.add_argument('--dir', default=cache_dir(), help='cache directory (default: $FIELDcache)')
+    clean.add_argument('--max-gb', type=float, default=budget()/1e9, help='keep up to this many GB (default: $FIELDcacheGB)')
+    args = parser.parse_args()
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+    if not args.dir:
+        sys.exit('ERROR: --dir or $FIELDcache is required')
+    if not os.path.isdir(args.dir):
+        print('No field cache '+args.dir)
+        return
+
+    if args.action == 'clean':
+        evict(args.dir, int(args.max_gb*1e9), report=sys.stdout)
+        return
+    cached = entries(args.dir)
+    names = {}
+    for used, size, path in cached:
+        name = os.path.basename(path).split('.')[1]
+        names[name] = names.get(name, 0)+size
+    for name, size in sorted(names.items(), key=lambda item: -item[1])[:20]:
+        print('{0:12s} {1:10.1f} MB'.format(name, size/1e6))
+    print('{0} cached fields, {1:.2f} GB in {2}'.format(len(cached), sum(e[1] for e in cached)/1e9, args.dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+"""Per-node server that decodes each GRIB2 field once and shares it between the plotting processes.
+
+Usage: python3 -m hafsgraph.fieldserver serve [--socket PATH] [--max-gb 16] [--idle 600]
+       python3 -m hafsgraph.fieldserver stats|stop [--socket PATH]
+
+The server listens on the local (Unix) socket $FIELDserver.  When it is set,
+config.load() calls install(), which routes grib2io.open through the server:
+the scripts still select their messages from the file, but the .data of a
+message is decoded by the server, once per node, into a
+multiprocessing.shared_memory block, which the script gets as a read-only
+NumPy array on that block, without a copy.  The NLAT and ELON coordinates are
+copied, since most scripts shift the longitudes in place.  When the server
+cannot be reached, or fails on a field, the script decodes the field itself.
+
+The first process of a node that finds no server starts one in the
+background; it exits after --idle seconds without requests.  The blocks are
+kept least recently used first evicted once they hold more than --max-gb
+($FIELDserverGB, default a quarter of the memory of the node).  A block
+evicted while a script still reads it stays mapped until that script is
+done with it.
+
+Protocol: one JSON object per line each way, e.g.
+{"op": "get", "path": ..., "select": {"shortName": "UGRD", "level": "850 mb"}, "index": 0}
+answered by {"name": <shared memory name>, "shape": [ny, nx], "dtype": "float32"},
+or {"error": ...}.  {"op": "stats"} and {"op": "stop"} are answered with the
+cache statistics.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import weakref
+import argparse
+import threading
+import subprocess
+import socketserver
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+COPY_FIELDS = ('NLAT', 'ELON')
+
+_client = None
+_installed = False
+
+
+def socket_path():
+    """Return the socket of the field server, None when it is off."""
+    return os.environ.get('FIELDserver') or None
+
+
+def memory_cap():
+    """Return the bytes of fields the server keeps, $FIELDserverGB or a quarter of the node memory."""
+    if os.environ.get('FIELDserverGB'):
+        return int(float(os.environ['FIELDserverGB'])*1e9)
+    return os.sysconf('SC_PHYS_PAGES')*os.sysconf('SC_PAGE_SIZE')//4
+
+
+def field_key(path, select, index):
+    """Return the cache key of a message: the version of its file, its selection and its index."""
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns, tuple(sorted((str(k), str(v)) for k, v in select.items())), index)
+
+
+class Fields(object):
+    """Decoded fields in shared memory blocks, least recently used first evicted above max_bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.files = {}
+        self.hits = self.misses = self.evicted = 0
+        self.decode_seconds = 0.0
+        self.last_request = time.time()
+
+    def open(self, path):
+        """Return [version, lock, grib2io file] of path, reopened when the file has changed."""
+        import grib2io
+        version = os.stat(path)
+        version = (version.st_size, version.st_mtime_ns)
+        old = None
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is None or entry[0] != version:
+                old = entry
+                entry = [version, threading.Lock(), grib2io.open(path, mode='r')]
+                self.files[path] = entry
+        if old is not None:
+            # Once its reads under way are done
+            with old[1]:
+                old[2].close()
+                old[2] = None
+        return entry
+
+    def get(self, path, select, index):
+        """Return (shared memory name, shape, dtype) of a message, decoding it on first use."""
+        key = field_key(path, select, index)
+        with self.lock:
+            self.last_request = time.time()
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                with self.lock:
+                    if key in self.blocks:
+                        self.blocks.move_to_end(key)
+                        self.hits += 1
+                        shm, shape, dtype = self.blocks[key]
+                        return shm.name, shape, dtype
+                tstart = time.time()
+                data = None
+                while data is None:
+                    entry = self.open(key[0])
+                    with entry[1]:
+                        # Closed meanwhile by open() in another thread, the file having changed again
+                        if entry[2] is not None:
+                            data = np.ascontiguousarray(entry[2].select(**select)[index].data)
+                shm = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+                np.ndarray(data.shape, data.dtype, buffer=shm.buf)[...] = data
+                with self.lock:
+                    self.misses += 1
+                    self.decode_seconds += time.time()-tstart
+                    self.blocks[key] = (shm, list(data.shape), data.dtype.str)
+                    self.nbytes += shm.size
+                    self.evict()
+                return shm.name, list(data.shape), data.dtype.str
+        finally:
+            # Also when decoding failed; a later request made its own lock
+            with self.lock:
+                if self.key_locks.get(key) is key_lock:
+                    del self.key_locks[key]
+
+    def evict(self):
+        # Called with self.lock held, the newest block is always kept
+        while self.nbytes > self.max_bytes and len(self.blocks) > 1:
+            key, (shm, shape, dtype) = self.blocks.popitem(last=False)
+            self.nbytes -= shm.size
+            self.evicted += 1
+            shm.close()
+            shm.unlink()
+
+    def stats(self):
+        with self.lock:
+            return {'fields': len(self.blocks), 'gb': round(self.nbytes/1e9, 3), 'hits': self.hits, 'misses': self.misses,
+                    'evicted': self.evicted, 'decode_seconds': round(self.decode_seconds, 1)}
+
+    def clear(self):
+        with self.lock:
+            while self.blocks:
+                key, (shm, shape, dtype) = self.blocks.popitem()
+                shm.close()
+                shm.unlink()
+            self.nbytes = 0
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Answer the requests of one client connection."""
+
+    def handle(self):
+        fields = self.server.fields
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get('op')
+                if op == 'get':
+                    name, shape, dtype = fields.get(request['path'], request.get('select', {}), request.get('index', 0))
+                    reply = {'name': name, 'shape': shape, 'dtype': dtype}
+                elif op in ('stats', 'stop'):
+                    reply = fields.stats()
+                else:
+                    reply = {'error': 'unknown op {0}'.format(op)}
+            except Exception as e:
+                op = None
+                reply = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+            self.wfile.write((json.dumps(reply)+'\n').encode())
+            self.wfile.flush()
+            if op == 'stop':
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path, max_bytes, idle):
+    """Run the server on the socket path until stopped or idle for idle seconds."""
+    from hafsgraph import stagein
+    from hafsgraph import fieldcache
+    stagein.install()
+    fieldcache.install()
+    if os.path.exists(path):
+        os.remove(path)
+    server = Server(path, Handler)
+    server.fields = Fields(max_bytes)
+
+    def watch_idle():
+        while True:
+            time.sleep(min(idle, 30))
+            if time.time()-server.fields.last_request > idle:
+                server.shutdown()
+                return
+
+    threading.Thread(target=watch_idle, daemon=True).start()
+    print('Field server on {0}, up to {1:.1f} GB'.format(path, max_bytes/1e9), flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        print('Field server done: {0}'.format(json.dumps(server.fields.stats())), flush=True)
+        server.fields.clear()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def connect(path, start=True, wait=30):
+    """Return a socket connected to the server of path, starting the server when there is none."""
+    deadline = time.time()+wait
+    started = False
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            return sock
+        except OSError:
+            sock.close()
+        if not start or time.time() > deadline:
+            return None
+        if not started:
+            started = True
+            # One process of the node starts the server, the others wait for it
+            fd = os.open(path+'.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                log = open(path+'.log', 'a')
+                subprocess.Popen([sys.executable, '-m', 'hafsgraph.fieldserver', 'serve', '--socket', path],
+                                 stdout=log, stderr=subprocess.STDOUT, start_new_session=True, close_fds=True)
+            except BlockingIOError:
+                pass
+            finally:
+                os.close(fd)
+        time.sleep(0.2)
+
+
+def attach(name, shape, dtype):
+    """Return a read-only array on the shared memory block name, kept mapped while it is in use."""
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 an attached block is registered with the
+        # resource tracker, which would unlink it when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    data = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+    data.flags.writeable = False
+    weakref.finalize(data, shm.close)
+    return data
+
+
+class Client(object):
+    """Connection of a plotting process to the field server."""
+
+    def __init__(self, path):
+        self.path = path
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def request(self, request):
+        with self.lock:
+            if self.sock is None:
+                self.sock = connect(self.path)
+                if self.sock is None:
+                    raise OSError('no field server on '+self.path)
+                self.rfile = self.sock.makefile('rb')
+            try:
+                self.sock.sendall((json.dumps(request)+'\n').encode())
+                reply = json.loads(self.rfile.readline())
+            except (OSError, ValueError):
+                self.sock.close()
+                self.sock = None
+                raise OSError('lost the field server on '+self.path)
+        if 'error' in reply:
+            raise OSError(reply['error'])
+        return reply
+
+    def get(self, path, select, index):
+        reply = self.request({'op': 'get', 'path': os.path.realpath(path), 'select': select, 'index': index})
+        return attach(reply['name'], reply['shape'], reply['dtype'])
+
+
+class ServedMessage(object):
+    """Proxy for a grib2io message whose data comes from the field server."""
+
+    def __init__(self, path, select, index, msg):
+        self._path = path
+        self._select = select
+        self._index = index
+        self._msg = msg
+
+    @property
+    def data(self):
+        try:
+            data = _client.get(self._path, self._select, self._index)
+        except (OSError, TypeError) as e:
+            print('WARNING: decoding {0} locally: {1}'.format(self._select, e))
+            return self._msg.data
+        if self._select.get('shortName') in COPY_FIELDS:
+            data = data.copy()
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._msg, name)
+
+
+class ServedFile(object):
+    """Proxy for an open grib2io file whose messages are decoded by the field server."""
+
+    def __init__(self, path, grb):
+        self._path = path
+        self._grb = grb
+
+    def select(self, **kwargs):
+        return [ServedMessage(self._path, kwargs, n, msg) for n, msg in enumerate(self._grb.select(**kwargs))]
+
+    def __getattr__(self, name):
+        return getattr(self._grb, name)
+
+
+def install():
+    """Route grib2io.open through the field server of $FIELDserver, once."""
+    global _client, _installed
+    if _installed or not socket_path():
+        return
+    try:
+        import grib2io
+    except ImportError:
+        return
+    _installed = True
+    _client = Client(socket_path())
+    grib2io_open = grib2io.open
+
+    def open_served(filename, mode='r', **kwargs):
+        grb = grib2io_open(filename, mode=mode, **kwargs)
+        return ServedFile(filename, grb) if mode == 'r' else grb
+
+    grib2io.open = open_served
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    for action in ('serve', 'stats', 'stop'):
+        p = sub.add_parser(action)
+        p.add_argument('--socket', default=socket_path(), help='local socket of the server (default: $FIELDserver)')
+        if action == 'serve':
+            p.add_argument('--max-gb', type=float, default=memory_cap()/1e9, help='memory for the decoded fields')
+            p.add_argument('--idle', type=float, default=600, help='exit after this many seconds without requests')
+    args = parser.parse_args()
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+    if not args.socket:
+        sys.exit('ERROR: --socket or $FIELDserver is required')
+
+    if args.action == 'serve':
+        serve(args.socket, int(args.max_gb*1e9), args.idle)
+        return
+    sock = connect(args.socket, start=False, wait=0)
+    if sock is None:
+        print('No field server on '+args.socket)
+        return
+    client = Client(args.socket)
+    client.sock, client.rfile = sock, sock.makefile('rb')
+    print(json.dumps(client.request({'op': args.action})))
+
+
+if __name__ == '__main__':
+    main()
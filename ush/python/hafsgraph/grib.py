@@ -0,0 +1,226 @@
+"""Cached access to HAFS GRIB2 files shared by every plot in one process.
+
+The plotting scripts call ``grib2io.open(...)`` and then
+``grb.select(...)[n].data`` for each field they need.  When several scripts
+run in the same interpreter (see worker.py), install() replaces
+``grib2io.open`` so that each file is opened once and each message is decoded
+once; later requests get a copy of the decoded array, so scripts that modify
+their arrays in place (e.g. the longitude wrap) cannot corrupt the cache.
+Code that only reads the fields (hafsgraph.levels, the prefetching) gets
+the cached arrays themselves, read-only, within ``with shared():``.
+
+The decoded fields are kept up to $GRIBcacheMB megabytes (default 2048),
+least recently used dropped first; release() closes the files no later
+product reads.  carried_mb() is the memory of the fields kept from earlier
+products and not used by the current one (see new_product()), which is not
+part of its peak memory.
+
+The fields may be decoded ahead from another thread (hafsgraph.prefetch);
+a file is read by one thread at a time.  reads() lists the messages the
+plotting code, in the main thread, has read, and stats has the fields
+decoded ahead it used, the decoding seconds they saved it and the seconds
+it waited for the other thread.
+"""
+
+import os
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+
+import grib2io
+
+DEFAULT_MB = 2048
+
+_grib2io_open = grib2io.open
+_files = {}
+_lock = threading.Lock()
+_local = threading.local()
+_reads = []
+_ahead = {}
+# (path, key) -> (CachedFile, bytes, product that last used it in the main thread)
+_lru = OrderedDict()
+_held = 0
+_product = 0
+stats = dict(used=0, saved=0., waited=0.)
+
+
+def max_bytes():
+    """Return the bytes of decoded fields kept."""
+    return int(float(os.environ.get('GRIBcacheMB') or DEFAULT_MB)*1e6)
+
+
+@contextlib.contextmanager
+def shared():
+    """Return the cached arrays, read-only, instead of copies from .data within the block."""
+    _local.shared = True
+    try:
+        yield
+    finally:
+        _local.shared = False
+
+
+class CachedMessage:
+    """Proxy for a grib2io message whose decoded data is kept in memory."""
+
+    def __init__(self, cfile, key, msg):
+        self._cfile = cfile
+        self._key = key
+        self._msg = msg
+
+    @property
+    def data(self):
+        data = self._cfile.decode(self._key, self._msg)
+        if getattr(_local, 'shared', False):
+            return data
+        return data.copy()
+
+    def __getattr__(self, name):
+        return getattr(self._msg, name)
+
+
+class CachedFile:
+    """Proxy for an open grib2io file that memoizes selections and decoded data."""
+
+    def __init__(self, path):
+        self.path = path
+        self._grb = _grib2io_open(path, mode='r')
+        self._selections = {}
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    def select(self, **kwargs):
+        key = tuple(sorted(kwargs.items()))
+        with self._lock:
+            if key not in self._selections:
+                msgs = self._grb.select(**kwargs)
+                self._selections[key] = [CachedMessage(self, key + (('index', n),), msg) for n, msg in enumerate(msgs)]
+        return list(self._selections[key])
+
+    def decode(self, key, msg):
+        main = threading.current_thread() is threading.main_thread()
+        if main:
+            _reads.append((self.path, dict(key[:-1]), key[-1][1]))
+        tstart = time.time()
+        with self._lock:
+            if main:
+                stats['waited'] += time.time()-tstart
+            # May be dropped by remember() in another thread meanwhile
+            data = self._fields.get(key)
+            if data is None:
+                tdecode = time.time()
+                data = msg.data
+                if hasattr(data, 'flags'):
+                    data.flags.writeable = False
+                self._fields[key] = data
+                if not main:
+                    _ahead[(self.path, key)] = time.time()-tdecode
+            elif main and (self.path, key) in _ahead:
+                stats['used'] += 1
+                stats['saved'] += _ahead.pop((self.path, key))
+        remember(self, key, data, main)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._grb, name)
+
+    def close(self):
+        self._selections.clear()
+        self._fields.clear()
+        self._grb.close()
+
+
+def remember(cfile, key, data, main):
+    """Mark a field as the most recently used, and drop the least recently used ones over max_bytes()."""
+    global _held
+    entry = (cfile.path, key)
+    with _lock:
+        if entry in _lru:
+            size, product = _lru[entry][1:]
+            _lru.move_to_end(entry)
+        else:
+            size, product = int(getattr(data, 'nbytes', 0)), -1
+            _held += size
+        _lru[entry] = (cfile, size, _product if main else product)
+        cap = max_bytes()
+        while _held > cap and len(_lru) > 1:
+            (path, old_key), (old_file, old_size, old_product) = _lru.popitem(last=False)
+            old_file._fields.pop(old_key, None)
+            _ahead.pop((path, old_key), None)
+            _held -= old_size
+
+
+def forget(path):
+    """Drop the fields of a file from the least recently used list."""
+    global _held
+    with _lock:
+        for entry in [entry for entry in _lru if entry[0] == path]:
+            _held -= _lru.pop(entry)[1]
+            _ahead.pop(entry, None)
+
+
+def open(filename, mode='r', **kwargs):
+    """Drop-in replacement for grib2io.open that reuses already opened files."""
+    if mode != 'r':
+        return _grib2io_open(filename, mode=mode, **kwargs)
+    path = os.path.realpath(filename)
+    with _lock:
+        if path not in _files:
+            _files[path] = CachedFile(path)
+    return _files[path]
+
+
+def reads():
+    """Return the messages the plotting code has read since the last call, [(path, select, index)]."""
+    result = []
+    for read in _reads:
+        if read not in result:
+            result.append(read)
+    del _reads[:]
+    return result
+
+
+def reset_stats():
+    """Start counting the fields decoded ahead used by the plotting code, e.g. for the next product."""
+    stats.update(used=0, saved=0., waited=0.)
+
+
+def new_product():
+    """Start a product: reset stats and reads(), and count the fields it uses."""
+    global _product
+    reset_stats()
+    reads()
+    with _lock:
+        _product += 1
+
+
+def carried_mb():
+    """Return the MB of the fields kept that the current product has not used."""
+    with _lock:
+        return sum(size for cfile, size, product in _lru.values() if product != _product)/1e6
+
+
+def release(keep):
+    """Close the files whose path keep(path) is false, and drop their fields."""
+    with _lock:
+        paths = [path for path in _files if not keep(path)]
+    for path in paths:
+        forget(path)
+        _files.pop(path).close()
+
+
+def install():
+    """Route grib2io.open through the cache for the rest of this process."""
+    grib2io.open = open
+
+
+def clear():
+    """Close every cached file and drop its decoded fields."""
+    global _held
+    for cfile in _files.values():
+        cfile.close()
+    _files.clear()
+    _ahead.clear()
+    _lru.clear()
+    _held = 0
+    del _reads[:]
@@ -0,0 +1,175 @@
+"""Grid coordinates of the HAFS GRIB2 files, computed once per grid definition.
+
+The atmos scripts decode the 2D NLAT/ELON messages of their file and wrap the
+longitudes for Cartopy; the GOES and SSMIS scripts build the coordinates from
+the grid definition template.  coordinates(grb) and from_template(template)
+return the Grid of a grid definition instead, keyed by a hash of the GRIB2
+grid definition template (number and values).  The parent domain has the
+same grid at every fhhh and in every cycle of a configuration, so its
+coordinates are decoded once and then reused; the moving storm nest has a
+new template, hence a new Grid, in every file.
+
+A Grid has the 2D lat and lon, regular (lat constant along the rows and lon
+along the columns), the 1D lat1d and lon1d and the spacing dlat and dlon of
+a regular grid, and plate_carree(), the longitudes of the scripts for
+Cartopy's PlateCarree projection.  The Grids are kept in the process (for
+hafsgraph.worker) and, when $GRIDcache is set, across tasks and cycles in
+<hash>.npz files holding the 1D coordinates of a regular grid, or the 2D
+ones of any other; at most MAX_ENTRIES, least recently used removed first.
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+MAX_ENTRIES = 2000
+
+_grids = {}
+
+
+def template_key(template, number=0, source='template'):
+    """Return the hash of a grid definition template, and of what the coordinates are made from."""
+    number = int(getattr(number, 'value', number))
+    text = repr((source, number, [int(v) for v in template]))
+    return hashlib.sha1(text.encode()).hexdigest()[:20]
+
+
+class Grid(object):
+    """Coordinates of a grid."""
+
+    def __init__(self, lat, lon):
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.lat.flags.writeable = False
+        self.lon.flags.writeable = False
+        self.regular = self.lat.ndim == 2 and bool(np.all(self.lat == self.lat[:, :1]) and np.all(self.lon == self.lon[:1, :]))
+        self.lat1d = self.lon1d = self.dlat = self.dlon = None
+        if self.regular:
+            self.lat1d = self.lat[:, 0]
+            self.lon1d = self.lon[0, :]
+            if self.lat1d.size > 1:
+                self.dlat = float(np.mean(np.diff(self.lat1d)))
+            if self.lon1d.size > 1:
+                self.dlon = float(np.mean(np.mod(np.diff(self.lon1d), 360.)))
+        self._plate_carree = {}
+
+    def plate_carree(self, offset=180.):
+        """Return (lat, lon, lon_offset) for Cartopy's PlateCarree(lon_offset), as the scripts compute them.
+
+        A grid reaching to within 10 degrees of 360 E has its longitudes
+        moved to -180 to 180 and lon_offset 0, any other lon_offset offset.
+        The arrays are copies, the scripts may change them.
+        """
+        if offset not in self._plate_carree:
+            lon = self.lon.copy()
+            if abs(np.max(lon) - 360.) < 10.:
+                lon[lon>180] = lon[lon>180] - 360.
+                lon_offset = 0.
+            else:
+                lon_offset = offset
+            self._plate_carree[offset] = (lon - lon_offset, lon_offset)
+        lon, lon_offset = self._plate_carree[offset]
+        return self.lat.copy(), lon.copy(), lon_offset
+
+
+def cache_path(key):
+    """Return the file of a Grid in $GRIDcache, None when it is not set."""
+    root = os.environ.get('GRIDcache')
+    return os.path.join(root, key+'.npz') if root else None
+
+
+def load(key):
+    """Return the Grid of key from this process or $GRIDcache, None when it is not there."""
+    if key in _grids:
+        return _grids[key]
+    path = cache_path(key)
+    if not path:
+        return None
+    try:
+        with np.load(path) as f:
+            if 'lat1d' in f:
+                lat1d, lon1d = f['lat1d'], f['lon1d']
+                lat = np.repeat(lat1d[:, None], lon1d.size, axis=1)
+                lon = np.repeat(lon1d[None, :], lat1d.size, axis=0)
+            else:
+                lat, lon = f['lat'], f['lon']
+        os.utime(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    _grids[key] = Grid(lat, lon)
+    return _grids[key]
+
+
+def trim(root):
+    """Remove the least recently used Grids of root over MAX_ENTRIES."""
+    entries = []
+    for entry in os.scandir(root):
+        if entry.name.endswith('.npz'):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+    for used, path in sorted(entries)[:max(0, len(entries)-MAX_ENTRIES)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def save(key, grid):
+    """Keep a Grid in this process and in $GRIDcache."""
+    _grids[key] = grid
+    path = cache_path(key)
+    if not path:
+        return
+    tmp = '{0}.tmp.{1}'.format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            if grid.regular:
+                np.savez(f, lat1d=grid.lat1d, lon1d=grid.lon1d)
+            else:
+                np.savez(f, lat=grid.lat, lon=grid.lon)
+        os.replace(tmp, path)
+        trim(os.path.dirname(path))
+    except OSError as e:
+        print('WARNING: cannot cache the grid {0}: {1}'.format(path, e))
+
+
+def coordinates(grb, lat_name='NLAT', lon_name='ELON'):
+    """Return the Grid of the lat_name/lon_name messages of an open grib2io file, decoded once per grid definition."""
+    from hafsgraph import quicklook
+    msg = grb.select(shortName=lat_name)[0]
+    # Previews decimate the fields of any grid, not only the templates of lat-lon grids
+    source = '{0}/{1}/{2}'.format(lat_name, lon_name, quicklook.step())
+    key = template_key(msg.gridDefinitionTemplate, getattr(msg, 'gridDefinitionTemplateNumber', 0), source)
+    grid = load(key)
+    if grid is None:
+        grid = Grid(msg.data, grb.select(shortName=lon_name)[0].data)
+        save(key, grid)
+    return grid
+
+
+def from_template(template, number=0):
+    """Return the Grid of a lat-lon grid definition template (3.0), as the GOES and SSMIS scripts build it."""
+    key = template_key(template, number)
+    grid = load(key)
+    if grid is not None:
+        return grid
+    nlon = template[7]
+    nlat = template[8]
+    blat = template[11]/1.e6
+    blon = template[12]/1.e6
+    elat = template[14]/1.e6
+    elon = template[15]/1.e6
+    lat1d = np.linspace(blat, elat, nlat)
+    if elon > blon:
+        lon1d = np.linspace(blon, elon, nlon)
+    else:
+        lon1d = np.linspace(blon, 360.+elon, nlon)
+        lon1d = np.mod(lon1d, 360.)
+    [lon, lat] = np.meshgrid(lon1d, lat1d)
+    grid = Grid(lat, lon)
+    save(key, grid)
+    return grid
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+"""Record and look up the measured wall time and peak memory of graphics tasks across cycles.
+
+Usage: python3 -m hafsgraph.history run --task plot_crs_sn_wind.py:storm:1003 -- driverAtmos.sh ...
+       python3 -m hafsgraph.history show
+       python3 -m hafsgraph.history compact
+
+The history is one append-only csv file, task_history.csv, in $HISTgraph
+(default: $COMgraph/history), with one "script,domain,level,seconds,time,rss"
+record per finished task, rss being its peak resident memory in MB (empty
+in records written before it was measured).  The memory of a product is
+looked up per script and domain, over all its levels.
+"""
+
+import os
+import sys
+import time
+import resource
+import argparse
+import subprocess
+from collections import defaultdict
+
+HISTORY_FILE = 'task_history.csv'
+KEEP = 10
+
+
+def history_dir():
+    """Return the history directory, or None when neither HISTgraph nor COMgraph is set."""
+    if os.environ.get('HISTgraph'):
+        return os.environ['HISTgraph']
+    if os.environ.get('COMgraph'):
+        return os.path.join(os.environ['COMgraph'], 'history')
+    return None
+
+
+def history_file():
+    hist_dir = history_dir()
+    return os.path.join(hist_dir, HISTORY_FILE) if hist_dir else None
+
+
+def key(script, domain=None, level=None):
+    """Return the history key of a task."""
+    return (script, str(domain or '-'), str(level or '-'))
+
+
+def record(script, domain, level, seconds, rss=None):
+    """Append one measurement to the history. Does nothing when no history directory is set."""
+    path = history_file()
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = '{0},{1},{2},{3:.2f},{4:d},{5}\n'.format(*key(script, domain, level), seconds, int(time.time()),
+                                                    '' if rss is None else '{0:.0f}'.format(rss))
+    # One short write per record keeps concurrent appends from interleaving
+    with open(path, 'a') as f:
+        f.write(line)
+
+
+def load(path=None):
+    """Return {key: [seconds, ...]} with the most recent KEEP measurements of each task."""
+    path = path or history_file()
+    hist = defaultdict(list)
+    if not path or not os.path.exists(path):
+        return hist
+    with open(path, 'rt') as f:
+        for line in f:
+            fields = line.strip().split(',')
+            if len(fields) < 4:
+                continue
+            try:
+                hist[tuple(fields[0:3])].append(float(fields[3]))
+            except ValueError:
+                continue
+    for k in hist:
+        hist[k] = hist[k][-KEEP:]
+    return hist
+
+
+def load_memory(path=None):
+    """Return {(script, domain): [rss MB, ...]} with the most recent KEEP measurements of each task."""
+    path = path or history_file()
+    mem = defaultdict(list)
+    if not path or not os.path.exists(path):
+        return mem
+    with open(path, 'rt') as f:
+        for line in f:
+            fields = line.strip().split(',')
+            if len(fields) < 6 or not fields[5]:
+                continue
+            try:
+                mem[tuple(fields[0:3])].append(float(fields[5]))
+            except ValueError:
+                continue
+    result = defaultdict(list)
+    for k, values in mem.items():
+        result[k[0:2]] += values[-KEEP:]
+    return result
+
+
+def peak_memory(mem, script, domain=None):
+    """Return the largest recorded peak memory (MB) of a script and domain, or None without history."""
+    values = mem.get(key(script, domain)[0:2])
+    return max(values) if values else None
+
+
+def reset_peak():
+    """Reset the peak resident memory of this process, where Linux allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """Return the peak resident memory (MB) of this process since reset_peak()."""
+    try:
+        with open('/proc/self/status', 'rt') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024.
+    except (OSError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    return values[n//2] if n % 2 else 0.5*(values[n//2-1]+values[n//2])
+
+
+def estimate(hist, script, domain=None, level=None):
+    """Return the median recorded wall time of a task, or None without history."""
+    values = hist.get(key(script, domain, level))
+    return median(values) if values else None
+
+
+def compact(path=None):
+    """Rewrite the history keeping the most recent KEEP records of each task."""
+    path = path or history_file()
+    if not path or not os.path.exists(path):
+        return
+    records = defaultdict(list)
+    with open(path, 'rt') as f:
+        for line in f:
+            fields = line.strip().split(',')
+            if len(fields) >= 4:
+                records[tuple(fields[0:3])].append(line)
+    tmp = path+'.tmp.'+str(os.getpid())
+    with open(tmp, 'wt') as f:
+        for lines in records.values():
+            f.writelines(lines[-KEEP:])
+    os.replace(tmp, path)
+
+
+def run(task, cmd):
+    """Run a command, record its wall time and peak memory under task (script:domain:level) and return its exit status.
+
+    The peak memory is that of the largest process of the command.
+    """
+    script, _, rest = task.partition(':')
+    domain, _, level = rest.partition(':')
+    tstart = time.time()
+    proc = subprocess.Popen(cmd)
+    pid, status, usage = os.wait4(proc.pid, 0)
+    status = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    proc.returncode = status
+    seconds = time.time()-tstart
+    rss = usage.ru_maxrss/1024.
+    print('{0} finished in {1:.2f} s, peak memory {2:.0f} MB, with status {3}'.format(task, seconds, rss, status))
+    if status == 0:
+        record(script, domain or None, level or None, seconds, rss)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    prun = sub.add_parser('run', help='run a command and record its wall time')
+    prun.add_argument('--task', required=True, help='script:domain:level of the task')
+    prun.add_argument('cmd', nargs=argparse.REMAINDER, help='command to run, after --')
+    sub.add_parser('show', help='print the median wall time and the peak memory of every task')
+    sub.add_parser('compact', help='drop all but the most recent records of each task')
+    args = parser.parse_args()
+
+    if args.action == 'run':
+        cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+        sys.exit(run(args.task, cmd))
+    elif args.action == 'show':
+        mem = load_memory()
+        for k, values in sorted(load().items()):
+            rss = peak_memory(mem, k[0], k[1])
+            print('{0:36s} {1:8s} {2:6s} {3:8.2f} s {4:>8s} MB ({5} runs)'.format(
+                  *k, median(values), '-' if rss is None else '{0:.0f}'.format(rss), len(values)))
+    elif args.action == 'compact':
+        compact()
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
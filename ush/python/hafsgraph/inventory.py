@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""Catalog the HAFS output once and prune the graphics tasks that cannot run.
+
+Usage: python3 -m hafsgraph.inventory show --storm FIONA --stormid 07L --ymdh 2022092000
+       python3 -m hafsgraph.inventory placeholder --storm FIONA --stormid 07L --ymdh 2022092000 plot_azimuth_wind.py:storm:f126 ...
+
+COMhafs is listed once, and the forecast hours of the ATCF track are read
+once.  A task is pruned when one of its input files is missing or empty, or
+when its product needs the storm center (registry field 'track') and the
+track has no record at its forecast hour.  Products with track: placeholder
+get the "No track record found at this time" figure their scripts would
+have drawn; all of them are drawn by a single placeholder process instead of
+one plotting script each.  Products with track: skip write nothing then.
+"""
+
+import os
+import sys
+import argparse
+from collections import namedtuple
+
+from hafsgraph import tasklog
+from hafsgraph import products
+
+Inventory = namedtuple('Inventory', ['files', 'track_hours', 'ocean'])
+
+
+def scan(reg, storm):
+    """List COMhafs and the forecast hours of the ATCF track."""
+    files = {}
+    try:
+        for entry in os.scandir(storm.com):
+            if entry.is_file():
+                files[entry.name] = entry.stat().st_size
+    except OSError:
+        pass
+    track_hours = set()
+    trak = reg['files']['trak'].format(stormid=storm.id.lower(), ymdh=storm.ymdh, model=storm.model.lower())
+    if files.get(trak):
+        with open(os.path.join(storm.com, trak), 'rt') as f:
+            for line in f:
+                fields = line.split(',')
+                if len(fields) > 5 and fields[5].strip().isdigit():
+                    track_hours.add(int(fields[5]))
+    ocean = 'mom6'
+    for name in files:
+        parts = name.split('.')
+        if name.endswith('f006.nc') and ('hycom' in parts or 'mom6' in parts):
+            ocean = 'hycom.3z' if 'hycom' in parts else 'mom6'
+            break
+    return Inventory(files, track_hours, ocean)
+
+
+def needs_track(reg, task):
+    """Return the track field of a task's product when the task needs the storm center, else None."""
+    track = products.product(reg, task)['track']
+    if track and task.domain in ('storm', None) and task.fhhh:
+        return track
+    return None
+
+
+def check(reg, task, inv):
+    """Return 'run', 'missing' (an input file is missing), 'placeholder' or 'skip' (no track record)."""
+    for path in products.input_files(reg, task, inv.ocean):
+        if not inv.files.get(os.path.basename(path)):
+            return 'missing'
+    track = needs_track(reg, task)
+    if track and int(task.fhhh[1:]) not in inv.track_hours:
+        return track
+    return 'run'
+
+
+def prune(reg, task_list, inv, report=sys.stderr):
+    """Return the runnable tasks and the tasks that get a placeholder figure.
+
+    Tasks with missing inputs, or with track: skip and no track record, are dropped.
+    """
+    runnable, placeholders = [], []
+    counts = {}
+    for task in task_list:
+        status = check(reg, task, inv)
+        counts[status] = counts.get(status, 0)+1
+        if status == 'run':
+            runnable.append(task)
+        elif status == 'placeholder':
+            placeholders.append(task)
+    if report:
+        print('Inventory: {0} files, track at {1} hours; tasks: {2}'.format(
+              len(inv.files), len(inv.track_hours), ', '.join('{0} {1}'.format(n, s) for s, n in sorted(counts.items()))), file=report)
+    return runnable, placeholders
+
+
+def placeholder_command(reg, task_list):
+    """Return the cmdfile line that draws the placeholder figures of task_list."""
+    storm = task_list[0].storm
+    args = ['--model', storm.model, '--storm', storm.name, '--stormid', storm.id, '--ymdh', storm.ymdh, '--com', storm.com]
+    args += ['{0}:{1}:{2}'.format(t.script, t.domain, t.fhhh) for t in task_list]
+    name = products.log_name(task_list[0]._replace(domain='storm', fhhh='all'), 'placeholder')
+    return tasklog.command(name, 'python3 -m hafsgraph.inventory', 'placeholder '+' '.join(args))
+
+
+def draw_placeholders(task_list, out_dir):
+    """Draw the "No track record" figure of each task into out_dir."""
+    import matplotlib
+    matplotlib.use('module://hafsgraph.agg256')
+    import matplotlib.pyplot as plt
+    os.makedirs(out_dir, exist_ok=True)
+    for task in task_list:
+        storm = task.storm
+        fig_prefix = storm.name.upper()+storm.id.upper()+'.'+storm.ymdh+'.'+storm.model
+        name = os.path.splitext(task.script)[0][len('plot_'):]
+        fig_name = fig_prefix+'.storm.'+name+'.'+task.fhhh.lower()+'.png'
+        fig, (ax1) = plt.subplots(nrows=1, ncols=1, figsize=(10, 5))
+        ax1.text(0.15, 0.5, 'No track record found at this time', fontsize=25)
+        ax1.tick_params(bottom=False, left=False, labelbottom=False, labelleft=False)
+        tmp = os.path.join(out_dir, '.'+fig_name+'.tmp')
+        plt.savefig(tmp, bbox_inches='tight', format='png')
+        plt.close(fig)
+        os.replace(tmp, os.path.join(out_dir, fig_name))
+        print('No track record at '+task.fhhh+': '+fig_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    show = sub.add_parser('show', help='print the inventory and what would be pruned')
+    show.add_argument('--stage', nargs='+', default=['atmos', 'wave', 'ocean'], choices=['atmos', 'wave', 'ocean'])
+    show.add_argument('--suite', default='full', choices=['basic', 'full'])
+    products.add_storm_arguments(show)
+    draw = sub.add_parser('placeholder', help='draw "No track record" figures into the archive dir')
+    draw.add_argument('tasks', nargs='+', help='script:domain:fhhh')
+    draw.add_argument('--archive', help='output directory (default: the archive dir of the storm cycle)')
+    products.add_storm_arguments(draw)
+    args = parser.parse_args()
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+
+    reg = products.load()
+    storm = products.storm_from_args(args)
+    if args.action == 'placeholder':
+        task_list = []
+        for spec in args.tasks:
+            script, domain, fhhh = spec.split(':')
+            task_list.append(products.Task(storm, 'atmos', script, domain, None, fhhh))
+        draw_placeholders(task_list, args.archive or products.archive_dir(storm))
+        return
+
+    inv = scan(reg, storm)
+    print('COMhafs: {0}, {1} files, ocean: {2}'.format(storm.com, len(inv.files), inv.ocean))
+    print('Track hours: '+' '.join(str(h) for h in sorted(inv.track_hours)))
+    for stage in args.stage:
+        for task in products.tasks(reg, storm, stage, suite=args.suite):
+            status = check(reg, task, inv)
+            if status != 'run':
+                print('{0:8s} {1:36s} {2:7s} {3:5s} {4}'.format(status, task.script, str(task.domain), str(task.level), task.fhhh))
+
+
+if __name__ == '__main__':
+    main()
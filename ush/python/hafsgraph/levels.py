@@ -0,0 +1,83 @@
+"""Pressure-level cubes: all the levels of some GRIB2 variables as (nlev, ny, nx) arrays.
+
+The cross-section and azimuthal scripts read their variables level by
+level, one grb.select(shortName=..., level='850 mb') per variable and level,
+each select going through the message inventory of the file again, and copy
+the fields into arrays allocated on the first level.  read(grb, names,
+levels) selects each variable once, picks its messages on the wanted levels
+in that one pass, and decodes them into a float32 array allocated once, in
+the order of levels.  It reads through whatever grib2io.open returns (the
+field cache, the field server or the quick-look previews), with the fields
+of hafsgraph.grib shared rather than copied.  With a window
+(hafsgraph.window), only the box of each level is copied, into arrays of the
+size of the box.
+
+The Cube returned has the arrays by shortName (cube['TMP']), the levels in
+hPa and their GRIB2 names, the units of each variable and the levels missing
+from the file, which are left NaN.
+"""
+
+import numpy as np
+
+from hafsgraph import grib
+
+CROSS_SECTION = np.arange(100, 1001, 25)
+AZIMUTH = [1000, 975, 950, 925, 900, 875, 850, 825, 800, 775, 750, 725, 700, 675, 650, 625, 600, 575, 550, 525, 500, 475,
+           450, 425, 400, 375, 350, 325, 300, 275, 250, 225, 200, 175, 150, 125, 100, 70, 50, 30, 20, 10, 7, 5, 2]
+
+
+def level_name(level):
+    """Return the grib2io name of a pressure level in hPa, e.g. '850 mb'."""
+    if isinstance(level, str):
+        return level
+    return '{0:g} mb'.format(float(level))
+
+
+class Cube(object):
+    """Fields of some variables on a list of pressure levels."""
+
+    def __init__(self, levels):
+        self.names = [level_name(level) for level in levels]
+        self.levels = np.array([float(name.split()[0]) for name in self.names])
+        self.fields = {}
+        self.units = {}
+        self.missing = []
+
+    def __getitem__(self, short_name):
+        return self.fields[short_name]
+
+    def __contains__(self, short_name):
+        return short_name in self.fields
+
+    def index(self, level):
+        """Return the position of a level, in hPa or by name."""
+        return self.names.index(level_name(level))
+
+
+def read(grb, short_names, levels, dtype=np.float32, window=None):
+    """Return the Cube of short_names on levels (hPa or names such as '850 mb') of an open grib2io file."""
+    cube = Cube(levels)
+    position = dict((name, k) for k, name in enumerate(cube.names))
+    for short_name in short_names:
+        data = None
+        found = set()
+        for msg in grb.select(shortName=short_name):
+            k = position.get(str(msg.level))
+            if k is None or k in found:
+                continue
+            # Copied into data below
+            with grib.shared():
+                values = msg.data if window is None else window.cut(msg.data)
+            if data is None:
+                data = np.full((len(cube.names),)+values.shape, np.nan, dtype=dtype)
+                cube.units[short_name] = str(getattr(msg, 'units', ''))
+            data[k] = values
+            found.add(k)
+        if data is None:
+            raise ValueError('No {0} on the levels {1} to {2}'.format(short_name, cube.names[0], cube.names[-1]))
+        missing = [name for k, name in enumerate(cube.names) if k not in found]
+        if missing:
+            print('WARNING: no {0} at {1}, left NaN'.format(short_name, ', '.join(missing)))
+            cube.missing.extend((short_name, name) for name in missing)
+        cube.fields[short_name] = data
+    return cube
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+"""Manifest of the delivered figures of a storm cycle, to resume an interrupted graphics job.
+
+Usage: python3 -m hafsgraph.manifest add --archive DIR --script plot_sst.py --fhhh f036 ... --files *.png
+       python3 -m hafsgraph.manifest show --storm FIONA --stormid 07L --ymdh 2022092000 [--verify]
+       python3 -m hafsgraph.manifest delivery --since $GRAPHstart --storm FIONA --stormid 07L --ymdh 2022092000
+       python3 -m hafsgraph.manifest delivery --since $GRAPHstart --storms FIONA:07L:2022092000 ... --com '/com/hfsa.{ymd}/{hh}'
+
+Each task that has delivered its figures appends one line to
+<archive_dir>.manifest.jsonl: the product, domain, level and fhhh, a hash of
+the identity of its input files, and the name, size and sha256 checksum of
+each figure.  Lines are appended with a single write, so that concurrent
+tasks do not interleave them.  products.py cmdfile --resume leaves out the
+tasks whose last entry has the same input files and whose figures are all
+in the archive with the recorded size, so a rerun after a walltime or node
+failure only runs the missing and failed tasks.  show --verify also checks
+the checksums of the archived figures.  delivery reports, per priority
+tier, how long after --since (the job start) the first and the last figure
+were delivered, e.g. the time to the first critical figure, for each of
+the storm cycles of --storms, as products.py cmdfile takes them.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+from hafsgraph import products
+from hafsgraph import skipcache
+
+
+def manifest_file(archive):
+    """Return the manifest of an archive directory."""
+    return archive.rstrip('/')+'.manifest.jsonl'
+
+
+def task_name(task):
+    """Return the manifest key of a task."""
+    return ':'.join(str(v) for v in (task.script, task.domain, task.level, task.fhhh))
+
+
+def inputs_digest(reg, task, ocean=None, identities=None):
+    """Hash the identity (path, size, mtime) of the input files of a task, from skipcache.input_identities()."""
+    if identities is None:
+        identities = skipcache.input_identities(reg, task, ocean)
+    sha = hashlib.sha256()
+    for identity in identities:
+        sha.update(identity.encode())
+    return sha.hexdigest()
+
+
+def file_sha256(path):
+    """Return the sha256 checksum of a file."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def record(archive, reg, task, files, inputs=None):
+    """Append the entry of a task that has delivered files to the manifest of archive, inputs its inputs_digest()."""
+    entry = {'task': task_name(task), 'inputs': inputs or inputs_digest(reg, task), 'time': round(time.time(), 1),
+             'priority': products.priority(reg, task),
+             'files': [{'name': os.path.basename(path), 'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+                       for path in files]}
+    path = manifest_file(archive)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry, separators=(',', ':'))+'\n').encode())
+    finally:
+        os.close(fd)
+
+
+def load(archive):
+    """Return {task name: last entry} of the manifest of archive, {} when there is none."""
+    entries = {}
+    try:
+        with open(manifest_file(archive), 'rt') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a killed task
+                    continue
+                entries[entry['task']] = entry
+    except OSError:
+        pass
+    return entries
+
+
+def delivered(reg, task, entries, archive, verify=False, ocean=None):
+    """Return True when the figures of a task are in the archive, made from its current input files."""
+    entry = entries.get(task_name(task))
+    if not entry or not entry['files'] or entry['inputs'] != inputs_digest(reg, task, ocean):
+        return False
+    for fig in entry['files']:
+        path = os.path.join(archive, fig['name'])
+        try:
+            if os.path.getsize(path) != fig['size']:
+                return False
+        except OSError:
+            return False
+        if verify and file_sha256(path) != fig['sha256']:
+            return False
+    return True
+
+
+def pending(reg, task_list, archive, report=sys.stderr):
+    """Return the tasks of task_list that have not delivered their figures yet."""
+    entries = load(archive)
+    ocean = products.ocean_kind(task_list[0].storm.com) if task_list else None
+    result = [task for task in task_list if not delivered(reg, task, entries, archive, ocean=ocean)]
+    if report:
+        print('Resume from {0}: {1} of {2} tasks already delivered'.format(
+              manifest_file(archive), len(task_list)-len(result), len(task_list)), file=report)
+    return result
+
+
+def delivery(entries, since, report=sys.stdout):
+    """Print the number of tasks delivered after since, and the first and last delivery time, per priority tier."""
+    tiers = {}
+    for entry in entries.values():
+        if entry['time'] >= since:
+            tiers.setdefault(entry.get('priority', products.DEFAULT_PRIORITY), []).append(entry['time']-since)
+    for tier in sorted(tiers):
+        times = tiers[tier]
+        print('Tier {0}: {1} tasks delivered, first after {2:.0f} s, last after {3:.0f} s'.format(
+              tier, len(times), min(times), max(times)), file=report)
+    if not tiers:
+        print('No tasks delivered since {0}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(since))), file=report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    add = sub.add_parser('add', help='record the delivered figures of a task')
+    add.add_argument('--archive', required=True, help='directory the figures were delivered to')
+    add.add_argument('--script', required=True, help='path of the plotting script')
+    add.add_argument('--domain', help='stormDomain, atmos and wave only')
+    add.add_argument('--level', type=int, help='standardLayer, atmos and wave only')
+    add.add_argument('--fhhh', help='forecast hour, e.g. f036')
+    add.add_argument('--set', nargs='*', default=[], help='ignored, takes the same arguments as hafsgraph.skipcache')
+    add.add_argument('--files', nargs='*', default=[], help='figures of the task')
+    products.add_storm_arguments(add)
+    show = sub.add_parser('show', help='list the tasks of a storm cycle and whether they are delivered')
+    show.add_argument('--stage', nargs='+', default=['atmos', 'wave', 'ocean'], choices=['atmos', 'wave', 'ocean'])
+    show.add_argument('--suite', default='full', choices=['basic', 'full'])
+    show.add_argument('--verify', action='store_true', help='check the checksums of the archived figures')
+    products.add_storm_arguments(show)
+    dlv = sub.add_parser('delivery', help='report the delivery times per priority tier')
+    dlv.add_argument('--since', type=float, default=0, help='start of the job, in seconds since the epoch')
+    dlv.add_argument('--storms', nargs='+', help='several storm cycles, NAME:ID:YMDH[:COM] ... as for products.py cmdfile')
+    products.add_storm_arguments(dlv)
+    args = parser.parse_args()
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+
+    reg = products.load()
+    if args.action == 'delivery':
+        storms = products.storms_from_args(args)
+        for storm in storms:
+            if len(storms) > 1:
+                print('{0}{1} {2}:'.format(storm.name, storm.id, storm.ymdh))
+            delivery(load(products.archive_dir(storm)), args.since)
+        return
+    storm = products.storm_from_args(args)
+    if args.action == 'add':
+        task = skipcache.find_task(reg, storm, os.path.basename(args.script), args.domain, args.level, args.fhhh)
+        files = [path for path in args.files if os.path.isfile(path)]
+        if files:
+            record(args.archive, reg, task, files)
+        return
+
+    archive = products.archive_dir(storm)
+    entries = load(archive)
+    count = 0
+    for stage in args.stage:
+        for task in products.tasks(reg, storm, stage, suite=args.suite):
+            done = delivered(reg, task, entries, archive, args.verify)
+            count += done
+            print('{0:9s} {1}'.format('delivered' if done else 'pending', task_name(task)))
+    print('{0} delivered tasks in {1}'.format(count, manifest_file(archive)))
+
+
+if __name__ == '__main__':
+    main()
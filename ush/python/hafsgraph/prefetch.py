@@ -0,0 +1,261 @@
+"""Decode the next GRIB2 fields in the background while the current figure is drawn.
+
+A Prefetcher runs functions, typically the decoding of a GRIB2 message, on
+a small pool of threads ($PREFETCHthreads, default 1), ahead of the
+plotting code that will ask for their results with get(key, func).  A
+result still queued when it is asked for is cancelled and computed in the
+caller; one running is waited for.  Once the results decoded ahead and not
+yet taken hold $PREFETCHmb megabytes (default 1024), further submissions
+are skipped and computed when asked for.  cancel() drops the queued work,
+close() also waits for the running one.  Prefetching is on with
+prefetchFields=yes; otherwise nothing is submitted and get() computes in
+the caller.
+
+Reading the file, and parts of the decoding and of the drawing, release
+the GIL, so they can overlap; the report of a Prefetcher gives how much did:
+the seconds spent decoding ahead, the seconds the plotting code waited for
+it, and the overlap, the decoding time it did not wait for.
+
+ahead(items, func) yields (item, func(item)) for each item with func(next
+item) submitted first, for the frame loops of the 3hourly swath scripts.
+hafsgraph.worker prefetches the messages the next product read the last
+time it ran (plan() and save_plan(), kept in $HISTgraph/prefetch) with
+read(), which only decodes them into the cache of hafsgraph.grib: the
+results are their sizes, so the memory cap counts the fields in the cache.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from hafsgraph import history
+from hafsgraph import stagein
+
+DEFAULT_THREADS = 1
+DEFAULT_MB = 1024
+PLAN_DIR = 'prefetch'
+MAX_PLAN = 200
+
+
+def enabled():
+    """Return True when the fields are prefetched."""
+    return os.environ.get('prefetchFields', 'no') == 'yes'
+
+
+def nbytes(value):
+    """Return the bytes of a result, an array, a tuple of arrays or a number of bytes."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(v) for v in value)
+    return int(getattr(value, 'nbytes', 0))
+
+
+class Prefetcher(object):
+    """Bounded pool of threads computing results before they are asked for."""
+
+    def __init__(self, threads=None, max_bytes=None):
+        self.threads = threads or int(os.environ.get('PREFETCHthreads') or DEFAULT_THREADS)
+        self.max_bytes = max_bytes or int(float(os.environ.get('PREFETCHmb') or DEFAULT_MB)*1e6)
+        self.pool = ThreadPoolExecutor(self.threads) if enabled() else None
+        self.pending = {}
+        self.ahead_bytes = 0
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.stats = dict(fetched=0, taken=0, skipped=0, cancelled=0, work=0., wait=0., overlap=0.)
+
+    def submit(self, key, func, *args):
+        """Start computing func(*args) for key, unless it is pending or over the memory cap."""
+        if self.pool is None or self.stopped or key in self.pending:
+            return
+        if self.ahead_bytes >= self.max_bytes:
+            self.stats['skipped'] += 1
+            return
+        self.pending[key] = self.pool.submit(self._run, func, args)
+
+    def _run(self, func, args):
+        if self.stopped:
+            return None
+        if self.ahead_bytes >= self.max_bytes:
+            # Filled by the results finished since this one was submitted
+            with self.lock:
+                self.stats['skipped'] += 1
+            return None
+        tstart = time.time()
+        value = func(*args)
+        seconds = time.time()-tstart
+        size = nbytes(value)
+        with self.lock:
+            self.ahead_bytes += size
+            self.stats['fetched'] += 1
+            self.stats['work'] += seconds
+        return value, seconds, size
+
+    def get(self, key, func, *args):
+        """Return the result of func(*args) for key, computed ahead when it was submitted."""
+        future = self.pending.pop(key, None)
+        if future is None or future.cancel():
+            return func(*args)
+        tstart = time.time()
+        try:
+            result = future.result()
+        except Exception:
+            # Raised again, with its traceback, in the plotting code
+            result = None
+        if result is None:
+            return func(*args)
+        wait = time.time()-tstart
+        value, seconds, size = result
+        with self.lock:
+            self.ahead_bytes -= size
+            self.stats['taken'] += 1
+            self.stats['wait'] += wait
+            self.stats['overlap'] += max(0., seconds-wait)
+        return value
+
+    def cancel(self):
+        """Drop the work not started yet, and forget the results not taken."""
+        for future in self.pending.values():
+            self.stats['cancelled'] += future.cancel()
+        self.pending.clear()
+        with self.lock:
+            self.ahead_bytes = 0
+
+    def close(self):
+        """Cancel the queued work and wait for the running one."""
+        if self.stopped:
+            return
+        self.stopped = True
+        self.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+    def report(self, label='', file=sys.stdout):
+        stats = self.stats
+        print('Prefetch{0}: {1} results computed ahead, {2} used, {3} skipped over {4:.0f} MB, {5} cancelled, '
+              '{6:.2f} s computing, {7:.2f} s waited, {8:.2f} s overlapped'.format(
+              ' '+label if label else '', stats['fetched'], stats['taken'], stats['skipped'], self.max_bytes/1e6,
+              stats['cancelled'], stats['work'], stats['wait'], stats['overlap']), file=file, flush=True)
+
+
+def ahead(items, func, depth=1, label=''):
+    """Yield (item, func(item)) for each item, func of the next depth items being computed meanwhile."""
+    items = list(items)
+    fetch = Prefetcher()
+    done = []
+
+    def finish():
+        if not done:
+            done.append(True)
+            fetch.close()
+            if fetch.pool is not None:
+                fetch.report(label)
+
+    lock = threading.Lock()
+
+    def read(item):
+        # A grib2io file is read by one thread at a time
+        with lock:
+            return func(item)
+
+    # The scripts sys.exit() from their frame loops
+    atexit.register(finish)
+    try:
+        for n, item in enumerate(items):
+            value = fetch.get(item, read, item)
+            for following in items[n+1:n+1+depth]:
+                fetch.submit(following, read, following)
+            yield item, value
+    finally:
+        finish()
+
+
+def read(path, select, index):
+    """Decode a message into the caches of grib2io.open (hafsgraph.grib), return its bytes."""
+    import grib2io
+    from hafsgraph import grib
+    # The field stays in the cache for the plotting code, without a copy here
+    with grib.shared():
+        return nbytes(grib2io.open(path, mode='r').select(**select)[index].data)
+
+
+def plan_path(script, domain=None, level=None):
+    """Return the file of the messages a product reads, None without a history directory."""
+    hist_dir = history.history_dir()
+    if not hist_dir:
+        return None
+    return os.path.join(hist_dir, PLAN_DIR, '.'.join(history.key(script, domain, level))+'.json')
+
+
+def name_fields(conf):
+    """Return the forecast hour, cycle and storm of conf as they appear in the file names."""
+    return {'fhhh': str(conf.get('fhhh', '')).lower(), 'ymdh': str(conf.get('ymdh', '')),
+            'stormid': str(conf.get('stormID', '')).lower()}
+
+
+def generic_name(path, conf):
+    """Return the name of a file with the forecast hour, cycle and storm of conf as fields."""
+    name = os.path.basename(path)
+    root = stagein.stage_dir()
+    if root and os.path.dirname(path) == os.path.realpath(root):
+        # <hash>.<name> of a node-local copy
+        name = name.split('.', 1)[-1]
+    for field, value in name_fields(conf).items():
+        if value:
+            name = name.replace(value, '{'+field+'}')
+    return name
+
+
+def input_path(name, conf):
+    """Return the path in COMhafs of a generic file name for conf, None when it is not there."""
+    try:
+        path = os.path.join(conf['COMhafs'], name.format(**name_fields(conf)))
+    except (KeyError, IndexError, ValueError):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def save_plan(script, domain, level, conf, reads):
+    """Keep the messages read by a product, [(path, select, index)], for its next run."""
+    path = plan_path(script, domain, level)
+    if not path or not reads:
+        return
+    plan = []
+    for file_path, select, index in reads[:MAX_PLAN]:
+        name = generic_name(file_path, conf)
+        if input_path(name, conf):
+            plan.append([name, select, index])
+    try:
+        with open(path, 'rt') as f:
+            if json.load(f) == plan:
+                return
+    except (OSError, ValueError):
+        pass
+    tmp = '{0}.tmp.{1}'.format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wt') as f:
+            json.dump(plan, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print('WARNING: cannot save the prefetch plan {0}: {1}'.format(path, e))
+
+
+def plan(script, domain, level, conf):
+    """Return the messages the product read the last time, [(path, select, index)] for conf."""
+    path = plan_path(script, domain, level)
+    try:
+        with open(path, 'rt') as f:
+            entries = json.load(f)
+    except (TypeError, OSError, ValueError):
+        return []
+    reads = []
+    for name, select, index in entries:
+        file_path = input_path(name, conf)
+        if file_path:
+            reads.append((file_path, select, index))
+    return reads
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+
+"""Expand the product registry (parm/graph_products.yml) into graphics tasks and cmdfiles.
+
+Usage: python3 -m hafsgraph.products cmdfile --stage atmos --model HFSA --storm FIONA --stormid 07L --ymdh 2022092000 > cmdfile
+       python3 -m hafsgraph.products cmdfile --stage atcf atmos wave ocean --storms FIONA:07L:2022092000 IAN:09L:2022092600 \
+           --com '/com/hfsa.{ymd}/{hh}' --slots 240 > cmdfile
+
+Paths are taken from the same environment as the job scripts: COMhafs,
+WORKgraph, USHgraph (or the ush directory of this checkout) and PARMgraph
+(or the parm directory of this checkout).
+
+With --storms, the tasks of several storms and cycles go into one cmdfile,
+to share one allocation: the lines of a storm whose COMhafs is not the one
+of the environment set it for their driver, and each storm keeps its own
+work and archive directories.  The ATCF stage then runs from the cmdfile too.
+
+With --quicklook, every figure is first drawn as a quick low-resolution
+preview (hafsgraph.quicklook), then at full quality, which replaces it.
+
+plan takes the same task options and prints, without rendering anything, the
+number of tasks of each stage and the projected wall time, node-hours and
+peak memory per node of the cmdfile on --nodes nodes of --per-node slots,
+and with --deadline the number of nodes needed to meet it, e.g.
+python3 -m hafsgraph.products plan --stage atcf atmos wave ocean --inventory --worker --per-node 60 --deadline 40
+"""
+
+import os
+import sys
+import glob
+import shlex
+import argparse
+from collections import namedtuple, OrderedDict
+
+import yaml
+
+from hafsgraph import tasklog
+from hafsgraph import schedule
+
+HOME_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+
+STAGE_DIRS = {'atcf': 'ATCF', 'atmos': 'atmos', 'wave': 'atmos', 'ocean': 'ocean'}
+DEFAULT_LEVEL = 1003
+DEFAULT_PRIORITY = 2
+
+Storm = namedtuple('Storm', ['model', 'name', 'id', 'ymdh', 'com'])
+Task = namedtuple('Task', ['storm', 'stage', 'script', 'domain', 'level', 'fhhh'])
+
+
+def registry_file():
+    """Return the path of the product registry."""
+    parm_dir = os.environ.get('PARMgraph', os.path.join(HOME_DIR, 'parm'))
+    return os.path.join(parm_dir, 'graph_products.yml')
+
+
+def load(path=None):
+    """Read the product registry and fill in the per-product defaults."""
+    with open(path or registry_file(), 'rt') as f:
+        reg = yaml.safe_load(f)
+    for stage, sconf in reg['stages'].items():
+        for prod in sconf['products']:
+            prod['stage'] = stage
+            prod.setdefault('domains', [None])
+            prod.setdefault('levels', [DEFAULT_LEVEL])
+            prod.setdefault('hours', 'all' if stage != 'atcf' else 'none')
+            prod.setdefault('inputs', [])
+            prod.setdefault('fields', [])
+            prod.setdefault('cost', 'light')
+            prod.setdefault('suite', 'basic')
+            prod.setdefault('dither', True)
+            prod.setdefault('track', None)
+            prod.setdefault('priority', DEFAULT_PRIORITY)
+            prod.setdefault('priorityUntil', None)
+            prod.setdefault('quicklook', stage != 'atcf')
+    return reg
+
+
+def forecast_hours(reg):
+    """Return the default forecast hours as fhhh strings."""
+    start, end, step = reg['forecastHours']
+    return ['f{0:03d}'.format(h) for h in range(start, end+1, step)]
+
+
+def products(reg, stage, suite='basic'):
+    """Return the products of a stage that belong to the given suite."""
+    return [prod for prod in reg['stages'][stage]['products'] if suite == 'full' or prod['suite'] == suite]
+
+
+def product(reg, task):
+    """Return the registry entry of a task."""
+    for prod in reg['stages'][task.stage]['products']:
+        if prod['script'] == task.script:
+            return prod
+    raise KeyError('{0} is not a {1} product'.format(task.script, task.stage))
+
+
+def priority(reg, task):
+    """Return the priority tier of a task, 1 for the operationally critical figures."""
+    prod = product(reg, task)
+    if prod['priorityUntil'] is not None and task.fhhh and int(task.fhhh[1:]) > prod['priorityUntil']:
+        return DEFAULT_PRIORITY
+    return prod['priority']
+
+
+def job_priority(reg, task_list):
+    """Return the priority tier of a cmdfile line, the most urgent of its tasks."""
+    return min([priority(reg, task) for task in task_list] or [DEFAULT_PRIORITY])
+
+
+def tasks(reg, storm, stage, fhhhs=None, suite='basic'):
+    """Expand the products of a stage into tasks, in cmdfile order.
+
+    Products plotted every hour are ordered by fhhh, then domain, then
+    registry order; products plotted at the last hour only come at the end.
+    """
+    fhhhs = fhhhs or forecast_hours(reg)
+    prods = products(reg, stage, suite)
+    domains = []
+    for prod in prods:
+        domains.extend(d for d in prod['domains'] if d not in domains)
+    result = []
+    if stage == 'atcf':
+        return [Task(storm, stage, prod['script'], None, None, None) for prod in prods]
+    for fhhh in fhhhs:
+        for domain in domains:
+            for prod in prods:
+                if prod['hours'] == 'all' and domain in prod['domains']:
+                    result.extend(Task(storm, stage, prod['script'], domain, level, fhhh) for level in prod['levels'])
+    for prod in prods:
+        if prod['hours'] == 'last':
+            for domain in prod['domains']:
+                result.extend(Task(storm, stage, prod['script'], domain, level, fhhhs[-1]) for level in prod['levels'])
+    return result
+
+
+def ocean_kind(com):
+    """Return the ocean model file tag (mom6 or hycom.3z) used in COMhafs."""
+    for path in glob.glob(os.path.join(com, '*f006.nc')):
+        parts = os.path.basename(path).split('.')
+        if 'hycom' in parts:
+            return 'hycom.3z'
+        if 'mom6' in parts:
+            return 'mom6'
+    return 'mom6'
+
+
+def input_files(reg, task, ocean=None):
+    """Return the paths of the files a task reads."""
+    storm = task.storm
+    names = {'stormid': storm.id.lower(), 'ymdh': storm.ymdh, 'model': storm.model.lower(),
+             'domain': task.domain, 'fhhh': task.fhhh}
+    paths = []
+    for key in product(reg, task)['inputs']:
+        template = reg['files'][key]
+        if '{ocean}' in template:
+            names['ocean'] = ocean or ocean_kind(storm.com)
+        paths.append(os.path.join(storm.com, template.format(**names)))
+    return paths
+
+
+def missing_inputs(reg, task, ocean=None):
+    """Return the input files of a task that do not exist."""
+    return [path for path in input_files(reg, task, ocean) if not os.path.exists(path)]
+
+
+def driver(reg, stage):
+    """Return the path of the driver script of a stage."""
+    ush_dir = os.environ.get('USHgraph', os.path.join(HOME_DIR, 'ush'))
+    return os.path.join(ush_dir, reg['stages'][stage]['driver'])
+
+
+def archive_dir(storm):
+    """Return the figure directory of a storm cycle, as the drivers compute it."""
+    basins = {'l': 'NATL', 'e': 'EPAC', 'c': 'CPAC', 'w': 'WPAC', 'a': 'NIO', 'b': 'NIO', 'p': 'SH', 's': 'SH'}
+    com_graph = os.environ.get('COMgraph', os.path.join(storm.com, 'emc_graphics'))
+    name = storm.name+storm.id
+    return os.path.join(com_graph, 'figures', 'RT{0}_{1}'.format(storm.ymdh[0:4], basins[storm.id[-1].lower()]),
+                        name, name+'.'+storm.ymdh)
+
+
+def log_name(task, name=None):
+    """Return the log name of a task (or of a group of tasks sharing name), e.g. FIONA07L.2022092000.storm.plot_sst.f036."""
+    storm = task.storm
+    name = name or os.path.splitext(task.script)[0]
+    prefix = storm.name+storm.id+'.'+storm.ymdh
+    if task.stage == 'atcf':
+        return '.'.join([prefix, name])
+    if task.stage == 'ocean':
+        return '.'.join([prefix, name, task.fhhh])
+    return '.'.join([prefix, task.domain, name, task.fhhh])
+
+
+def log_file(task, name=None):
+    """Return the log file of a task (or of a group of tasks sharing name)."""
+    return os.path.join(os.environ.get('WORKgraph', os.getcwd()), log_name(task, name)+'.log')
+
+
+def storm_env(storm):
+    """Return the env prefix giving a driver the COMhafs of storm, when it is not the one of the environment."""
+    if storm.com and storm.com != os.environ.get('COMhafs'):
+        return ' env COMhafs='+shlex.quote(storm.com)
+    return ''
+
+
+def atcf_args(reg, storm):
+    """Return the arguments of plotATCF.sh for a storm, from the job environment."""
+    python_dir = os.path.dirname(os.path.dirname(driver(reg, 'atcf')))
+    args = [storm.name, storm.id, storm.ymdh, storm.model, storm.com, os.environ.get('ADECKgraph', ''),
+            os.environ.get('BDECKgraph', ''), python_dir, os.environ.get('WORKgraph', os.getcwd()), archive_dir(storm)]
+    args += [os.environ.get(name, '') for name in ('modelLabels', 'modelColors', 'modelMarkers', 'modelMarkerSizes')]
+    return [shlex.quote(arg) for arg in args]
+
+
+def command(reg, task, trackon='yes', record=False, quicklook=False):
+    """Return the cmdfile line that plots one task.
+
+    With record, the driver runs under hafsgraph.history, which adds its wall
+    time to the task history used by hafsgraph.schedule.  With quicklook, the
+    driver draws the preview figures (hafsgraph.quicklook), not recorded.
+    """
+    storm = task.storm
+    args = [storm.model, storm.name, storm.id, storm.ymdh]
+    if task.stage in ('atmos', 'wave'):
+        args += [task.domain, task.script, str(task.level), task.fhhh]
+    elif task.stage == 'ocean':
+        args += [trackon, task.script, task.fhhh]
+    else:
+        args = atcf_args(reg, storm)
+    if record and not quicklook:
+        runner = 'python3 -m hafsgraph.history run --task {0}:{1}:{2} --'.format(task.script, task.domain or '-', task.level or '-')
+    else:
+        runner = 'time'
+    if not product(reg, task)['dither']:
+        runner += ' env PNGdither=no'
+    if quicklook:
+        runner += ' env quickLook=yes'
+    runner += storm_env(storm)
+    if task.stage == 'atcf':
+        runner += ' sh'
+    name = os.path.splitext(task.script)[0]+'_quicklook' if quicklook else None
+    return tasklog.command(log_name(task, name), runner, driver(reg, task.stage)+' '+' '.join(args))
+
+
+def worker_command(reg, group, part=None, quicklook=False):
+    """Return the cmdfile line that plots a group of atmos tasks with driverAtmosWorker.sh.
+
+    part numbers the log files of a group split over several lines.
+    """
+    task = group[0]
+    storm = task.storm
+    name = 'worker' if product(reg, task)['hours'] == 'all' else 'swath_worker'
+    if part is not None:
+        name += '_{0}'.format(part)
+    env = storm_env(storm)
+    if quicklook:
+        name += '_quicklook'
+        env = ' env quickLook=yes'+env
+    args = [storm.model, storm.name, storm.id, storm.ymdh, task.domain, task.fhhh]
+    args += ['{0}:{1}'.format(t.script, t.level) for t in group]
+    ush_dir = os.path.dirname(driver(reg, 'atmos'))
+    return tasklog.command(log_name(task, name), 'time'+env, os.path.join(ush_dir, 'driverAtmosWorker.sh')+' '+' '.join(args))
+
+
+def worker_groups(reg, task_list):
+    """Group atmos tasks that read the same forecast hour and domain, keeping cmdfile order.
+
+    Within a group the tasks are ordered by priority tier.
+    """
+    groups = OrderedDict()
+    for task in task_list:
+        key = (task.storm, task.domain, task.fhhh, product(reg, task)['hours'])
+        groups.setdefault(key, []).append(task)
+    return [sorted(group, key=lambda task: priority(reg, task)) for group in groups.values()]
+
+
+def jobs(reg, task_list, worker=False, trackon='yes', record=False, slots=None, quicklook=False):
+    """Return (cmdfile line, tasks of the line) pairs for a list of tasks.
+
+    driverAtmosWorker.sh lines are not wrapped for recording, hafsgraph.worker
+    records the time of each of its products itself.  With slots, worker
+    groups too long for one slot are split (see schedule.split_groups).  With
+    quicklook, the lines draw the preview figures of the products that have
+    one.
+    """
+    if quicklook:
+        task_list = [task for task in task_list if product(reg, task)['quicklook']]
+    if not worker:
+        return [(command(reg, task, trackon, record, quicklook), [task]) for task in task_list]
+    groups = worker_groups(reg, [t for t in task_list if t.stage == 'atmos'])
+    split = schedule.split_groups(reg, groups, slots) if slots else [[group] for group in groups]
+    result = []
+    for parts in split:
+        for n, part in enumerate(parts):
+            result.append((worker_command(reg, part, n if len(parts) > 1 else None, quicklook), part))
+    result += [(command(reg, task, trackon, record, quicklook), [task]) for task in task_list if task.stage != 'atmos']
+    return result
+
+
+def commands(reg, task_list, worker=False, trackon='yes', record=False):
+    """Return the cmdfile lines for a list of tasks."""
+    return [line for line, group in jobs(reg, task_list, worker, trackon, record)]
+
+
+def add_storm_arguments(parser):
+    """Add the storm/cycle options shared by the hafsgraph command line tools."""
+    parser.add_argument('--model', default=os.environ.get('stormModel', 'HFSA'), help='storm model, e.g. HFSA')
+    parser.add_argument('--storm', default=os.environ.get('STORM'), help='storm name, e.g. FIONA')
+    parser.add_argument('--stormid', default=os.environ.get('STORMID'), help='storm id, e.g. 07L')
+    parser.add_argument('--ymdh', default=os.environ.get('YMDH'), help='cycle, e.g. 2022092000')
+    parser.add_argument('--com', default=os.environ.get('COMhafs'), help='HAFS com directory (default: $COMhafs)')
+
+
+def storm_from_args(args):
+    """Build the Storm of the command line options."""
+    for name in ('storm', 'stormid', 'ymdh', 'com'):
+        if not getattr(args, name):
+            sys.exit('ERROR: --{0} is required'.format(name))
+    return Storm(args.model.upper(), args.storm.upper(), args.stormid.upper(), str(args.ymdh), args.com)
+
+
+def storms_from_args(args):
+    """Build the Storms of --storms NAME:ID:YMDH[:COM] ..., or the single storm of the other options.
+
+    Without :COM, the COMhafs of a storm is --com formatted with {ymdh},
+    {ymd}, {hh} and {stormid} (lower case), e.g. '/com/hfsa.{ymd}/{hh}'.
+    """
+    if not getattr(args, 'storms', None):
+        return [storm_from_args(args)]
+    storms = []
+    for spec in args.storms:
+        parts = spec.split(':', 3)
+        if len(parts) < 3:
+            sys.exit('ERROR: expected NAME:ID:YMDH[:COM], got '+spec)
+        name, stormid, ymdh = parts[0].upper(), parts[1].upper(), parts[2]
+        if len(parts) == 4:
+            com = parts[3]
+        elif args.com:
+            com = args.com.format(ymdh=ymdh, ymd=ymdh[0:8], hh=ymdh[8:10], stormid=stormid.lower())
+        else:
+            sys.exit('ERROR: --com is required for '+spec)
+        storms.append(Storm(args.model.upper(), name, stormid, ymdh, com))
+    return storms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    cmd = sub.add_parser('cmdfile', help='write the cmdfile of a stage to stdout')
+    cmd.add_argument('--stage', required=True, nargs='+', choices=['atcf', 'atmos', 'wave', 'ocean'],
+                     help='stages to include, e.g. atcf atmos wave ocean')
+    cmd.add_argument('--suite', default='basic', choices=['basic', 'full'], help='products to include')
+    cmd.add_argument('--fhhh', nargs='+', help='forecast hours, e.g. f000 f003 (default: registry forecastHours)')
+    cmd.add_argument('--worker', action='store_true', help='one driverAtmosWorker.sh line per fhhh and domain')
+    cmd.add_argument('--trackon', default=os.environ.get('TRACKON', 'yes'), help='ocean figures with track (yes/no)')
+    cmd.add_argument('--inventory', action='store_true',
+                     help='drop tasks that cannot run from a scan of COMhafs and the track (hafsgraph.inventory)')
+    cmd.add_argument('--resume', action='store_true',
+                     help='drop tasks whose figures the manifest shows delivered (hafsgraph.manifest)')
+    cmd.add_argument('--record', action='store_true', help='record the wall time of each task in the task history')
+    cmd.add_argument('--slots', type=int, help='bin-pack the lines longest first into this many lines, e.g. $TOTAL_TASKS')
+    cmd.add_argument('--affinity', action='store_true', help='with --slots, keep the tasks reading the same input file on one line')
+    cmd.add_argument('--per-node', type=int, help='with --slots, number of slots (ranks) on each node, e.g. $NCTSK')
+    cmd.add_argument('--node-gb', type=float,
+                     help='with --slots, keep the projected peak memory of the tasks running on each node within this many GB')
+    cmd.add_argument('--quicklook', action='store_true',
+                     help='draw low-resolution previews of all the figures first, then the full-quality ones (hafsgraph.quicklook)')
+    add_storm_arguments(cmd)
+    cmd.add_argument('--storms', nargs='+', help='several storm cycles in one cmdfile, NAME:ID:YMDH[:COM] ...')
+    pln = sub.add_parser('plan', help='print the task counts and the projected wall time and memory, without rendering')
+    pln.add_argument('--stage', required=True, nargs='+', choices=['atcf', 'atmos', 'wave', 'ocean'],
+                     help='stages to include, e.g. atcf atmos wave ocean')
+    pln.add_argument('--suite', default='basic', choices=['basic', 'full'], help='products to include')
+    pln.add_argument('--fhhh', nargs='+', help='forecast hours, e.g. f000 f003 (default: registry forecastHours)')
+    pln.add_argument('--worker', action='store_true', help='one driverAtmosWorker.sh line per fhhh and domain')
+    pln.add_argument('--trackon', default=os.environ.get('TRACKON', 'yes'), help='ocean figures with track (yes/no)')
+    pln.add_argument('--inventory', action='store_true',
+                     help='drop tasks that cannot run from a scan of COMhafs and the track (hafsgraph.inventory)')
+    pln.add_argument('--resume', action='store_true',
+                     help='drop tasks whose figures the manifest shows delivered (hafsgraph.manifest)')
+    pln.add_argument('--per-node', type=int, default=int(os.environ.get('NCTSK', 60)), help='slots (ranks) on each node')
+    pln.add_argument('--nodes', type=int, nargs='+', default=[1, 2, 4, 8], help='node counts to project')
+    pln.add_argument('--node-gb', type=float, help='pack within this memory budget per node, as cmdfile --node-gb')
+    pln.add_argument('--deadline', type=float, help='wall time to meet, in minutes')
+    add_storm_arguments(pln)
+    pln.add_argument('--storms', nargs='+', help='several storm cycles in one cmdfile, NAME:ID:YMDH[:COM] ...')
+    lst = sub.add_parser('list', help='list the products of a stage')
+    lst.add_argument('--stage', required=True, choices=['atcf', 'atmos', 'wave', 'ocean'])
+    lst.add_argument('--suite', default='basic', choices=['basic', 'full'])
+    args = parser.parse_args()
+
+    reg = load()
+    if args.action == 'list':
+        for prod in products(reg, args.stage, args.suite):
+            print('{0:36s} {1:16s} {2:20s} {3:7s} {4}'.format(prod['script'], ','.join(str(d) for d in prod['domains']),
+                  ','.join(str(l) for l in prod['levels']), prod['cost'], ','.join(prod['inputs'])))
+        return
+    if args.action not in ('cmdfile', 'plan'):
+        parser.print_help()
+        sys.exit(1)
+
+    storms = storms_from_args(args)
+    placeholder_lines = []
+    task_list = []
+    for storm in storms:
+        storm_tasks = []
+        for stage in args.stage:
+            storm_tasks += tasks(reg, storm, stage, args.fhhh, args.suite)
+        placeholders = []
+        if args.inventory:
+            from hafsgraph import inventory
+            storm_tasks, placeholders = inventory.prune(reg, storm_tasks, inventory.scan(reg, storm))
+        if args.resume:
+            from hafsgraph import manifest
+            storm_tasks = manifest.pending(reg, storm_tasks, archive_dir(storm))
+        if placeholders:
+            # One cheap process draws all the "No track record" figures of a storm
+            placeholder_lines.append((inventory.placeholder_command(reg, placeholders), []))
+        if args.action == 'plan':
+            counts = dict((stage, sum(task.stage == stage for task in storm_tasks)) for stage in args.stage)
+            print('{0}{1}.{2}: {3} tasks{4}'.format(storm.name, storm.id, storm.ymdh, ', '.join(
+                  '{0} {1}'.format(stage, counts[stage]) for stage in args.stage),
+                  ', {0} placeholder figures'.format(len(placeholders)) if placeholders else ''))
+        task_list += storm_tasks
+    if args.action == 'plan':
+        jobs_of = lambda slots: jobs(reg, task_list, args.worker, args.trackon, slots=slots)+placeholder_lines
+        schedule.plan(reg, jobs_of, args.nodes, args.per_node, args.node_gb*1e3 if args.node_gb else None,
+                      args.deadline*60 if args.deadline else None)
+        return
+    lines = jobs(reg, task_list, args.worker, args.trackon, args.record, args.slots)+placeholder_lines
+    previews = jobs(reg, task_list, args.worker, args.trackon, slots=args.slots, quicklook=True) if args.quicklook else []
+    tier = lambda task_list: job_priority(reg, task_list)
+    if args.slots:
+        oceans = dict((storm, ocean_kind(storm.com)) for storm in storms)
+        inputs = (lambda task: input_files(reg, task, oceans[task.storm])) if args.affinity else None
+        if len(storms) > 1 or len(args.stage) > 1:
+            schedule.report_separate(reg, lines, args.slots)
+        # Each slot draws its share of the previews before its full-quality
+        # figures, all within the memory budget; the previews are costed as
+        # full tasks
+        lines = schedule.pack(reg, previews+lines, args.slots, inputs=inputs, priority=tier, per_node=args.per_node,
+                              node_mb=args.node_gb*1e3 if args.node_gb else None,
+                              first=set(line for line, group in previews))
+    else:
+        lines = [line for line, group in sorted(previews, key=lambda job: tier(job[1]))] + \
+                [line for line, group in sorted(lines, key=lambda job: tier(job[1]))]
+    for line in lines:
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
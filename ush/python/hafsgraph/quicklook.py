@@ -0,0 +1,141 @@
+"""Quick-look preview figures: decimated fields, coarse coastlines and a low resolution.
+
+A plotting script run with quickLook=yes (name=value argument, environment
+or $GRAPHconfig, see hafsgraph.config) gets install() called by
+config.load(), which, for the rest of the process:
+
+  - returns every 2D GRIB2 field read through grib2io.open(...).select(...)
+    decimated by quickLookStep (default 4) in both directions, including the
+    NLAT/ELON coordinates, and adjusts the lat-lon grid definition template
+    the GOES and SSMIS scripts build their coordinates from,
+  - draws the cartopy Natural Earth features at 110m when the 110m
+    shapefiles are in the cartopy data_dir (the scripts use 50m),
+  - saves the figures at quickLookDPI dots per inch (default 60).
+
+The drivers stage the previews in their own directory and deliver them
+without overwriting figures already in the archive; the full-quality pass
+then replaces them.
+"""
+
+import os
+
+PREVIEW_SCALE = '110m'
+
+_installed = False
+_step = 1
+
+
+def decimate_grid(template, step, number=0):
+    """Return a lat-lon grid definition template (3.0) for fields decimated by step."""
+    if int(getattr(number, 'value', number)) != 0 or len(template) < 18:
+        return template
+    grid = [int(v) for v in template]
+    ni, nj = grid[7], grid[8]
+    ni2, nj2 = (ni-1)//step+1, (nj-1)//step+1
+    if nj > 1:
+        grid[14] = grid[11]+(grid[14]-grid[11])*(nj2-1)*step//(nj-1)
+    if ni > 1:
+        span = (grid[15]-grid[12]) % 360000000
+        grid[15] = (grid[12]+span*(ni2-1)*step//(ni-1)) % 360000000
+    grid[7], grid[8] = ni2, nj2
+    grid[16], grid[17] = grid[16]*step, grid[17]*step
+    return grid
+
+
+class PreviewMessage(object):
+    """Proxy for a grib2io message whose 2D data is decimated."""
+
+    def __init__(self, msg, step):
+        self._msg = msg
+        self._step = step
+
+    @property
+    def data(self):
+        data = self._msg.data
+        if getattr(data, 'ndim', 0) == 2:
+            data = data[::self._step, ::self._step].copy()
+        return data
+
+    @property
+    def gridDefinitionTemplate(self):
+        return decimate_grid(self._msg.gridDefinitionTemplate, self._step,
+                             getattr(self._msg, 'gridDefinitionTemplateNumber', 0))
+
+    def __getattr__(self, name):
+        return getattr(self._msg, name)
+
+
+class PreviewFile(object):
+    """Proxy for an open grib2io file whose selected messages are decimated."""
+
+    def __init__(self, grb, step):
+        self._grb = grb
+        self._step = step
+
+    def select(self, **kwargs):
+        return [PreviewMessage(msg, self._step) for msg in self._grb.select(**kwargs)]
+
+    def __getattr__(self, name):
+        return getattr(self._grb, name)
+
+
+def install_grib(step):
+    """Decimate the fields of the files opened with grib2io.open (which may be hafsgraph.grib.open)."""
+    try:
+        import grib2io
+    except ImportError:
+        return
+    grib2io_open = grib2io.open
+
+    def open_preview(filename, mode='r', **kwargs):
+        grb = grib2io_open(filename, mode=mode, **kwargs)
+        return PreviewFile(grb, step) if mode == 'r' else grb
+
+    grib2io.open = open_preview
+
+
+def install_features():
+    """Draw the Natural Earth features at PREVIEW_SCALE when its shapefiles are available offline."""
+    try:
+        import cartopy
+        import cartopy.feature as cfeature
+    except ImportError:
+        return
+    with_scale = cfeature.NaturalEarthFeature.with_scale
+
+    def with_preview_scale(self, new_scale):
+        path = os.path.join(cartopy.config['data_dir'], 'shapefiles', 'natural_earth', self.category,
+                            'ne_{0}_{1}.shp'.format(PREVIEW_SCALE, self.name))
+        return with_scale(self, PREVIEW_SCALE if os.path.exists(path) else new_scale)
+
+    cfeature.NaturalEarthFeature.with_scale = with_preview_scale
+
+
+def install_dpi(dpi):
+    """Save all the figures at dpi."""
+    from matplotlib.figure import Figure
+    savefig = Figure.savefig
+
+    def savefig_preview(self, *args, **kwargs):
+        kwargs['dpi'] = dpi
+        return savefig(self, *args, **kwargs)
+
+    Figure.savefig = savefig_preview
+
+
+def step():
+    """Return the decimation of the fields of this process, 1 for full-quality figures."""
+    return _step
+
+
+def install(step=4, dpi=60):
+    """Switch this process to preview figures, once."""
+    global _installed, _step
+    if _installed:
+        return
+    _installed = True
+    _step = max(1, int(step))
+    install_grib(_step)
+    install_features()
+    install_dpi(float(dpi))
+    print('Quick-look preview: fields decimated by {0}, {1} dpi'.format(step, dpi))
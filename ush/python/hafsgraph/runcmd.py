@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""Run a cmdfile on the cores of one node with a work-stealing process pool.
+
+Usage: python3 -m hafsgraph.runcmd [--nproc 8] [--timeout 1800] [--retries 1] cmdfile
+       python3 -m hafsgraph.runcmd --stage atmos --storm FIONA --stormid 07L --ymdh 2022092000 --com DIR
+
+This replaces cfp/mpiserial where neither is available, e.g. on a
+workstation: graph_runcmd.sh.inc sets APRUNF to it with machine=local or
+APRUNF=pool.  Unlike the static line-to-rank assignment of mpiserial, each of
+the --nproc slots takes the next line as soon as its previous one is done.
+The commands of a line packed by hafsgraph.schedule (joined by ' ; ') are
+run one after the other; a command running longer than --timeout seconds is
+killed with its process group.  The failed or killed commands of a line, and
+only those, are run again up to --retries times, after the other lines, so
+the tasks of a packed line that succeeded are not redrawn.  A line fails
+when any of its commands does.  Without a cmdfile the lines are generated from the product
+registry, as products.py cmdfile does.  A summary of the failures and the
+timings is printed at the end; the exit status is 1 if any line failed.
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import subprocess
+from collections import deque
+
+from hafsgraph import tasklog
+from hafsgraph import products
+from hafsgraph import schedule
+
+
+def available_cores():
+    """Return the number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def read_cmdfile(path):
+    """Return the command lines of a cmdfile, without blank lines and comments."""
+    with open(path, 'rt') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class Result(object):
+    """Outcome of the runs of one cmdfile line."""
+
+    def __init__(self, index, line):
+        self.index = index
+        self.line = line
+        # Still to run, (position in the line from 1, command)
+        commands = [command.strip() for command in line.split(schedule.SEPARATOR) if command.strip()] or [line]
+        self.commands = list(enumerate(commands, 1))
+        self.status = None
+        self.attempts = 0
+        self.seconds = 0.0
+        self.timed_out = False
+
+
+def run_line(line, timeout=None, env=None):
+    """Run a cmdfile line in its own process group, return (status, timed_out)."""
+    proc = subprocess.Popen(line, shell=True, executable='/bin/bash', start_new_session=True, env=env)
+    try:
+        return proc.wait(timeout=timeout), False
+    except subprocess.TimeoutExpired:
+        for sig, grace in ((signal.SIGTERM, 10), (signal.SIGKILL, None)):
+            try:
+                os.killpg(proc.pid, sig)
+            except OSError:
+                pass
+            try:
+                proc.wait(timeout=grace)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+        return proc.returncode, True
+
+
+class Pool(object):
+    """Run lines on nproc slots, each slot taking the next line when it is free."""
+
+    def __init__(self, nproc, timeout=None, retries=0, report=sys.stdout):
+        self.nproc = max(1, nproc)
+        self.timeout = timeout
+        self.retries = retries
+        self.report = report
+        self.queue = deque()
+        self.lock = threading.Lock()
+
+    def log(self, msg):
+        with self.lock:
+            print('{0} {1}'.format(time.strftime('%H:%M:%S'), msg), file=self.report, flush=True)
+
+    def next_result(self):
+        with self.lock:
+            return self.queue.popleft() if self.queue else None
+
+    def slot(self, number):
+        env = tasklog.slot_env(number)
+        while True:
+            result = self.next_result()
+            if result is None:
+                return
+            result.attempts += 1
+            result.status, result.timed_out = 0, False
+            failed = []
+            for number, command in result.commands:
+                tstart = time.time()
+                status, timed_out = run_line(command, self.timeout, env)
+                seconds = time.time()-tstart
+                result.seconds += seconds
+                if status == 0:
+                    continue
+                failed.append((number, command))
+                result.status = status
+                result.timed_out = result.timed_out or timed_out
+                why = 'timed out after {0:.0f} s'.format(seconds) if timed_out else 'exit status {0}'.format(status)
+                self.log('line {0} command {1} {2}: {3}'.format(result.index, number, why, command[:160]))
+            if not failed:
+                continue
+            result.commands = failed
+            if result.attempts <= self.retries:
+                self.log('line {0}: {1} failed commands, retry {2} of {3}'.format(result.index, len(failed), result.attempts,
+                                                                                self.retries))
+                with self.lock:
+                    self.queue.append(result)
+            else:
+                self.log('line {0}: {1} failed commands, giving up'.format(result.index, len(failed)))
+
+    def run(self, lines):
+        """Run all the lines and return their Results."""
+        results = [Result(n+1, line) for n, line in enumerate(lines)]
+        self.queue.extend(results)
+        threads = [threading.Thread(target=self.slot, args=(n,)) for n in range(min(self.nproc, len(results)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+def summary(results, wall, nproc, report=sys.stdout, top=10):
+    """Print the failures and timings of a run."""
+    failed = [r for r in results if r.status != 0]
+    busy = sum(r.seconds for r in results)
+    print('Ran {0} lines on {1} slots in {2:.0f} s: {3} ok, {4} failed ({5} timed out), {6} retries'.format(
+          len(results), nproc, wall, len(results)-len(failed), len(failed), sum(r.timed_out for r in failed),
+          sum(r.attempts-1 for r in results)), file=report)
+    if wall > 0:
+        print('Busy {0:.0f} s, slot use {1:.0%}'.format(busy, busy/(wall*max(1, min(nproc, len(results))))), file=report)
+    for r in sorted(results, key=lambda r: -r.seconds)[:top]:
+        print('{0:8.1f} s  line {1}: {2}'.format(r.seconds, r.index, r.line[:160]), file=report)
+    for r in failed:
+        for number, command in r.commands:
+            print('FAILED: line {0} command {1}: {2}'.format(r.index, number, command), file=report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('cmdfile', nargs='?', help='command file, one shell command per line')
+    parser.add_argument('-m', action='store_true', help='ignored, for compatibility with mpiserial -m')
+    parser.add_argument('--nproc', '-n', type=int, default=int(os.environ.get('POOL_NPROC', 0)) or available_cores(),
+                        help='number of lines run at the same time (default: $POOL_NPROC or the available cores)')
+    parser.add_argument('--timeout', type=float, help='kill a line after this many seconds')
+    parser.add_argument('--retries', type=int, default=0, help='run the failed commands of a line again up to this many times')
+    parser.add_argument('--stage', nargs='+', choices=['atmos', 'wave', 'ocean'], help='generate the lines from the product registry')
+    parser.add_argument('--suite', default='basic', choices=['basic', 'full'], help='products to include')
+    parser.add_argument('--fhhh', nargs='+', help='forecast hours, e.g. f000 f003 (default: registry forecastHours)')
+    parser.add_argument('--worker', action='store_true', help='one driverAtmosWorker.sh line per fhhh and domain')
+    parser.add_argument('--trackon', default=os.environ.get('TRACKON', 'yes'), help='ocean figures with track (yes/no)')
+    products.add_storm_arguments(parser)
+    args = parser.parse_args()
+
+    if args.cmdfile:
+        lines = read_cmdfile(args.cmdfile)
+    elif args.stage:
+        reg = products.load()
+        storm = products.storm_from_args(args)
+        task_list = []
+        for stage in args.stage:
+            task_list += products.tasks(reg, storm, stage, args.fhhh, args.suite)
+        lines = products.commands(reg, task_list, args.worker, args.trackon)
+    else:
+        parser.error('a cmdfile or --stage is required')
+
+    tstart = time.time()
+    pool = Pool(args.nproc, args.timeout, args.retries)
+    results = pool.run(lines)
+    summary(results, time.time()-tstart, pool.nproc)
+    if any(r.status != 0 for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
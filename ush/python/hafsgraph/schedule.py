@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+"""Order and bin-pack cmdfile lines longest-processing-time-first.
+
+cfp and mpiserial run the cmdfile lines in file order, so a slow task near the
+end of the file sets the length of the whole job.  Here every line gets an
+expected wall time, from the measured history of its tasks (hafsgraph.history)
+or else from the registry cost class of its products.  The lines are sorted
+longest first and each is put in the currently least loaded of the available
+slots (MPI ranks).  Every slot becomes one cmdfile line that runs its tasks
+one after the other, so the packing holds however the launcher deals the
+lines out to the ranks.
+
+With affinity, a line goes to a slot that already runs a line with the same
+primary input file (e.g. the storm atm file or the ocean file of one hour)
+as long as that slot stays within the lower bound of the makespan.  The
+readers of a file then run one after the other on one rank, on one node,
+and find the file in its page cache.  The share of input file reads that
+follow a read of the same file on the same slot is reported as the
+cache-hit ratio.
+
+With priorities (products.py priority tiers), the lines of tier 1 are placed
+first, longest first, then those of tier 2 and so on, so that every slot
+runs its critical lines before the others.  The expected times of the first
+and of the last critical figure are reported.
+
+With a node memory budget, the slots are the ranks of consecutive nodes,
+per_node to a node, and a line only goes to a slot of a node whose projected
+peak memory stays within the budget.  A slot runs its lines one after the
+other, so the projection of a node is the sum over its slots of their
+largest line, from the peak memory measured for each script and domain
+(hafsgraph.history) or else the registry memory of its cost class.  The
+memory-hungry lines thus queue up on the slots that already hold one, and
+the light lines fill the other slots, instead of a fixed number of tasks per
+node bounding the memory.
+
+plan projects, without running anything, the wall time and the peak memory
+per node of the same packing for several node counts, and the smallest node
+count that meets a deadline (products.py plan).
+"""
+
+import sys
+import heapq
+from collections import OrderedDict, defaultdict
+
+from hafsgraph import history
+
+# Between the commands of a packed line; hafsgraph.runcmd splits the lines on it
+SEPARATOR = ' ; '
+
+
+def task_cost(reg, hist, task):
+    """Return the expected wall time (s) of a task."""
+    seconds = history.estimate(hist, task.script, task.domain, task.level)
+    if seconds is None:
+        cost = [prod['cost'] for prod in reg['stages'][task.stage]['products'] if prod['script'] == task.script]
+        seconds = reg['costs'][cost[0] if cost else 'light']
+    return seconds
+
+
+def task_memory(reg, mem, task):
+    """Return the expected peak memory (MB) of a task."""
+    rss = history.peak_memory(mem, task.script, task.domain)
+    if rss is None:
+        cost = [prod['cost'] for prod in reg['stages'][task.stage]['products'] if prod['script'] == task.script]
+        rss = reg['memory'][cost[0] if cost else 'light']
+    return rss
+
+
+def line_memory(reg, jobs, mem=None):
+    """Return {line: expected peak memory (MB)} of (line, tasks) jobs; the tasks of a line run one after the other."""
+    mem = history.load_memory() if mem is None else mem
+    return dict((line, max([task_memory(reg, mem, task) for task in tasks] or [0])) for line, tasks in jobs)
+
+
+class NodeMemory(object):
+    """Projected peak memory of nodes running per_node slots each, slot n on node n // per_node."""
+
+    def __init__(self, per_node, node_mb, line_mb):
+        self.per_node = max(1, per_node)
+        self.node_mb = node_mb
+        self.line_mb = line_mb
+        self.slot_mb = defaultdict(float)
+        self.node_total = defaultdict(float)
+
+    def after(self, n, line):
+        """Return the projected memory of the node of slot n with line added to the slot."""
+        peak = self.slot_mb[n]
+        return self.node_total[n//self.per_node]-peak+max(peak, self.line_mb.get(line, 0))
+
+    def fits(self, n, line):
+        return self.after(n, line) <= self.node_mb
+
+    def add(self, n, line):
+        self.node_total[n//self.per_node] = self.after(n, line)
+        self.slot_mb[n] = max(self.slot_mb[n], self.line_mb.get(line, 0))
+
+    def peaks(self, bins=None):
+        """Return the projected memory of each node, of bins in slot order when given."""
+        if bins is None:
+            return [self.node_total[node] for node in sorted(self.node_total)]
+        totals = defaultdict(float)
+        for n, (load, lines) in enumerate(bins):
+            totals[n//self.per_node] += max([self.line_mb.get(line, 0) for line in lines] or [0])
+        return [totals[node] for node in sorted(totals)]
+
+
+def line_costs(reg, jobs, hist=None):
+    """Return [(seconds, line)] for a list of (line, tasks) jobs."""
+    hist = history.load() if hist is None else hist
+    return [(sum(task_cost(reg, hist, task) for task in tasks), line) for line, tasks in jobs]
+
+
+def split_groups(reg, groups, slots, hist=None):
+    """Split task groups that would run longer than one slot's share of the total.
+
+    A worker group of a storm-domain hour holds the slow cross-section and
+    azimuthal products and can alone take longer than the whole job would
+    take when evenly spread over the slots.  Such groups are cut, in order,
+    into chunks no longer than the share (or than their longest task).
+    Return the chunks of each group, [[chunk, ...], ...].
+    """
+    hist = history.load() if hist is None else hist
+    costs = [[task_cost(reg, hist, task) for task in group] for group in groups]
+    total = sum(sum(c) for c in costs)
+    result = []
+    for group, cost in zip(groups, costs):
+        target = max(total/max(1, slots), max(cost))
+        chunks, chunk, load = [], [], 0.0
+        for task, seconds in zip(group, cost):
+            if chunk and load+seconds > target:
+                chunks.append(chunk)
+                chunk, load = [], 0.0
+            chunk.append(task)
+            load += seconds
+        chunks.append(chunk)
+        result.append(chunks)
+    return result
+
+
+def lpt(costs, slots, tiers=None):
+    """Assign (seconds, line) pairs to at most slots bins, longest first.
+
+    tiers maps lines to their priority tier, lower tiers are placed first.
+    Return the bins as [(load, [line, ...])], most loaded first.
+    """
+    tiers = tiers or {}
+    slots = max(1, min(slots, len(costs)))
+    heap = [(0.0, n, []) for n in range(slots)]
+    # Sort on the tier and cost alone so that equal costs keep their cmdfile order
+    for seconds, line in sorted(costs, key=lambda c: (tiers.get(c[1], 0), -c[0])):
+        load, n, lines = heapq.heappop(heap)
+        lines.append(line)
+        heapq.heappush(heap, (load+seconds, n, lines))
+    return [(load, lines) for load, n, lines in sorted(heap, key=lambda b: (-b[0], b[1]))]
+
+
+def lpt_affinity(costs, slots, keys, tiers=None, nodes=None):
+    """Assign (seconds, line) pairs to slots longest first, keeping lines with the same key together.
+
+    keys maps a line to its primary input file.  A line goes to the least
+    loaded slot already holding its key if that slot stays within the lower
+    bound of the makespan, else to the least loaded slot.  With nodes (a
+    NodeMemory), only the slots whose node stays within its memory budget
+    are candidates, or, when there is none, the slot whose node grows least.
+    Return the bins as lpt does, but in slot order with nodes, since the
+    slots of a node are consecutive ranks.
+    """
+    tiers = tiers or {}
+    slots = max(1, min(slots, len(costs)))
+    bound = max(sum(seconds for seconds, line in costs)/slots, max(seconds for seconds, line in costs))
+    loads = [0.0]*slots
+    bins = [[] for n in range(slots)]
+    holders = {}
+    for seconds, line in sorted(costs, key=lambda c: (tiers.get(c[1], 0), -c[0])):
+        key = keys.get(line)
+        fits = [n for n in range(slots) if nodes.fits(n, line)] if nodes else range(slots)
+        held = [n for n in holders.get(key, []) if loads[n]+seconds <= bound and (not nodes or nodes.fits(n, line))]
+        if held or fits:
+            n = min(held or fits, key=lambda n: (loads[n], n))
+        else:
+            n = min(range(slots), key=lambda n: (nodes.after(n, line), loads[n], n))
+        loads[n] += seconds
+        bins[n].append(line)
+        # Lines without an input file hold no slot, they are placed as by lpt
+        if key is not None:
+            holders.setdefault(key, []).append(n)
+        if nodes:
+            nodes.add(n, line)
+    if nodes:
+        return list(zip(loads, bins))
+    return sorted(zip(loads, bins), key=lambda b: -b[0])
+
+
+def line_inputs(jobs, inputs):
+    """Return {line: input files its tasks read, in order} of (line, tasks) jobs."""
+    return dict((line, [path for task in tasks for path in inputs(task)]) for line, tasks in jobs)
+
+
+def hit_ratio(bins, reads):
+    """Return the share of input file reads that follow a read of the same file on the same slot."""
+    hits = total = 0
+    for load, lines in bins:
+        seen = set()
+        for line in lines:
+            for path in reads.get(line, []):
+                hits += path in seen
+                total += 1
+                seen.add(path)
+    return hits/total if total else 0.0
+
+
+def report_separate(reg, jobs, slots, hist=None, report=sys.stderr):
+    """Report the expected time of jobs run one storm and stage after the other, as separate job steps do.
+
+    Each step of the single-storm job waits for the previous one, and each
+    storm gets its own job of slots ranks, so the sum over steps compares
+    with the makespan of the combined cmdfile in allocation time.
+    """
+    hist = history.load() if hist is None else hist
+    steps = OrderedDict()
+    for line, tasks in jobs:
+        steps.setdefault((tasks[0].storm, tasks[0].stage) if tasks else None, []).append((line, tasks))
+    seconds = sum(lpt(line_costs(reg, step, hist), slots)[0][0] for step in steps.values())
+    print('As {0} separate storm/stage steps on {1} slots: expected {2:.0f} s of allocation'.format(
+          len(steps), slots, seconds), file=report)
+    return seconds
+
+
+def critical_times(reg, bins, jobs, priority, hist, first=()):
+    """Return the expected (first, last) completion time of the tier 1 tasks of bins, None when there are none.
+
+    The tasks of a line run in order, so a critical task is done when the
+    tasks before it on its slot are.  The tasks of the lines in first (the
+    previews) only delay the others.
+    """
+    tasks_of = dict(jobs)
+    done = []
+    for load, lines in bins:
+        clock = 0.0
+        for line in lines:
+            for task in tasks_of[line]:
+                clock += task_cost(reg, hist, task)
+                if line not in first and priority([task]) == 1:
+                    done.append(clock)
+    return (min(done), max(done)) if done else None
+
+
+def pack(reg, jobs, slots, hist=None, report=sys.stderr, inputs=None, priority=None, per_node=None, node_mb=None,
+         first=()):
+    """Return the cmdfile lines of jobs bin-packed into slots lines.
+
+    With inputs (the input files of a task), lines are packed with affinity
+    to the primary input of their first task.  With priority (the tier of
+    the tasks of a line), the lines are placed tier by tier.  With node_mb,
+    the projected peak memory of each node of per_node slots stays within
+    node_mb where it can; an idle slot then gets the line 'true'.  The
+    lines in first (the quick-look previews) are placed before all the
+    others, so each slot runs its share of them first.
+    """
+    hist = history.load() if hist is None else hist
+    costs = line_costs(reg, jobs, hist)
+    if not costs:
+        return []
+    tiers = dict((line, priority(tasks)) for line, tasks in jobs) if priority else {}
+    if first:
+        offset = max(list(tiers.values())+[0])+1
+        tiers.update((line, tiers.get(line, 0)-offset) for line in first)
+    reads = line_inputs(jobs, inputs) if inputs else {}
+    nodes = NodeMemory(per_node or slots, node_mb, line_memory(reg, jobs)) if node_mb else None
+    if inputs or nodes:
+        bins = lpt_affinity(costs, slots, dict((line, paths[0]) for line, paths in reads.items() if paths), tiers, nodes)
+    else:
+        bins = lpt(costs, slots, tiers)
+    if report:
+        total = sum(seconds for seconds, line in costs)
+        print('Scheduled {0} commands on {1} slots: expected makespan {2:.0f} s, serial {3:.0f} s, longest command {4:.0f} s'.format(
+              len(costs), len(bins), max(load for load, lines in bins), total, max(seconds for seconds, line in costs)), file=report)
+        if nodes:
+            peaks = nodes.peaks()
+            print('Projected peak memory per node: {0:.0f} GB at most, budget {1:.0f} GB ({2:.0f} GB without the budget)'.format(
+                  max(peaks)/1e3, node_mb/1e3, max(nodes.peaks(lpt(costs, slots)))/1e3), file=report)
+            if max(peaks) > node_mb:
+                print('WARNING: {0} nodes over the memory budget'.format(sum(peak > node_mb for peak in peaks)), file=report)
+        if inputs:
+            print('Input cache hits on the same slot: {0:.0%} with affinity, {1:.0%} without'.format(
+                  hit_ratio(bins, reads), hit_ratio(lpt(costs, slots), reads)), file=report)
+        critical = critical_times(reg, bins, jobs, priority, hist, first) if priority else None
+        if critical:
+            plain = critical_times(reg, lpt(costs, slots), jobs, priority, hist, first)
+            print('Critical (tier 1) figures: first expected after {0:.0f} s, all after {1:.0f} s ({2:.0f} s without tiers)'.format(
+                  critical[0], critical[1], plain[1]), file=report)
+    return [SEPARATOR.join(lines) or 'true' for load, lines in bins]
+
+
+def project(reg, jobs, nodes, per_node, node_mb=None, hist=None, mem=None):
+    """Return the expected (makespan s, [peak memory MB of each node]) of jobs packed on nodes of per_node slots."""
+    hist = history.load() if hist is None else hist
+    mem = history.load_memory() if mem is None else mem
+    costs = line_costs(reg, jobs, hist)
+    if not costs:
+        return 0.0, []
+    line_mb = line_memory(reg, jobs, mem)
+    slots = nodes*per_node
+    if node_mb:
+        bins = lpt_affinity(costs, slots, {}, nodes=NodeMemory(per_node, node_mb, line_mb))
+    else:
+        bins = lpt(costs, slots)
+    return max(load for load, lines in bins), NodeMemory(per_node, node_mb, line_mb).peaks(bins)
+
+
+def plan(reg, jobs_of, node_counts, per_node, node_mb=None, deadline=None, max_nodes=64, report=sys.stdout):
+    """Print the projected wall time, node-hours and peak memory per node for each node count.
+
+    jobs_of returns the (line, tasks) jobs for a number of slots, since
+    worker groups are split to fit one slot.  With deadline (s), also print
+    the smallest node count, up to max_nodes, whose makespan meets it.
+    """
+    hist = history.load()
+    mem = history.load_memory()
+    jobs = jobs_of(per_node)
+    task_list = [task for line, tasks in jobs for task in tasks]
+    measured = sum(history.estimate(hist, task.script, task.domain, task.level) is not None for task in task_list)
+    costs = line_costs(reg, jobs, hist)
+    longest = max([seconds for seconds, line in costs] or [0])
+    print('Costs: {0} of {1} tasks from the recorded history, the others from the registry cost classes'.format(
+          measured, len(task_list)), file=report)
+    print('Serial time {0:.0f} s, longest command {1:.0f} s, {2} commands'.format(
+          sum(seconds for seconds, line in costs), longest, len(costs)), file=report)
+    print('{0:>6s} {1:>6s} {2:>10s} {3:>10s} {4:>13s}'.format('nodes', 'slots', 'wall time', 'node-hours', 'peak GB/node'),
+          file=report)
+    for nodes in node_counts:
+        makespan, peaks = project(reg, jobs_of(nodes*per_node), nodes, per_node, node_mb, hist, mem)
+        print('{0:6d} {1:6d} {2:8.0f} s {3:10.2f} {4:13.1f}{5}'.format(
+              nodes, nodes*per_node, makespan, nodes*makespan/3600, max(peaks or [0])/1e3,
+              '  over the budget' if node_mb and max(peaks or [0]) > node_mb else ''), file=report)
+    if not deadline:
+        return
+    best = None
+    for nodes in range(1, max_nodes+1):
+        makespan, peaks = project(reg, jobs_of(nodes*per_node), nodes, per_node, node_mb, hist, mem)
+        if makespan <= deadline:
+            print('Deadline {0:.0f} s: {1} nodes, expected wall time {2:.0f} s, {3:.2f} node-hours'.format(
+                  deadline, nodes, makespan, nodes*makespan/3600), file=report)
+            return
+        best = makespan if best is None else min(best, makespan)
+        if makespan <= longest:
+            # More nodes cannot beat the longest command
+            break
+    print('Deadline {0:.0f} s cannot be met: {1:.0f} s at best with up to {2} nodes, the longest command takes {3:.0f} s'.format(
+          deadline, best, nodes, longest), file=report)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""Skip figures whose inputs, script and config have not changed since they were archived.
+
+Usage: python3 -m hafsgraph.skipcache check --archive DIR --script plot_sst.py --fhhh f036 ... --set name=value ...
+       python3 -m hafsgraph.skipcache store --archive DIR --script plot_sst.py --fhhh f036 ... --set name=value ... --files *.png
+
+Each task is keyed by a hash of its input files from the product registry
+(path, size and mtime, or the content for the ATCF track, which is rewritten
+in place), its plotting script and the local modules the script imports, its
+yaml config rendered from the --set values (hafsgraph.config), and the
+TITLEgraph/FOOTERgraph environment.  After a
+task has delivered its figures, store writes the key and the figure names to
+<archive_dir>.skipcache/.  check exits 0 when the stored key matches and all
+the figures are still in the archive, and 1 when the task has to run.
+Setting skipCache=no makes check always fail.
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+
+from hafsgraph import config
+from hafsgraph import products
+
+ENV_NAMES = ('TITLEgraph', 'FOOTERgraph')
+IMPORT_RE = re.compile(r'^\s*(?:from\s+(\w+)\s+import|import\s+(\w+))', re.M)
+
+
+def file_identity(path, content=False):
+    """Return a string identifying the version of a file."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path+' missing'
+    if content:
+        with open(path, 'rb') as f:
+            return path+' '+hashlib.sha256(f.read()).hexdigest()
+    return '{0} {1} {2}'.format(path, st.st_size, st.st_mtime_ns)
+
+
+def script_digest(script_path):
+    """Hash a plotting script and the modules it imports from its own directory."""
+    sha = hashlib.sha256()
+    with open(script_path, 'rb') as f:
+        text = f.read()
+    sha.update(text)
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    for names in IMPORT_RE.findall(text.decode('utf-8', 'replace')):
+        module = os.path.join(script_dir, (names[0] or names[1])+'.py')
+        if os.path.isfile(module):
+            with open(module, 'rb') as f:
+                sha.update(f.read())
+    return sha.hexdigest()
+
+
+def find_task(reg, storm, script, domain=None, level=None, fhhh=None):
+    """Return the registry Task of a script, looking it up in every stage."""
+    for stage, sconf in reg['stages'].items():
+        if any(prod['script'] == script for prod in sconf['products']):
+            return products.Task(storm, stage, script, domain, level, fhhh)
+    raise KeyError('{0} is not in the product registry'.format(script))
+
+
+def input_identities(reg, task, ocean=None):
+    """Return the identities of the input files of a task, for task_key() and the manifest."""
+    return [file_identity(path, content=path.endswith('.atcfunix')) for path in products.input_files(reg, task, ocean)]
+
+
+def task_key(reg, task, script_path, config_text, identities=None):
+    """Return the hash of everything the figures of a task depend on."""
+    if identities is None:
+        identities = input_identities(reg, task)
+    sha = hashlib.sha256()
+    for identity in identities:
+        sha.update(identity.encode())
+    sha.update(script_digest(script_path).encode())
+    sha.update(config_text.encode())
+    for name in ENV_NAMES:
+        sha.update('{0}={1}'.format(name, os.environ.get(name, '')).encode())
+    return sha.hexdigest()
+
+
+def entry_path(archive, task):
+    """Return the file holding the key and figure names of a task."""
+    name = '.'.join(str(v) for v in (task.script, task.domain, task.level, task.fhhh) if v is not None)
+    return os.path.join(archive.rstrip('/')+'.skipcache', name+'.json')
+
+
+def up_to_date(archive, task, key):
+    """Return True when the archived figures of a task were made with the same key."""
+    if os.environ.get('skipCache', 'yes') == 'no':
+        return False
+    try:
+        with open(entry_path(archive, task), 'rt') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return entry.get('key') == key and bool(entry.get('files')) and \
+        all(os.path.exists(os.path.join(archive, name)) for name in entry['files'])
+
+
+def store(archive, task, key, files):
+    """Record the key and the figures of a task that has just been archived."""
+    path = entry_path(archive, task)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path+'.tmp.'+str(os.getpid())
+    with open(tmp, 'wt') as f:
+        json.dump({'key': key, 'files': sorted(os.path.basename(name) for name in files)}, f)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    for action in ('check', 'store'):
+        p = sub.add_parser(action)
+        p.add_argument('--archive', required=True, help='directory the figures are delivered to')
+        p.add_argument('--script', required=True, help='path of the plotting script')
+        p.add_argument('--domain', help='stormDomain, atmos and wave only')
+        p.add_argument('--level', type=int, help='standardLayer, atmos and wave only')
+        p.add_argument('--fhhh', help='forecast hour, e.g. f036')
+        products.add_storm_arguments(p)
+        p.add_argument('--set', nargs='*', default=[], help='config settings of the task, e.g. fhhh=f036')
+        if action == 'store':
+            p.add_argument('--files', nargs='*', default=[], help='figures of the task')
+    args = parser.parse_args()
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+
+    reg = products.load()
+    storm = products.storm_from_args(args)
+    task = find_task(reg, storm, os.path.basename(args.script), args.domain, args.level, args.fhhh)
+    config_name = 'plot_ocean.yml' if task.stage == 'ocean' else 'plot_atmos.yml'
+    key = task_key(reg, task, args.script, config.render(config_name, config.parse_settings(args.set)))
+    if args.action == 'check':
+        if up_to_date(args.archive, task, key):
+            print('Figures of {0} are up to date in {1}'.format(task.script, args.archive))
+            sys.exit(0)
+        sys.exit(1)
+    if args.files:
+        store(args.archive, task, key, args.files)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+"""Stage the HAFS input files once per node, to node-local scratch or /dev/shm.
+
+Usage: python3 -m hafsgraph.stagein show [--dir /dev/shm/hafsgraph]
+       python3 -m hafsgraph.stagein clean [--dir /dev/shm/hafsgraph] [--max-gb 8]
+
+When $STAGEgraph is set, config.load() calls install(), which routes the
+paths given to grib2io.open and xarray.open_dataset through resolve(): the
+first task of a node to read a file hard-links it into $STAGEgraph when both
+are on the same file system, and copies it otherwise; the other tasks of the
+node read that copy.  A staged file is refreshed when its source changes
+(other inode, size or mtime).
+
+Each process holding a staged file has a reference to it, an empty file
+<staged file>.refs/<pid>, removed at exit.  Staged files nobody references
+are kept for the next tasks, least recently used first evicted once the
+staged copies exceed $STAGEgraphGB gigabytes (default: half the size of the
+file system of $STAGEgraph).  clean removes the references of dead processes
+and the unreferenced files over --max-gb, all of them by default; run it
+at the end of the job on each node.  Staging and eviction of a file are
+serialized with a lock file, so concurrent tasks never see a partial copy.
+"""
+
+import os
+import sys
+import time
+import fcntl
+import atexit
+import shutil
+import hashlib
+import argparse
+from contextlib import contextmanager
+
+SUFFIXES = ('.lock', '.refs')
+
+_refs = set()
+_installed = False
+
+
+def stage_dir():
+    """Return the staging directory, None when staging is off."""
+    return os.environ.get('STAGEgraph') or None
+
+
+def budget(path):
+    """Return the bytes of staged copies kept in path before evicting."""
+    if os.environ.get('STAGEgraphGB'):
+        return int(float(os.environ['STAGEgraphGB'])*1e9)
+    st = os.statvfs(path)
+    return st.f_blocks*st.f_frsize//2
+
+
+@contextmanager
+def locked(path, blocking=True):
+    """Hold an exclusive lock on path+'.lock'; yields False when not blocking and it is taken."""
+    fd = os.open(path+'.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+def fresh(local, src_st):
+    """Return True when the staged file local is the current version of the source."""
+    try:
+        st = os.stat(local)
+    except OSError:
+        return False
+    if (st.st_dev, st.st_ino) == (src_st.st_dev, src_st.st_ino):
+        return True
+    return st.st_size == src_st.st_size and st.st_mtime_ns == src_st.st_mtime_ns
+
+
+def stage(src, local):
+    """Hard-link src to local, or copy it with its mtime when they are on different file systems."""
+    tmp = '{0}.tmp.{1}'.format(local, os.getpid())
+    tstart = time.time()
+    try:
+        os.link(src, tmp)
+        how = 'linked'
+    except OSError:
+        shutil.copyfile(src, tmp)
+        shutil.copystat(src, tmp)
+        how = 'copied'
+    os.replace(tmp, local)
+    print('Staged {0} {1}, {2:.1f} MB in {3:.1f} s'.format(how, src, os.path.getsize(local)/1e6, time.time()-tstart))
+
+
+def resolve(path):
+    """Return the node-local copy of an input file, the path itself when staging is off or fails."""
+    root = stage_dir()
+    if not root:
+        return path
+    try:
+        src = os.path.realpath(path)
+        src_st = os.stat(src)
+        os.makedirs(root, exist_ok=True)
+        local = os.path.join(root, hashlib.sha1(src.encode()).hexdigest()[:12]+'.'+os.path.basename(src))
+        with locked(local):
+            if not fresh(local, src_st):
+                stage(src, local)
+            os.makedirs(local+'.refs', exist_ok=True)
+            with open(os.path.join(local+'.refs', str(os.getpid())), 'w'):
+                pass
+            os.utime(local+'.refs')
+    except OSError as e:
+        print('WARNING: reading {0} in place, staging failed: {1}'.format(path, e))
+        return path
+    if not _refs:
+        atexit.register(release)
+    _refs.add(local)
+    return local
+
+
+def pid_alive(pid):
+    """Return True when process pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def references(local):
+    """Return the pids of the live processes referencing a staged file, dropping the dead ones."""
+    pids = []
+    try:
+        names = os.listdir(local+'.refs')
+    except OSError:
+        return pids
+    for name in names:
+        if name.isdigit() and pid_alive(int(name)):
+            pids.append(int(name))
+        else:
+            try:
+                os.remove(os.path.join(local+'.refs', name))
+            except OSError:
+                pass
+    return pids
+
+
+def entries(root):
+    """Return [(last use, bytes used, path)] of the staged files in root."""
+    result = []
+    for entry in os.scandir(root):
+        if entry.name.endswith(SUFFIXES) or '.tmp.' in entry.name or not entry.is_file():
+            continue
+        st = entry.stat()
+        try:
+            used = os.stat(entry.path+'.refs').st_mtime
+        except OSError:
+            used = st.st_atime
+        # A hard link takes no space of its own
+        result.append((used, st.st_size if st.st_nlink == 1 else 0, entry.path))
+    return result
+
+
+def evict(root, max_bytes, report=None):
+    """Remove the least recently used unreferenced staged files until they hold at most max_bytes."""
+    staged = sorted(entries(root))
+    total = sum(size for used, size, path in staged)
+    removed = 0
+    for used, size, path in staged:
+        if total <= max_bytes and max_bytes > 0:
+            break
+        if size == 0 and max_bytes > 0:
+            continue
+        with locked(path, blocking=False) as ok:
+            if not ok or references(path):
+                continue
+            os.remove(path)
+            shutil.rmtree(path+'.refs', ignore_errors=True)
+        total -= size
+        removed += 1
+    if report:
+        print('Removed {0} staged files from {1}, {2:.1f} GB left'.format(removed, root, total/1e9), file=report)
+    return removed
+
+
+def release():
+    """Drop the references of this process, and evict staged files over the budget."""
+    pid = str(os.getpid())
+    for local in _refs:
+        try:
+            os.remove(os.path.join(local+'.refs', pid))
+        except OSError:
+            pass
+    _refs.clear()
+    root = stage_dir()
+    if root and os.path.isdir(root):
+        evict(root, budget(root))
+
+
+def install():
+    """Route the input files of grib2io.open and xarray.open_dataset through resolve(), once."""
+    global _installed
+    if _installed or not stage_dir():
+        return
+    _installed = True
+    try:
+        import grib2io
+        grib2io_open = grib2io.open
+
+        def open_staged(filename, mode='r', **kwargs):
+            return grib2io_open(resolve(filename) if mode == 'r' else filename, mode=mode, **kwargs)
+
+        grib2io.open = open_staged
+    except ImportError:
+        pass
+    try:
+        import xarray
+        open_dataset = xarray.open_dataset
+
+        def open_dataset_staged(filename_or_obj, *args, **kwargs):
+            if isinstance(filename_or_obj, str):
+                filename_or_obj = resolve(filename_or_obj)
+            return open_dataset(filename_or_obj, *args, **kwargs)
+
+        xarray.open_dataset = open_dataset_staged
+    except ImportError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    show = sub.add_parser('show', help='list the staged files and their references')
+    show.add_argument('--dir', default=stage_dir(), help='staging directory (default: $STAGEgraph)')
+    clean = sub.add_parser('clean', help='remove the unreferenced staged files')
+    clean.add_argument('--dir', default=stage_dir(), help='staging directory (default: $STAGEgraph)')
+    clean.add_argument('--max-gb', type=float, default=0, help='keep up to this many GB of staged files, least recently used removed first')
+    args = parser.parse_args()
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+    if not args.dir:
+        sys.exit('ERROR: --dir or $STAGEgraph is required')
+    if not os.path.isdir(args.dir):
+        print('No staging directory '+args.dir)
+        return
+
+    if args.action == 'clean':
+        evict(args.dir, int(args.max_gb*1e9), report=sys.stdout)
+        if args.max_gb == 0:
+            # The lock files are only removed here, at the end of the job, a
+            # lock file removed while a task waits on it would not serialize
+            for name in os.listdir(args.dir):
+                if name.endswith('.lock') and not os.path.exists(os.path.join(args.dir, name[:-len('.lock')])):
+                    os.remove(os.path.join(args.dir, name))
+            try:
+                os.rmdir(args.dir)
+            except OSError:
+                pass
+        return
+    staged = sorted(entries(args.dir), reverse=True)
+    for used, size, path in staged:
+        print('{0} {1:10.1f} MB {2:3d} refs {3}'.format(time.strftime('%H:%M:%S', time.localtime(used)), size/1e6,
+              len(references(path)), os.path.basename(path)))
+    print('{0} staged files, {1:.2f} GB of copies in {2}'.format(len(staged), sum(e[1] for e in staged)/1e9, args.dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+"""Run one atmos or ocean task of the drivers in a single process: skip, plot, deliver and record.
+
+Usage: python3 -m hafsgraph.task --archive DIR --script PATH --fhhh f036 ... --set name=value ... [--preview]
+
+driverAtmos.sh and driverOcean.sh used to start an interpreter for each step
+around the plotting script (skipcache check, agg256, skipcache store,
+manifest add or deliver queue), each hashing the input files again.  This
+module does them all, and runs the script, in one interpreter, with the
+identity of the input files computed once:
+
+  1. exit 0 when the archived figures are up to date (hafsgraph.skipcache),
+     except for quick-look previews (--preview),
+  2. run the plotting script in-process with the --set values on its command
+     line, writing 256-color PNGs with the hafsgraph.agg256 backend,
+  3. write the .combine. figure of each ocean .change. figure, the original
+     and the change side by side,
+  4. with batchDelivery=yes, queue the figures for hafsgraph.deliver,
+     otherwise copy them to the archive, a preview never replacing a figure
+     there (hafsgraph.deliver.copy), and record the full-quality ones in the skipcache and the
+     manifest (hafsgraph.manifest).
+
+The exit status is 1 when the plotting script fails, and nothing is
+delivered then.
+"""
+
+import os
+import re
+import sys
+import time
+import runpy
+import argparse
+import traceback
+
+import matplotlib as mpl
+mpl.use('module://hafsgraph.agg256')
+import matplotlib.pyplot as plt
+from PIL import Image
+
+from hafsgraph import agg256
+from hafsgraph import config
+from hafsgraph import deliver
+from hafsgraph import products
+from hafsgraph import manifest
+from hafsgraph import skipcache
+
+CHANGE_RE = re.compile(r'\.change\.f\d+\.png$')
+
+
+def run_script(script_path, settings):
+    """Run a plotting script in this process with name=value settings as its arguments. Return True on success."""
+    argv, path = sys.argv, list(sys.path)
+    # The ocean scripts import modules next to them
+    sys.argv = [script_path]+list(settings)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script_path)))
+    try:
+        runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        # Several scripts sys.exit() after writing a placeholder figure
+        return e.code in (None, 0)
+    except Exception:
+        traceback.print_exc()
+        return False
+    finally:
+        sys.argv, sys.path[:] = argv, path
+        plt.close('all')
+    return True
+
+
+def combine(files):
+    """Write the .combine. figure of each .change. figure next to its original, return their paths."""
+    combined = []
+    for path in files:
+        orig = path.replace('.change.', '.')
+        if not CHANGE_RE.search(path) or not os.path.isfile(orig):
+            continue
+        with Image.open(orig) as left, Image.open(path) as right:
+            left, right = left.convert('RGB'), right.convert('RGB')
+            dpi = right.info.get('dpi', (None,))[0]
+        # As convert +append: side by side, top aligned on white
+        img = Image.new('RGB', (left.width+right.width, max(left.height, right.height)), 'white')
+        img.paste(left, (0, 0))
+        img.paste(right, (left.width, 0))
+        out = path.replace('.change.', '.combine.')
+        agg256.save_png(img, out, dpi=dpi)
+        combined.append(out)
+    return combined
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--archive', required=True, help='directory the figures are delivered to')
+    parser.add_argument('--script', required=True, help='path of the plotting script')
+    parser.add_argument('--domain', help='stormDomain, atmos and wave only')
+    parser.add_argument('--level', type=int, help='standardLayer, atmos and wave only')
+    parser.add_argument('--fhhh', help='forecast hour, e.g. f036')
+    products.add_storm_arguments(parser)
+    parser.add_argument('--set', nargs='*', default=[], help='config settings of the task, e.g. fhhh=f036')
+    parser.add_argument('--preview', action='store_true', help='quick-look previews, never replacing an archived figure')
+    args = parser.parse_args()
+
+    reg = products.load()
+    storm = products.storm_from_args(args)
+    task = skipcache.find_task(reg, storm, os.path.basename(args.script), args.domain, args.level, args.fhhh)
+    config_name = 'plot_ocean.yml' if task.stage == 'ocean' else 'plot_atmos.yml'
+    identities = skipcache.input_identities(reg, task)
+    key = skipcache.task_key(reg, task, args.script, config.render(config_name, config.parse_settings(args.set)),
+                             identities)
+    if not args.preview and skipcache.up_to_date(args.archive, task, key):
+        print('Figures of {0} are up to date in {1}'.format(task.script, args.archive))
+        return
+
+    tstart = time.time()
+    del agg256.written[:]
+    if not run_script(args.script, args.set):
+        sys.exit(1)
+    files = [path for path in agg256.written if os.path.isfile(path)]
+    files += combine(files)
+    print('Plotted {0} figures of {1} in {2:.1f} s'.format(len(files), task.script, time.time()-tstart))
+    if not files:
+        return
+
+    inputs = manifest.inputs_digest(reg, task, identities=identities)
+    if deliver.enabled():
+        # Recorded by hafsgraph.deliver once delivered
+        deliver.queue(args.archive, task, None if args.preview else key, files, args.preview, inputs)
+        return
+    deliver.copy(files, args.archive, args.preview)
+    if not args.preview:
+        # Record what the figures were made from, for reruns, and that they
+        # are delivered, for resuming the job
+        skipcache.store(args.archive, task, key, files)
+        manifest.record(args.archive, reg, task, files, inputs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+"""Log the output of graphics tasks as structured records, one append-only log per worker.
+
+Usage: python3 -m hafsgraph.tasklog run --task FIONA07L.2022092000.storm.plot_sst.f036 -- driverOcean.sh ...
+       python3 -m hafsgraph.tasklog show [--task plot_sst] [--level warning] [--phase end] [log ...]
+       python3 -m hafsgraph.tasklog summary [--top 20] [log ...]
+
+With taskLog=yes, products.py writes the cmdfile lines as tasklog run
+commands instead of redirecting each task to its own log file.  run starts
+the task with its output on a pipe and turns each output line into a JSON
+record: time, task, phase (start, run or end), level (info, warning or
+error) and message, and at the end the wall time and exit status.  The
+records are buffered and appended with one write per 64 kB, per second or
+on a warning or error, to the log of the worker, $taskLogFile, else
+tasklog.<host>.<pid of the cmdfile line>.jsonl in $WORKgraph, so that the
+tasks of a cmdfile line share one file; the slots of hafsgraph.runcmd and
+hafsgraph.watch each set their own $taskLogFile.
+
+Lines longer than MAX_CHARS are cut, and a task keeps its first HEAD and last
+TAIL lines, plus all warnings and errors; the number of lines dropped is
+recorded at the end.  On SIGTERM (a timeout of hafsgraph.runcmd, the
+walltime), run passes it on to the task and writes the output kept and the
+end record before it exits.  hafsgraph.worker prints a MARKER line before each
+product, so its records carry the product they belong to.  show prints the
+records of the tasks whose id contains --task, in time order; summary
+prints the wall time and status of each task, failures first.
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import signal
+import socket
+import argparse
+import subprocess
+from collections import deque
+
+MARKER = 'hafsgraph.task: '
+MAX_CHARS = 400
+HEAD = 300
+TAIL = 100
+FLUSH_BYTES = 1 << 16
+FLUSH_SECONDS = 1.0
+LEVELS = {'info': 0, 'warning': 1, 'error': 2}
+ERROR_RE = re.compile(r'Traceback|Error|ERROR|FAILED|Killed|Segmentation fault')
+WARNING_RE = re.compile(r'WARNING|Warning|warn\(')
+
+
+def log_path():
+    """Return the log of this worker."""
+    if os.environ.get('taskLogFile'):
+        return os.environ['taskLogFile']
+    work_dir = os.environ.get('WORKgraph', os.getcwd())
+    return os.path.join(work_dir, 'tasklog.{0}.{1}.jsonl'.format(socket.gethostname().split('.')[0], os.getppid()))
+
+
+def slot_env(slot):
+    """Return the environment of the cmdfile lines run by a pool slot, which share the log of the slot."""
+    env = dict(os.environ)
+    if env.get('taskLog') == 'yes' and not env.get('taskLogFile'):
+        work_dir = env.get('WORKgraph', os.getcwd())
+        env['taskLogFile'] = os.path.join(work_dir, 'tasklog.{0}.{1}.slot{2}.jsonl'.format(
+            socket.gethostname().split('.')[0], os.getpid(), slot))
+    return env
+
+
+def command(task, runner, args):
+    """Return the cmdfile command running runner (time or a wrapper) with args, logged as task.
+
+    With taskLog=yes, the output goes to the worker log through run, the
+    time of a plain runner being measured by run; otherwise to task+'.log'
+    in $WORKgraph.
+    """
+    if os.environ.get('taskLog') == 'yes':
+        if runner == 'time' or runner.startswith('time '):
+            runner = runner[len('time'):].strip()
+        return ' '.join(part for part in ['python3 -m hafsgraph.tasklog run --task', task, '--', runner, args] if part)
+    work_dir = os.environ.get('WORKgraph', os.getcwd())
+    return '{0} {1} > {2} 2>&1'.format(runner, args, os.path.join(work_dir, task+'.log'))
+
+
+def level_of(line):
+    """Return the level of an output line."""
+    if ERROR_RE.search(line):
+        return 'error'
+    if WARNING_RE.search(line):
+        return 'warning'
+    return 'info'
+
+
+class Terminated(Exception):
+    """SIGTERM received while running a task."""
+
+
+def terminate(signum, frame):
+    raise Terminated(signum)
+
+
+class Writer(object):
+    """Buffered appends of records to a log file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.buf = []
+        self.size = 0
+        self.flushed = time.time()
+
+    def write(self, task, phase, level, msg, t=None, **extra):
+        if len(msg) > MAX_CHARS:
+            msg = '{0} ...[{1} chars]'.format(msg[:MAX_CHARS], len(msg))
+        rec = {'t': round(t or time.time(), 2), 'task': task, 'phase': phase, 'level': level, 'msg': msg}
+        rec.update(extra)
+        text = json.dumps(rec, separators=(',', ':'))+'\n'
+        self.buf.append(text)
+        self.size += len(text)
+        if self.size >= FLUSH_BYTES or level != 'info' or time.time()-self.flushed >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        self.flushed = time.time()
+        if not self.buf:
+            return
+        # Terminated() raised in between would write the records twice
+        blocked = signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGTERM])
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, ''.join(self.buf).encode())
+            finally:
+                os.close(fd)
+            self.buf = []
+            self.size = 0
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, blocked)
+
+
+def run(task, cmd, path=None):
+    """Run a task command, log its output as records and return its exit status."""
+    log = Writer(path or log_path())
+    log.write(task, 'start', 'info', ' '.join(cmd))
+    current = task
+    kept = 0
+    dropped = 0
+    tail = deque(maxlen=TAIL)
+    tstart = time.time()
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        log.write(task, 'end', 'error', str(e), sec=0.0, status=127)
+        log.flush()
+        return 127
+    previous = signal.signal(signal.SIGTERM, terminate)
+    terminated = False
+    try:
+        for raw in proc.stdout:
+            line = raw.decode('utf-8', 'replace').rstrip()
+            if not line:
+                continue
+            if line.startswith(MARKER):
+                current = line[len(MARKER):].strip() or task
+                continue
+            level = level_of(line)
+            if kept < HEAD or level != 'info':
+                log.write(current, 'run', level, line)
+                kept += 1
+            else:
+                if len(tail) == tail.maxlen:
+                    dropped += 1
+                tail.append((current, line, time.time()))
+        status = proc.wait()
+    except Terminated:
+        # The task may not be in our process group
+        proc.send_signal(signal.SIGTERM)
+        terminated = True
+        status = 128+signal.SIGTERM
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    for name, line, t in tail:
+        log.write(name, 'run', 'info', line, t)
+    seconds = time.time()-tstart
+    msg = 'terminated by SIGTERM' if terminated else 'exit status {0}'.format(status)
+    if dropped:
+        msg += ', {0} output lines dropped'.format(dropped)
+    log.write(task, 'end', 'info' if status == 0 else 'error', msg, sec=round(seconds, 2), status=status)
+    log.flush()
+    return status
+
+
+def read(paths):
+    """Return the records of log files, in time order."""
+    records = []
+    for path in paths:
+        with open(path, 'rt') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    records.sort(key=lambda rec: rec['t'])
+    return records
+
+
+def default_logs():
+    """Return the worker logs in $WORKgraph."""
+    return sorted(glob.glob(os.path.join(os.environ.get('WORKgraph', os.getcwd()), 'tasklog.*.jsonl')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='action')
+    prun = sub.add_parser('run', help='run a task and log its output')
+    prun.add_argument('--task', required=True, help='task id')
+    prun.add_argument('--log', help='worker log (default: $taskLogFile or tasklog.<host>.<ppid>.jsonl in $WORKgraph)')
+    prun.add_argument('cmd', nargs=argparse.REMAINDER, help='command to run, after --')
+    show = sub.add_parser('show', help='print the records of some tasks')
+    show.add_argument('--task', help='only the tasks whose id contains this')
+    show.add_argument('--level', default='info', choices=list(LEVELS), help='lowest level printed')
+    show.add_argument('--phase', choices=['start', 'run', 'end'], help='only the records of this phase')
+    show.add_argument('logs', nargs='*', help='worker logs (default: all in $WORKgraph)')
+    summ = sub.add_parser('summary', help='print the wall time and status of each task')
+    summ.add_argument('--top', type=int, help='only the failed tasks and this many longest others')
+    summ.add_argument('logs', nargs='*', help='worker logs (default: all in $WORKgraph)')
+    args = parser.parse_args()
+
+    if args.action == 'run':
+        cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+        sys.exit(run(args.task, cmd, args.log))
+    if args.action is None:
+        parser.print_help()
+        sys.exit(1)
+
+    records = read(args.logs or default_logs())
+    if args.action == 'show':
+        for rec in records:
+            if args.task and args.task not in rec['task']:
+                continue
+            if LEVELS.get(rec['level'], 0) < LEVELS[args.level] or (args.phase and rec['phase'] != args.phase):
+                continue
+            print('{0} {1} {2:5s} {3:7s} {4}'.format(time.strftime('%H:%M:%S', time.localtime(rec['t'])), rec['task'],
+                  rec['phase'], rec['level'], rec['msg']))
+        return
+    ends = [rec for rec in records if rec['phase'] == 'end']
+    ends.sort(key=lambda rec: (rec.get('status') == 0, -rec.get('sec', 0)))
+    shown = ends if args.top is None else [rec for rec in ends if rec.get('status') != 0]+ \
+        [rec for rec in ends if rec.get('status') == 0][:args.top]
+    for rec in shown:
+        print('{0:8.1f} s  {1:6s} {2}'.format(rec.get('sec', 0), 'ok' if rec.get('status') == 0 else 'FAILED', rec['task']))
+    print('{0} tasks, {1} failed, {2} records'.format(len(ends), sum(rec.get('status') != 0 for rec in ends), len(records)))
+
+
+if __name__ == '__main__':
+    main()
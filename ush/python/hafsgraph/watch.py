@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+"""Plot each forecast hour as soon as its HAFS output lands in COMhafs.
+
+Usage: python3 -m hafsgraph.watch --stage atmos ocean --model HFSA --storm FIONA --stormid 07L --ymdh 2022092000 --nproc 60
+
+COMhafs is polled every --poll seconds.  An input file is complete once its
+size and mtime have not changed for --settle seconds.  A task is started on
+the pool of --nproc processes when all its input files are complete.  Tasks
+that read the growing ATCF track (trak.atcfunix) or that are plotted at the
+last hour only (the swaths) are kept for the end: they run once every hourly
+task has been started and the track file has settled.  When nothing changes
+in COMhafs for --timeout seconds the hours still missing are given up on.
+
+COMhafs is polled rather than watched with inotify, since inotify does not
+see files written by other nodes on the Lustre and GPFS file systems.
+With --quicklook, the quick-look previews (hafsgraph.quicklook) of the tasks
+that are ready are started before their full-quality figures.  With
+--dry-run the cmdfile lines are printed when they would start, so the
+watcher can be tried by copying files into a test directory over time.
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from hafsgraph import tasklog
+from hafsgraph import products
+
+
+class FileWatch(object):
+    """Track the size and mtime of files to tell when they are completely written."""
+
+    def __init__(self, settle):
+        self.settle = settle
+        self.state = {}
+        self.last_change = time.time()
+
+    def complete(self, path, now=None):
+        now = now or time.time()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        sig = (st.st_size, st.st_mtime)
+        old = self.state.get(path)
+        if old is None or old[0] != sig:
+            self.state[path] = (sig, now)
+            self.last_change = now
+            old = self.state[path]
+        if st.st_size == 0:
+            return False
+        # Files untouched for a while (e.g. a rerun) are complete at once
+        return now-old[1] >= self.settle or now-st.st_mtime >= self.settle
+
+
+def is_final(reg, task, trackon='yes'):
+    """Return True for tasks that are kept for the end of the forecast."""
+    prod = products.product(reg, task)
+    if task.stage == 'ocean' and trackon != 'yes':
+        return False
+    return prod['hours'] == 'last' or 'trak' in prod['inputs']
+
+
+def run_line(line, dry_run=False):
+    """Run one cmdfile line and return its exit status."""
+    if dry_run:
+        # One write per line, the pool threads print at the same time
+        print('{0} {1}\n'.format(time.strftime('%H:%M:%S'), line), end='', flush=True)
+        return 0
+    # The lines run by a pool thread share the task log of the thread
+    slot = threading.current_thread().name.rsplit('_', 1)[-1]
+    return subprocess.call(line, shell=True, executable='/bin/bash', env=tasklog.slot_env(slot))
+
+
+class Dispatcher(object):
+    """Start cmdfile lines on a pool of processes and keep their status."""
+
+    def __init__(self, reg, args):
+        self.reg = reg
+        self.args = args
+        self.pool = ThreadPoolExecutor(max_workers=args.nproc)
+        self.futures = []
+        self.tstart = time.time()
+        self.tfirst = None
+
+    def submit(self, task_list):
+        if not task_list:
+            return
+        args = self.args
+        job_list = products.jobs(self.reg, task_list, args.worker, args.trackon, args.record)
+        # Critical figures first (products.py priority tiers)
+        job_list.sort(key=lambda job: products.job_priority(self.reg, job[1]))
+        if args.quicklook:
+            previews = products.jobs(self.reg, task_list, args.worker, args.trackon, quicklook=True)
+            job_list = sorted(previews, key=lambda job: products.job_priority(self.reg, job[1]))+job_list
+        for line, group in job_list:
+            self.futures.append((line, self.pool.submit(run_line, line, args.dry_run)))
+        if self.tfirst is None:
+            self.tfirst = time.time()-self.tstart
+
+    def wait(self):
+        self.pool.shutdown(wait=True)
+        return [line for line, future in self.futures if future.result() != 0]
+
+
+def ready_tasks(reg, task_list, files, ocean, worker=False):
+    """Split task_list into the tasks whose input files are complete and the others.
+
+    With worker, the atmos tasks of a fhhh and domain are only ready together,
+    so that they still go to a single driverAtmosWorker.sh.
+    """
+    now = time.time()
+    ok = [all(files.complete(path, now) for path in products.input_files(reg, task, ocean)) for task in task_list]
+    if worker:
+        blocked = set((t.domain, t.fhhh) for t, o in zip(task_list, ok) if t.stage == 'atmos' and not o)
+        ok = [o and (t.stage != 'atmos' or (t.domain, t.fhhh) not in blocked) for t, o in zip(task_list, ok)]
+    ready = [t for t, o in zip(task_list, ok) if o]
+    waiting = [t for t, o in zip(task_list, ok) if not o]
+    return ready, waiting
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stage', nargs='+', default=['atmos'], choices=['atmos', 'wave', 'ocean'])
+    parser.add_argument('--suite', default='basic', choices=['basic', 'full'], help='products to include')
+    parser.add_argument('--fhhh', nargs='+', help='forecast hours, e.g. f000 f003 (default: registry forecastHours)')
+    parser.add_argument('--worker', action='store_true', help='one driverAtmosWorker.sh line per fhhh and domain')
+    parser.add_argument('--trackon', default=os.environ.get('TRACKON', 'yes'), help='ocean figures with track (yes/no)')
+    parser.add_argument('--record', action='store_true', help='record the wall time of each task in the task history')
+    parser.add_argument('--quicklook', action='store_true',
+                        help='start a low-resolution preview of the ready tasks before their full-quality figures')
+    parser.add_argument('--nproc', type=int, default=os.cpu_count(), help='number of tasks run at the same time')
+    parser.add_argument('--poll', type=float, default=30, help='seconds between two scans of COMhafs')
+    parser.add_argument('--settle', type=float, default=60, help='seconds a file must stay unchanged to be complete')
+    parser.add_argument('--timeout', type=float, default=3600, help='give up waiting after this many seconds without new output')
+    parser.add_argument('--dry-run', action='store_true', help='print the cmdfile lines instead of running them')
+    products.add_storm_arguments(parser)
+    args = parser.parse_args()
+
+    reg = products.load()
+    storm = products.storm_from_args(args)
+    hourly, final = [], []
+    for stage in args.stage:
+        for task in products.tasks(reg, storm, stage, args.fhhh, args.suite):
+            (final if is_final(reg, task, args.trackon) else hourly).append(task)
+    files = FileWatch(args.settle)
+    dispatcher = Dispatcher(reg, args)
+    trak = os.path.join(storm.com, reg['files']['trak'].format(stormid=storm.id.lower(), ymdh=storm.ymdh,
+                        model=storm.model.lower()))
+
+    print('Watching {0} for {1} hourly and {2} final tasks'.format(storm.com, len(hourly), len(final)), flush=True)
+    while hourly:
+        ready, hourly = ready_tasks(reg, hourly, files, products.ocean_kind(storm.com), args.worker)
+        dispatcher.submit(ready)
+        if ready:
+            print('{0} started {1} tasks, {2} hourly tasks waiting'.format(time.strftime('%H:%M:%S'), len(ready), len(hourly)), flush=True)
+        if hourly and time.time()-files.last_change > args.timeout:
+            # Run what can still run, e.g. the atm products of an hour without sat files
+            ocean = products.ocean_kind(storm.com)
+            ready = [task for task in hourly if not products.missing_inputs(reg, task, ocean)]
+            hourly = [task for task in hourly if task not in ready]
+            dispatcher.submit(ready)
+            print('No new output for {0:.0f} s, started {1} tasks, giving up on {2} hourly tasks'.format(
+                  args.timeout, len(ready), len(hourly)), flush=True)
+            break
+        if hourly:
+            time.sleep(args.poll)
+
+    # The track file keeps growing until the forecast ends
+    while not files.complete(trak) and time.time()-files.last_change <= args.timeout:
+        time.sleep(args.poll)
+    ocean = products.ocean_kind(storm.com)
+    missing = [task for task in final if products.missing_inputs(reg, task, ocean)]
+    dispatcher.submit([task for task in final if task not in missing])
+    print('{0} started {1} final tasks, {2} without input files'.format(time.strftime('%H:%M:%S'), len(final)-len(missing), len(missing)), flush=True)
+
+    failed = dispatcher.wait()
+    print('First task started after {0:.0f} s, all done after {1:.0f} s'.format(dispatcher.tfirst or 0, time.time()-dispatcher.tstart))
+    print('Lines run: {0}, failed: {1}, hourly tasks never started: {2}'.format(len(dispatcher.futures), len(failed), len(hourly)))
+    for line in failed:
+        print('FAILED: '+line)
+    if failed or hourly:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Storm-box windows: the index box of a grid around a storm center, and the fields cut to it.
+
+The storm-centered scripts (azimuthal means, the track masks of the 3hourly
+swath frames, the smoothed cross sections) only use the points within some
+distance of the ATCF center, or along a line through it, but computed their
+distances, interpolators and filters on the whole nest.  around(lat, lon,
+center_lat, center_lon, radius_km) returns the Window of the rows and
+columns holding every point within radius_km of the center, and
+index_box(shape, rows, cols) the Window of an index range; both can add a
+margin of points, clipped to the grid, for interpolation or filters.
+
+A Window cuts fields to its box, as views: cut(field) for the trailing two
+dimensions of any array, read(grb, **select) for a message of an open
+grib2io file.  A field from the field cache (hafsgraph.fieldcache) is a
+memory map, so only the pages of the rows of the box are read from it.
+lat and lon are the coordinates of the box, distance() the great-circle
+distances to a point, and apply(func, field) runs a filter on the box and
+writes back the points inside the margin, which get the same values as
+when the whole field is filtered.
+"""
+
+import numpy as np
+
+EARTH_RADIUS = 6371.0088
+# Less than the length of a degree of latitude, so that the boxes hold their radius
+KM_PER_DEGREE = 110.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Return the great-circle distances in km between points, in degrees, as the 3hourly scripts compute them."""
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2-lat1
+    dlon = lon2-lon1
+    a = np.sin(dlat/2)**2+np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
+    c = 2*np.arctan2(a**0.5, (1-a)**0.5)
+    return EARTH_RADIUS*c
+
+
+def clip(start, stop, margin, size):
+    """Return the slice of start:stop widened by margin points, within 0:size, and its inner slice."""
+    lo = max(0, int(start)-margin)
+    hi = min(size, int(stop)+margin)
+    return slice(lo, hi), slice(int(start)-lo, int(stop)-lo)
+
+
+class Window(object):
+    """Box of rows and columns of a 2D grid."""
+
+    def __init__(self, rows, cols, inner=None, lat=None, lon=None):
+        self.rows = rows
+        self.cols = cols
+        self.inner = inner or (slice(None), slice(None))
+        self.lat = None if lat is None else lat[rows, cols]
+        self.lon = None if lon is None else lon[rows, cols]
+
+    @property
+    def slices(self):
+        return self.rows, self.cols
+
+    @property
+    def shape(self):
+        return self.rows.stop-self.rows.start, self.cols.stop-self.cols.start
+
+    def cut(self, field):
+        """Return the box of the last two dimensions of field."""
+        return field[..., self.rows, self.cols]
+
+    def read(self, grb, index=0, **select):
+        """Return the box of a message of an open grib2io file."""
+        return self.cut(grb.select(**select)[index].data)
+
+    def distance(self, center_lat, center_lon):
+        """Return the distances in km of the points of the box to a point."""
+        return haversine(center_lat, center_lon, self.lat, self.lon)
+
+    def apply(self, func, field):
+        """Replace the points of field inside the margin by func of the box, e.g. a filter."""
+        rows = slice(self.rows.start+self.inner[0].start, self.rows.start+self.inner[0].stop)
+        cols = slice(self.cols.start+self.inner[1].start, self.cols.start+self.inner[1].stop)
+        field[..., rows, cols] = func(self.cut(field))[(Ellipsis,)+self.inner]
+        return field
+
+
+def index_box(shape, rows, cols, margin=0):
+    """Return the Window of rows (start, stop) and cols (start, stop) of a grid of shape, with margin points."""
+    row_slice, row_inner = clip(rows[0], rows[1], margin, shape[-2])
+    col_slice, col_inner = clip(cols[0], cols[1], margin, shape[-1])
+    return Window(row_slice, col_slice, (row_inner, col_inner))
+
+
+def box(lat, lon, center_lat, center_lon, half_lat, half_lon, margin=0):
+    """Return the Window of the points of 2D lat/lon within half_lat and half_lon degrees of a center."""
+    dlon = np.mod(lon-center_lon+180., 360.)-180.
+    inside = (np.abs(lat-center_lat) <= half_lat) & (np.abs(dlon) <= half_lon)
+    rows = np.flatnonzero(inside.any(axis=1))
+    cols = np.flatnonzero(inside.any(axis=0))
+    if rows.size == 0:
+        return Window(slice(0, 0), slice(0, 0), lat=lat, lon=lon)
+    row_slice, row_inner = clip(rows[0], rows[-1]+1, margin, lat.shape[0])
+    col_slice, col_inner = clip(cols[0], cols[-1]+1, margin, lat.shape[1])
+    return Window(row_slice, col_slice, (row_inner, col_inner), lat=lat, lon=lon)
+
+
+def around(lat, lon, center_lat, center_lon, radius_km, margin=0):
+    """Return the Window of the points of 2D lat/lon within radius_km of a center, with margin points."""
+    half_lat = radius_km/KM_PER_DEGREE
+    cos_lat = np.cos(np.radians(min(89., abs(center_lat)+half_lat)))
+    return box(lat, lon, center_lat, center_lon, half_lat, min(180., half_lat/cos_lat), margin)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""Render several atmos products for one forecast hour and domain in a single process.
+
+Usage: python3 -m hafsgraph.worker [-s name=value ...] -- script[:level] [script[:level] ...]
+
+Each product is one of the ush/python/atmos/plot_*.py scripts, optionally
+followed by its standardLayer (e.g. plot_temp_hgt_wind.py:850).  The scripts
+are executed in this interpreter one after another, so cartopy, matplotlib
+and grib2io are imported once, and the GRIB2 files are opened and decoded once
+through hafsgraph.grib.  The name=value settings fill in plot_atmos.yml.tmp
+(see hafsgraph.config) and each script gets its config in-process.  The
+figures are written to the current directory with the hafsgraph.agg256
+backend, and listed in $PNGmanifest when set.  With quickLook=yes they are
+quick-look previews (hafsgraph.quicklook), whose timings are not recorded.
+The peak memory of the process is reset before each product and recorded
+with its timing.  With --archive, the figures of each product are copied
+there (hafsgraph.deliver.copy), a preview never over a figure, or with
+batchDelivery=yes queued for hafsgraph.deliver.  With
+prefetchFields=yes, the messages the next product read the last time it ran
+are decoded in a background thread (hafsgraph.prefetch) while the current
+one draws; the seconds of decoding it saved each product are printed with
+the timings.  The decoded fields are kept up to $GRIBcacheMB, and the files
+the next product does not read are closed; the memory recorded for a product
+leaves out the fields kept for the others.
+"""
+
+import os
+import sys
+import time
+import json
+import runpy
+import argparse
+import traceback
+
+import yaml
+import matplotlib as mpl
+mpl.use('module://hafsgraph.agg256')
+import matplotlib.pyplot as plt
+
+from hafsgraph import grib
+from hafsgraph import agg256
+from hafsgraph import config
+from hafsgraph import deliver
+from hafsgraph import history
+from hafsgraph import prefetch
+from hafsgraph import products
+from hafsgraph import skipcache
+from hafsgraph import tasklog
+from hafsgraph import manifest
+
+ATMOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'atmos')
+
+
+def parse_product(product):
+    """Split 'plot_xxx.py:850' into the script name and its standardLayer."""
+    script, _, level = product.partition(':')
+    return script, int(level) if level else None
+
+
+def run_product(script_path, conf):
+    """Execute the script of one product with its config. Return True on success."""
+    config.set_override(conf)
+    try:
+        with mpl.rc_context():
+            runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        # Several scripts sys.exit() after writing a placeholder figure
+        return e.code in (None, 0)
+    except Exception:
+        traceback.print_exc()
+        return False
+    finally:
+        config.set_override(None)
+        plt.close('all')
+    return True
+
+
+def prefetch_next(fetch, product, conf):
+    """Decode in the background the messages product read the last time it ran."""
+    script, level = parse_product(product)
+    for path, select, index in prefetch.plan(script, conf['stormDomain'], level or conf['standardLayer'], conf):
+        fetch.submit((path, json.dumps(select, sort_keys=True), index), prefetch.read, path, select, index)
+
+
+def release_files(product, conf):
+    """Close the files product did not read the last time it ran, when that is known."""
+    script, level = parse_product(product)
+    names = set(prefetch.generic_name(path, conf)
+                for path, select, index in prefetch.plan(script, conf['stormDomain'], level or conf['standardLayer'], conf))
+    if names:
+        grib.release(lambda path: prefetch.generic_name(path, conf) in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('products', nargs='+', help='plot script with optional standardLayer, e.g. plot_rh_hgt_wind.py:700')
+    parser.add_argument('-s', '--set', nargs='*', default=[], help='plot_atmos.yml settings, e.g. fhhh=f036 stormDomain=storm')
+    parser.add_argument('-d', '--scriptdir', default=ATMOS_DIR, help='directory holding the plot_*.py scripts')
+    parser.add_argument('-a', '--archive', help='deliver the figures to this directory, skipping products whose figures '
+                        'there are up to date (hafsgraph.skipcache)')
+    args = parser.parse_args()
+
+    # Before config.load, so that quick-look previews decimate the cached fields
+    grib.install()
+
+    values = config.parse_settings(args.set)
+    conf = config.load('plot_atmos.yml', values)
+    preview = conf.get('quickLook') == 'yes'
+
+    reg = products.load()
+    storm = products.Storm(conf['stormModel'], conf['stormName'], conf['stormID'], str(conf['ymdh']), conf['COMhafs'])
+
+    fetch = prefetch.Prefetcher()
+    timings = []
+    failed = []
+    for n, product in enumerate(args.products):
+        script, level = parse_product(product)
+        script_path = os.path.join(args.scriptdir, script)
+        task = skipcache.find_task(reg, storm, script, conf['stormDomain'], level or conf['standardLayer'], conf['fhhh'])
+        pvalues = dict(values)
+        if level is not None:
+            pvalues['standardLayer'] = level
+        config_text = config.render('plot_atmos.yml', pvalues)
+        print('='*80)
+        # Records of hafsgraph.tasklog from here on belong to this product
+        print(tasklog.MARKER+products.log_name(task, os.path.splitext(script)[0]+('.'+str(level) if level else '')), flush=True)
+        if args.archive and not preview:
+            identities = skipcache.input_identities(reg, task)
+            key = skipcache.task_key(reg, task, script_path, config_text, identities)
+            if skipcache.up_to_date(args.archive, task, key):
+                print('Figures of {0} are up to date in {1}'.format(product, args.archive))
+                timings.append((product, 0.0, 0.0))
+                continue
+        print('Plotting '+product)
+        # Fields of the product before still queued are not needed any more
+        fetch.cancel()
+        if n+1 < len(args.products):
+            prefetch_next(fetch, args.products[n+1], conf)
+        grib.new_product()
+        # Read by the hafsgraph.agg256 backend
+        os.environ['PNGdither'] = 'yes' if products.product(reg, task)['dither'] else 'no'
+        del agg256.written[:]
+        history.reset_peak()
+        tstart = time.time()
+        ok = run_product(script_path, yaml.safe_load(config_text))
+        seconds = time.time()-tstart
+        overlap = grib.stats['saved']-grib.stats['waited']
+        timings.append((product, seconds, overlap))
+        if fetch.pool is not None:
+            print('Prefetched {0} fields, {1:.2f} s of decoding saved, {2:.2f} s waited'.format(
+                  grib.stats['used'], grib.stats['saved'], grib.stats['waited']))
+        if ok:
+            prefetch.save_plan(script, conf['stormDomain'], level or conf['standardLayer'], conf, grib.reads())
+            # Not the temporary figures the script has removed
+            files = [path for path in agg256.written if os.path.isfile(path)]
+            if not preview:
+                # Less the fields kept for the other products
+                history.record(script, conf.get('stormDomain'), level or conf.get('standardLayer'), seconds,
+                               max(0., history.peak_rss()-grib.carried_mb()))
+            if args.archive and preview:
+                if deliver.enabled():
+                    deliver.queue(args.archive, task, None, files, preview)
+                else:
+                    deliver.copy(files, args.archive, preview)
+            elif args.archive and deliver.enabled():
+                # Recorded by hafsgraph.deliver once delivered
+                deliver.queue(args.archive, task, key, files,
+                              inputs=manifest.inputs_digest(reg, task, identities=identities))
+            elif args.archive:
+                deliver.copy(files, args.archive)
+                skipcache.store(args.archive, task, key, files)
+                manifest.record(args.archive, reg, task, files, manifest.inputs_digest(reg, task, identities=identities))
+        else:
+            failed.append(product)
+        if n+1 < len(args.products):
+            release_files(args.products[n+1], conf)
+
+    fetch.close()
+    grib.clear()
+
+    print('='*80)
+    for product, seconds, overlap in timings:
+        print('{0:50s} {1:8.2f} s {2:6.2f} s prefetched {3}'.format(product, seconds, overlap,
+              'FAILED' if product in failed else 'done'))
+    if fetch.pool is not None:
+        # The fields decoded ahead are used through hafsgraph.grib, not taken from fetch
+        print('Decoded {0} fields ahead, {1} skipped over {2:.0f} MB, {3} cancelled, overlapped {4:.2f} s in total'.format(
+              fetch.stats['fetched'], fetch.stats['skipped'], fetch.max_bytes/1e6, fetch.stats['cancelled'],
+              sum(t[2] for t in timings)))
+    if failed:
+        print('Failed products: '+' '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
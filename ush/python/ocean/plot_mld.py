@@ -5,7 +5,6 @@
 import os
 import sys
 import glob
-import yaml
 
 import xarray as xr
 import numpy as np
@@ -18,6 +17,8 @@ import cartopy
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
+from hafsgraph import config
+
 #================================================================
 def latlon_str2num(string):
     """Convert lat/lon string into numbers."""
@@ -52,10 +53,8 @@ def get_adeck_track(adeck_file):
     return fhour,lat_adeck,lon_adeck,init_time,valid_time
 
 #================================================================
-# Parse the yaml config file
-print('Parse the config file: plot_ocean.yml:')
-with open('plot_ocean.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_ocean.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 conf['fhour'] = int(conf['fhhh'][1:])
@@ -5,7 +5,6 @@
 import os
 import sys
 import glob
-import yaml
 
 import xarray as xr
 import numpy as np
@@ -14,6 +13,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 
+from hafsgraph import config
+
 #================================================================
 def latlon_str2num(string):
     """Convert lat/lon string into numbers."""
@@ -59,10 +60,8 @@ def HYCOM_coord_to_geo_coord(lonh,lath):
     return long, latg
 
 #================================================================
-# Parse the yaml config file
-print('Parse the config file: plot_ocean.yml:')
-with open('plot_ocean.yml', 'rt') as f:
-    conf = yaml.safe_load(f)
+# Load the config of the task (hafsgraph.config)
+conf = config.load('plot_ocean.yml')
 conf['stormNumber'] = conf['stormID'][0:2]
 conf['initTime'] = pd.to_datetime(conf['ymdh'], format='%Y%m%d%H', errors='coerce')
 conf['fhour'] = int(conf['fhhh'][1:])